@@ -0,0 +1,87 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure the per-keystroke latency of auto-capitalization while typing at the
+end of, and in the middle of, large statements.
+
+    python -m benchmarks.bench_capitalize [--max-ms 1]
+"""
+
+import sys
+from argparse import ArgumentParser
+from unittest.mock import Mock
+
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
+
+from benchmarks.util import measure, print_table
+from crate.crash.repl import Capitalizer, SQLCompleter
+
+BUFFER_SIZES = [1024, 20 * 1024, 200 * 1024]
+
+LINE = "select id, name from doc.sensors where payload['temperature'] > 42;\n"
+
+
+def create_capitalizer():
+    cmd = Mock()
+    cmd.should_autocapitalize.return_value = True
+    cmd.cursor.fetchall.return_value = [(kw,) for kw in SQLCompleter.fallback_keywords]
+    return Capitalizer(cmd, SQLCompleter(cmd))
+
+
+def keystroke(capitalizer, buffer, chars):
+    state = {'i': 0}
+
+    def fn():
+        buffer.insert_text(chars[state['i'] % len(chars)], fire_event=False)
+        capitalizer.apply_capitalization(buffer)
+        state['i'] += 1
+    return fn
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the p95 latency of any case exceeds this value')
+    args = parser.parse_args()
+
+    rows = []
+    worst = 0.0
+    for size in BUFFER_SIZES:
+        text = (LINE * (size // len(LINE) + 1))[:size]
+        for position in ('end', 'middle'):
+            capitalizer = create_capitalizer()
+            buffer = Buffer()
+            cursor = len(text) if position == 'end' else len(text) // 2
+            buffer.set_document(Document(text, cursor))
+            capitalizer.apply_capitalization(buffer)
+            timing = measure(keystroke(capitalizer, buffer, 'select x from t '), repeat=500)
+            worst = max(worst, timing.p95)
+            rows.append((size, position, '{:.3f}'.format(timing.median),
+                         '{:.3f}'.format(timing.p95)))
+    print_table(('buffer bytes', 'cursor', 'median ms', 'p95 ms'), rows)
+    if args.max_ms is not None and worst > args.max_ms:
+        print('p95 latency {:.3f} ms exceeds {:.3f} ms'.format(worst, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
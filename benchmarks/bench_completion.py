@@ -0,0 +1,88 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure the per-keystroke latency of ``SQLCompleter`` while the number of
+catalog names grows.
+
+    python -m benchmarks.bench_completion [--max-ms 3]
+"""
+
+import sys
+from argparse import ArgumentParser
+from unittest.mock import Mock
+
+from prompt_toolkit.document import Document
+
+from benchmarks.util import measure, print_table
+from crate.crash.catalog import Catalog, CatalogSnapshot
+from crate.crash.repl import SQLCompleter
+
+CATALOG_SIZES = [0, 1000, 10000, 100000]
+
+INPUTS = [
+    'SELECT * FROM sel',
+    'SELECT * FROM doc.tab',
+    'SELECT col_1',
+]
+
+
+def synthetic_snapshot(num_tables, columns_per_table=10):
+    tables = [('doc', 'table_{:06d}'.format(i)) for i in range(num_tables)]
+    columns = [(table, 'col_{}'.format(c))
+               for _, table in tables for c in range(columns_per_table)]
+    return CatalogSnapshot(['doc'], tables, columns, [])
+
+
+def create_completer(num_names, fuzzy):
+    cmd = Mock()
+    cmd.should_autocomplete.return_value = True
+    cmd.should_fuzzy_complete.return_value = fuzzy
+    cmd.cursor.fetchall.return_value = [(kw,) for kw in SQLCompleter.fallback_keywords]
+    catalog = Catalog(cmd)
+    catalog.update(synthetic_snapshot(num_names // 10))
+    return SQLCompleter(cmd, catalog=catalog)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the p95 latency of any input exceeds this value')
+    args = parser.parse_args()
+
+    rows = []
+    worst = 0.0
+    for size in CATALOG_SIZES:
+        for fuzzy in (False, True):
+            completer = create_completer(size, fuzzy)
+            for text in INPUTS:
+                document = Document(text)
+                timing = measure(lambda: list(completer.get_completions(document, None)))
+                worst = max(worst, timing.p95)
+                rows.append((size, fuzzy, text, '{:.3f}'.format(timing.median),
+                             '{:.3f}'.format(timing.p95)))
+    print_table(('catalog names', 'fuzzy', 'input', 'median ms', 'p95 ms'), rows)
+    if args.max_ms is not None and worst > args.max_ms:
+        print('p95 latency {:.3f} ms exceeds {:.3f} ms'.format(worst, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
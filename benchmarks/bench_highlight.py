@@ -0,0 +1,93 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure the per-keystroke latency of syntax highlighting the visible lines
+of large statements, compared to lexing the whole buffer on every change.
+
+    python -m benchmarks.bench_highlight [--max-ms 5]
+"""
+
+import sys
+from argparse import ArgumentParser
+
+from prompt_toolkit.document import Document
+from prompt_toolkit.lexers import PygmentsLexer
+from pygments.lexers.sql import PostgresLexer
+
+from benchmarks.util import measure, print_table
+from crate.crash.lexer import IncrementalPygmentsLexer
+
+BUFFER_SIZES = [1024, 20 * 1024, 200 * 1024]
+
+LINE = "select id, name from doc.sensors where payload['temperature'] > 42;\n"
+
+VISIBLE_LINES = 40
+
+
+def keystroke(lexer, text, cursor, chars):
+    state = {'text': text, 'i': 0}
+
+    def fn():
+        text = state['text']
+        char = chars[state['i'] % len(chars)]
+        pos = cursor + state['i']
+        text = state['text'] = text[:pos] + char + text[pos:]
+        state['i'] += 1
+        document = Document(text, pos + 1)
+        get_line = lexer.lex_document(document)
+        first = max(0, document.cursor_position_row - VISIBLE_LINES // 2)
+        for lineno in range(first, min(first + VISIBLE_LINES, document.line_count)):
+            get_line(lineno)
+    return fn
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the p95 latency of the incremental lexer exceeds this value')
+    args = parser.parse_args()
+
+    lexers = [
+        ('incremental', lambda: IncrementalPygmentsLexer(PostgresLexer)),
+        ('full', lambda: PygmentsLexer(PostgresLexer, sync_from_start=True)),
+    ]
+    rows = []
+    worst = 0.0
+    for size in BUFFER_SIZES:
+        text = (LINE * (size // len(LINE) + 1))[:size]
+        for position in ('end', 'middle'):
+            cursor = len(text) if position == 'end' else len(text) // 2
+            for name, create_lexer in lexers:
+                lexer = create_lexer()
+                timing = measure(keystroke(lexer, text, cursor, 'select x from t '),
+                                 repeat=100)
+                if name == 'incremental':
+                    worst = max(worst, timing.p95)
+                rows.append((size, position, name, '{:.3f}'.format(timing.median),
+                             '{:.3f}'.format(timing.p95)))
+    print_table(('buffer bytes', 'cursor', 'lexer', 'median ms', 'p95 ms'), rows)
+    if args.max_ms is not None and worst > args.max_ms:
+        print('p95 latency {:.3f} ms exceeds {:.3f} ms'.format(worst, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure loading and searching a history with the maximum number of entries.
+
+    python -m benchmarks.bench_history [--max-ms 1]
+"""
+
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from benchmarks.util import measure, print_table
+from crate.crash.history import SQLiteHistory
+from crate.crash.repl import MAX_HISTORY_LENGTH
+
+STATEMENT = """SELECT id, name, payload['temperature']
+FROM doc.sensors_{0}
+WHERE payload['temperature'] > {0}
+ORDER BY name;"""
+
+
+async def first_entries(history, n):
+    entries = []
+    async for item in history.load():
+        entries.append(item)
+        if len(entries) >= n:
+            break
+    return entries
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the p95 latency of a search exceeds this value')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        history = SQLiteHistory(tmp + '/crash_history', max_length=MAX_HISTORY_LENGTH)
+        for i in range(MAX_HISTORY_LENGTH):
+            history.store_string(STATEMENT.format(i))
+        history.close()
+
+        rows = []
+        started = time.perf_counter()
+        history = SQLiteHistory(tmp + '/crash_history', max_length=MAX_HISTORY_LENGTH)
+        asyncio.run(first_entries(history, 1))
+        rows.append(('first entry', '{:.3f}'.format((time.perf_counter() - started) * 1000), '-'))
+        started = time.perf_counter()
+        history.close()
+        history = SQLiteHistory(tmp + '/crash_history', max_length=MAX_HISTORY_LENGTH)
+        asyncio.run(first_entries(history, MAX_HISTORY_LENGTH))
+        rows.append(('all entries', '{:.3f}'.format((time.perf_counter() - started) * 1000), '-'))
+
+        worst = 0.0
+        for text in ('sensors_9999', 'temperature', 'no match'):
+            timing = measure(lambda: history.search(text, limit=1))
+            worst = max(worst, timing.p95)
+            rows.append(('search {!r}'.format(text), '{:.3f}'.format(timing.median),
+                         '{:.3f}'.format(timing.p95)))
+        history.close()
+    finally:
+        shutil.rmtree(tmp)
+    print_table(('operation', 'median ms', 'p95 ms'), rows)
+    if args.max_ms is not None and worst > args.max_ms:
+        print('p95 latency {:.3f} ms exceeds {:.3f} ms'.format(worst, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure the import time of the code paths of a cold start of crash, using
+``python -X importtime`` in a fresh interpreter per run.
+
+    python -m benchmarks.bench_import [--max-ms 60]
+"""
+
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+from benchmarks.util import print_table
+
+RESULT = ("from crate.crash.command import Result; "
+          "result = Result(['id', 'name'], [[1, 'a'], [2, None]], 2, 1, 80); ")
+
+SCENARIOS = [
+    ('crash --version',
+     "import sys; sys.argv = ['crash', '--version']; "
+     "from crate.crash.command import main\n"
+     "try:\n"
+     "    main()\n"
+     "except SystemExit:\n"
+     "    pass"),
+    # the connection is refused, which only leaves the imports to measure
+    ('crash -c (no server)',
+     "import sys; sys.argv = ['crash', '--hosts', '127.0.0.1:1', '-c', 'select 1']; "
+     "from crate.crash.command import main\n"
+     "try:\n"
+     "    main()\n"
+     "except SystemExit:\n"
+     "    pass"),
+    ('--format csv',
+     RESULT + "from crate.crash.outputs import OutputWriter; "
+     "OutputWriter(sys.stdout, False).csv(result)"),
+    ('--format tabular',
+     RESULT + "from crate.crash.outputs import OutputWriter; "
+     "list(OutputWriter(None, False).tabular(result))"),
+    ('--format json (tty)',
+     RESULT + "from crate.crash.outputs import OutputWriter; "
+     "list(OutputWriter(None, True).json(result))"),
+]
+
+# dependencies which are only needed by some code paths
+HEAVY_MODULES = ['crate.client', 'urllib3', 'sqlparse', 'verlib2', 'pygments',
+                 'prompt_toolkit', 'tabulate', 'argcomplete']
+
+
+def import_times(code):
+    """
+    Run ``code`` in a new interpreter and return the total import time in
+    milliseconds and the cumulative import time of every module in
+    microseconds.
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import sys; ' + code],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    times = {}
+    total = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+        # nested imports are indented, and included in the time of the
+        # top-level import
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1000.0, times
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='number of interpreter runs per scenario')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the median import time of `crash --version` '
+                             'exceeds this value')
+    args = parser.parse_args()
+
+    # compile the byte code before measuring
+    import_times(SCENARIOS[0][1])
+    rows = []
+    version_ms = None
+    for name, code in SCENARIOS:
+        runs = [import_times(code) for _ in range(args.repeat)]
+        median = statistics.median(total for total, _ in runs)
+        if version_ms is None:
+            version_ms = median
+        loaded = [m for m in HEAVY_MODULES if m in runs[0][1]]
+        rows.append((name, '{:.1f}'.format(median), ', '.join(loaded) or '-'))
+    print_table(('scenario', 'median ms', 'heavy modules'), rows)
+    if args.max_ms is not None and version_ms > args.max_ms:
+        print('import time {:.1f} ms exceeds {:.1f} ms'.format(version_ms, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure the throughput, time to first byte and peak memory of every output
+format over generated results, and compare them with a stored baseline.
+
+    python -m benchmarks.bench_outputs [--rows 1,1000,1000000] [--save-baseline]
+
+The suite fails if a case is slower or uses more memory than its baseline
+by more than the tolerance. The throughputs are compared relative to the
+speed of a reference workload, which is measured along with every case, so
+a baseline saved on another machine stays usable.
+"""
+
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from benchmarks.util import print_table
+from crate.crash.command import Result
+from crate.crash.outputs import OutputWriter
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'outputs.json')
+
+FORMATS = ['tabular', 'json', 'csv', 'raw', 'mixed', 'dynamic', 'json_row']
+
+ROWS = [1, 100, 5000]
+
+# rows and columns of the cases which vary the value types or the columns
+ROWS_PER_TYPE = 100
+COLUMNS = 10
+COLUMN_COUNTS = [1, 100]
+
+VALUES = {
+    'ints': lambda row, col: row * 1000003 + col,
+    'floats': lambda row, col: row / 7.0 + col,
+    'strings': lambda row, col: 'value-{0}-{1}'.format(row, col),
+    'unicode': lambda row, col: 'Grüße {0} 東京 {1}'.format(row, col),
+    'nested': lambda row, col: {'id': row, 'tags': ['a', col], 'child': {'name': 'x'}},
+    'nulls': lambda row, col: None if (row + col) % 2 else row,
+}
+TYPES = list(VALUES)
+
+
+def mixed_value(row, col):
+    return VALUES[TYPES[col % len(TYPES)]](row, col)
+
+
+def create_result(values, rows, cols):
+    value = mixed_value if values == 'mixed' else VALUES[values]
+    return Result(['col{0}'.format(i) for i in range(cols)],
+                  [[value(row, col) for col in range(cols)] for row in range(rows)],
+                  rows, 1, 80)
+
+
+def cases(row_counts):
+    for fmt in FORMATS:
+        for is_tty in (False, True):
+            for rows in row_counts:
+                yield fmt, is_tty, 'mixed', rows, COLUMNS
+            for values in TYPES:
+                yield fmt, is_tty, values, ROWS_PER_TYPE, COLUMNS
+            for cols in COLUMN_COUNTS:
+                yield fmt, is_tty, 'mixed', ROWS_PER_TYPE, cols
+
+
+def case_id(fmt, is_tty, values, rows, cols):
+    return '{0}/{1}/{2}/{3}x{4}'.format(fmt, 'tty' if is_tty else 'pipe', values, rows, cols)
+
+
+class CountingWriter:
+    """
+    Output which counts the written characters and remembers when the first
+    one was written.
+    """
+
+    def __init__(self):
+        self.chars = 0
+        self.first_write = None
+
+    def write(self, text, end=''):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+        self.chars += len(text) + len(end)
+
+
+def render(result, fmt, is_tty):
+    """
+    Write ``result``, return the time to the first byte and the total time in
+    seconds.
+    """
+    writer = CountingWriter()
+    output_writer = OutputWriter(writer, is_tty)
+    output_writer.output_format = fmt
+    started = time.perf_counter()
+    output_writer.write(result)
+    finished = time.perf_counter()
+    return writer.first_write - started, finished - started
+
+
+def peak_memory(result, fmt, is_tty):
+    tracemalloc.start()
+    try:
+        render(result, fmt, is_tty)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+REFERENCE_ROWS = [[i, 'value {0}'.format(i), i / 7.0, None] for i in range(200)]
+
+
+def reference():
+    """
+    Run a fixed workload similar to rendering and return its time in
+    seconds. Throughputs relative to it are comparable across machines, and
+    across runs on a machine whose speed varies.
+    """
+    started = time.perf_counter()
+    for row in REFERENCE_ROWS:
+        json.dumps(row)
+        '{0!r:>12} | {1:<12} | {2}'.format(*row)
+    return time.perf_counter() - started
+
+
+def measure_case(result, fmt, is_tty, min_time=0.2, max_repeat=20):
+    """
+    Return the throughput and the time to first byte of the fastest of
+    several renders, the median throughput relative to the reference
+    workload, which runs right after every render, and the peak memory of a
+    render.
+    """
+    rows = len(result.rows)
+    # the first render also imports the dependencies of the format
+    render(result, fmt, is_tty)
+    gc.collect()
+    # like timeit, don't let the garbage of earlier cases add to the timings
+    gc.disable()
+    try:
+        samples = [render(result, fmt, is_tty) + (reference(),)]
+        repeat = min(max_repeat, int(min_time / max(samples[0][1], 1e-6)))
+        for _ in range(repeat):
+            samples.append(render(result, fmt, is_tty) + (reference(),))
+    finally:
+        gc.enable()
+    ttfb, total, _ = min(samples, key=lambda sample: sample[1])
+    return {
+        'rows_per_sec': rows / total,
+        'relative_speed': statistics.median(ref / t * rows for _, t, ref in samples),
+        'ttfb_ms': ttfb * 1000.0,
+        'peak_bytes': peak_memory(result, fmt, is_tty),
+    }
+
+
+def compare(measured, baseline, time_tolerance, memory_tolerance):
+    """
+    Return the regressions of ``measured`` compared to ``baseline``.
+    """
+    regressions = []
+    if measured['relative_speed'] * (1 + time_tolerance) < baseline['relative_speed']:
+        regressions.append('{0:.2f}x slower'.format(
+            baseline['relative_speed'] / measured['relative_speed']))
+    # allow for some allocations which don't depend on the result
+    allowed = baseline['peak_bytes'] * (1 + memory_tolerance) + 64 * 1024
+    if measured['peak_bytes'] > allowed:
+        regressions.append('{0:.2f}x memory'.format(
+            measured['peak_bytes'] / max(baseline['peak_bytes'], 1)))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=lambda v: [int(n) for n in v.split(',')], default=ROWS,
+                        help='comma separated row counts of the results, e.g. 1,1000,1000000')
+    parser.add_argument('--format', action='append', choices=FORMATS, dest='formats',
+                        help='only run the cases of this format, can be repeated')
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help='file with the baseline to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=1.0,
+                        help='allowed slowdown of the throughput, 1.0 means twice as slow')
+    parser.add_argument('--memory-tolerance', type=float, default=0.2,
+                        help='allowed increase of the peak memory')
+    args = parser.parse_args()
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['cases']
+
+    results = {}
+    rows = []
+    failed = []
+    for case in cases(args.rows):
+        fmt, is_tty, values, row_count, cols = case
+        if args.formats and fmt not in args.formats:
+            continue
+        name = case_id(*case)
+        result = create_result(values, row_count, cols)
+        measured = results[name] = measure_case(result, fmt, is_tty)
+        status = '-'
+        if name in baseline:
+            regressions = compare(measured, baseline[name],
+                                  args.time_tolerance, args.memory_tolerance)
+            if regressions:
+                failed.append(name)
+            status = ', '.join(regressions) or 'ok'
+        rows.append((fmt, 'tty' if is_tty else 'pipe', values, row_count, cols,
+                     '{:,.0f}'.format(measured['rows_per_sec']),
+                     '{:.3f}'.format(measured['ttfb_ms']),
+                     '{:,.0f}'.format(measured['peak_bytes'] / 1024.0),
+                     status))
+    print_table(('format', 'output', 'values', 'rows', 'cols', 'rows/sec', 'ttfb ms',
+                 'peak KiB', 'baseline'), rows)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'cases': results}, f,
+                      indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved the baseline to ' + args.baseline)
+    if failed:
+        print('{0} cases regressed: {1}'.format(len(failed), ', '.join(failed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+Measure the latency of running a statement, from sending it to rendering its
+result, against a local fake CrateDB, for growing result sets.
+
+    python -m benchmarks.bench_statement [--max-ms 500]
+"""
+
+import sys
+from argparse import ArgumentParser
+
+from benchmarks.util import measure, print_table
+from crate.crash.command import CrateShell
+from crate.crash.outputs import OutputWriter
+from crate.crash.printer import ColorPrinter
+from tests.fake_server import FakeCrateDB
+
+ROWS = [1, 1000, 10000]
+WIDTH = 10
+FORMATS = ['tabular', 'json', 'csv']
+
+
+class NullWriter:
+
+    def write(self, text, end=''):
+        pass
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the p95 latency of any case exceeds this value')
+    args = parser.parse_args()
+
+    rows = []
+    worst = 0.0
+    with FakeCrateDB(width=WIDTH, nesting=1) as server:
+        cmd = CrateShell([server.url], is_tty=False, batch=True,
+                         output_writer=OutputWriter(NullWriter(), False))
+        cmd.logger = ColorPrinter(False, stream=NullWriter())
+        for count in ROWS:
+            server.rows = count
+            for fmt in FORMATS:
+                cmd.output_writer.output_format = fmt
+                repeat = max(5, 200 // count)
+                timing = measure(lambda: cmd.process('select * from t'),
+                                 repeat=repeat, warmup=2)
+                worst = max(worst, timing.p95)
+                rows.append((count, WIDTH, fmt, '{:.3f}'.format(timing.median),
+                             '{:.3f}'.format(timing.p95)))
+        cmd.close()
+    print_table(('rows', 'columns', 'format', 'median ms', 'p95 ms'), rows)
+    if args.max_ms is not None and worst > args.max_ms:
+        print('p95 latency {:.3f} ms exceeds {:.3f} ms'.format(worst, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import statistics
+import time
+from collections import namedtuple
+
+Timing = namedtuple('Timing', ['median', 'p95', 'max'])
+
+
+def measure(fn, repeat=200, warmup=10):
+    """
+    Call ``fn`` ``repeat`` times and return its latency in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    samples.sort()
+    return Timing(statistics.median(samples),
+                  samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                  samples[-1])
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(v)) for v in col) for col in zip(headers, *rows)]
+    tmpl = '  '.join('{:>%d}' % w for w in widths)
+    print(tmpl.format(*headers))
+    for row in rows:
+        print(tmpl.format(*row))
@@ -2,6 +2,6 @@
 
 set -e -x
 
-isort --check --diff src/crate/ tests/ setup.py
+isort --check --diff src/crate/ tests/ benchmarks/ setup.py
 flake8 src/crate/crash
 coverage run -m unittest -v
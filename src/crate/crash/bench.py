@@ -0,0 +1,191 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import math
+import threading
+import time
+from collections import Counter
+
+PERCENTILES = (50, 95, 99)
+
+OPTIONS = {
+    '-n': 'iterations',
+    '-c': 'concurrency',
+    '--warmup': 'warmup',
+}
+
+
+def parse_bench_args(args):
+    """
+    Split the arguments of ``\\bench`` into its options and the statement,
+    e.g. ``-n 100 -c 4 select 1``. Raise ``ValueError`` if they are invalid.
+    """
+    options = {'iterations': 100, 'concurrency': 1, 'warmup': 0}
+    rest = args.strip()
+    while True:
+        parts = rest.split(None, 2)
+        if not parts or parts[0] not in OPTIONS:
+            break
+        name = OPTIONS[parts[0]]
+        if len(parts) < 2:
+            raise ValueError('Missing the value of {0}'.format(parts[0]))
+        try:
+            value = int(parts[1])
+        except ValueError:
+            raise ValueError('Invalid value of {0}: {1}'.format(parts[0], parts[1]))
+        if value < 0 or (value == 0 and name != 'warmup'):
+            raise ValueError('Invalid value of {0}: {1}'.format(parts[0], parts[1]))
+        options[name] = value
+        rest = parts[2] if len(parts) > 2 else ''
+    return options, rest.strip()
+
+
+def percentile(values, p):
+    """
+    Return the ``p``-th percentile of the sorted ``values`` with the
+    nearest-rank method.
+    """
+    if not values:
+        return None
+    return values[max(int(math.ceil(p / 100.0 * len(values))) - 1, 0)]
+
+
+class BenchmarkResult:
+    """
+    Client wall times and server durations in milliseconds of the
+    successful runs of a statement, and the errors of the failed ones.
+    """
+
+    def __init__(self):
+        self.wall = []
+        self.server = []
+        self.errors = Counter()
+        self.error_messages = {}
+        self.elapsed = 0.0
+        self.interrupted = False
+
+    @property
+    def runs(self):
+        return len(self.wall) + sum(self.errors.values())
+
+    @property
+    def throughput(self):
+        return len(self.wall) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add(self, wall, server):
+        self.wall.append(wall)
+        self.server.append(server)
+
+    def add_error(self, error):
+        name = type(error).__name__
+        self.errors[name] += 1
+        self.error_messages.setdefault(name, getattr(error, 'message', None) or str(error))
+
+    def rows(self):
+        """
+        Return the statistics of the wall times, the server durations and
+        their difference, the time spent outside the server, as table rows.
+        """
+        columns = [sorted(self.wall), sorted(self.server),
+                   sorted(w - s for w, s in zip(self.wall, self.server))]
+        stats = [('min', lambda v: v[0] if v else None)]
+        stats += [('p{0}'.format(p), lambda v, p=p: percentile(v, p)) for p in PERCENTILES]
+        stats += [('max', lambda v: v[-1] if v else None),
+                  ('mean', lambda v: sum(v) / len(v) if v else None)]
+        return [[name] + [None if stat(v) is None else round(stat(v), 3) for v in columns]
+                for name, stat in stats]
+
+
+def run_benchmark(create_connection, stmt, iterations, concurrency=1, warmup=0):
+    """
+    Run ``stmt`` ``iterations`` times from ``concurrency`` threads, each with
+    its own connection from ``create_connection()``, after ``warmup`` runs
+    which are not measured. Stop early on ``KeyboardInterrupt``.
+    """
+    result = BenchmarkResult()
+    lock = threading.Lock()
+    stopped = threading.Event()
+    # all workers are done with the warmup when it is passed
+    started = threading.Barrier(concurrency + 1)
+    remaining = {'warmup': warmup, 'measured': iterations}
+
+    def take(phase):
+        with lock:
+            if stopped.is_set() or remaining[phase] <= 0:
+                return False
+            remaining[phase] -= 1
+            return True
+
+    def execute(cursor):
+        begin = time.perf_counter()
+        cursor.execute(stmt)
+        if cursor.description:
+            cursor.fetchall()
+        return (time.perf_counter() - begin) * 1000.0, max(cursor.duration, 0)
+
+    def work(connection):
+        cursor = connection.cursor()
+        try:
+            while take('warmup'):
+                try:
+                    execute(cursor)
+                except Exception:
+                    pass
+            try:
+                started.wait()
+            except threading.BrokenBarrierError:
+                return
+            while take('measured'):
+                try:
+                    wall, server = execute(cursor)
+                except Exception as e:
+                    with lock:
+                        result.add_error(e)
+                else:
+                    with lock:
+                        result.add(wall, server)
+        finally:
+            cursor.close()
+            connection.close()
+
+    threads = [threading.Thread(target=work, args=(create_connection(),),
+                                name='crash-bench-{0}'.format(i), daemon=True)
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    begin = None
+    try:
+        started.wait()
+        begin = time.perf_counter()
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # let the workers finish their current statement
+        stopped.set()
+        started.abort()
+        result.interrupted = True
+        for thread in threads:
+            thread.join()
+    if begin is not None:
+        result.elapsed = time.perf_counter() - begin
+    return result
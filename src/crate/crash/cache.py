@@ -0,0 +1,86 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataCache:
+    """
+    On-disk cache of metadata fetched from a cluster, e.g. the SQL keywords
+    or the catalog snapshot used for autocompletion.
+
+    Entries are stored as one JSON file per name in a directory per cluster.
+    An entry is only returned if it was stored for the same server version
+    and is not older than ``ttl`` seconds.
+    """
+
+    DEFAULT_TTL = 24 * 60 * 60
+
+    def __init__(self, path, cluster, version, ttl=DEFAULT_TTL):
+        self.path = os.path.join(path, re.sub(r'[^\w.-]', '_', cluster or 'default'))
+        self.version = str(version)
+        self.ttl = ttl
+
+    @classmethod
+    def for_shell(cls, path, cmd, **kwargs):
+        """Create a cache keyed by the cluster and version the shell is connected to."""
+        cluster = cmd.connect_info.cluster or ','.join(cmd.last_connected_servers)
+        return cls(path, cluster, cmd.connection.lowest_server_version, **kwargs)
+
+    def _filename(self, name):
+        return os.path.join(self.path, name + '.json')
+
+    def get(self, name):
+        try:
+            with open(self._filename(name), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('version') != self.version:
+            return None
+        if time.time() - entry.get('stored_at', 0) > self.ttl:
+            return None
+        return entry.get('value')
+
+    def set(self, name, value):
+        entry = {
+            'version': self.version,
+            'stored_at': time.time(),
+            'value': value,
+        }
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # write to a temporary file first, so concurrent readers never
+            # see a partially written entry
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._filename(name))
+        except OSError as e:
+            logger.debug('Could not write cache entry %s: %s', name, e)
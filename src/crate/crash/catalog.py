@@ -0,0 +1,294 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import logging
+import threading
+from collections import namedtuple
+
+from crate.client.exceptions import ConnectionError, ProgrammingError
+
+logger = logging.getLogger(__name__)
+
+CatalogSnapshot = namedtuple('CatalogSnapshot',
+                             ['schemas', 'tables', 'columns', 'functions'])
+
+EMPTY_SNAPSHOT = CatalogSnapshot([], [], [], [])
+
+
+class PrefixTrie:
+    """
+    Prefix tree mapping case-insensitive keys to display values.
+
+    Each node is a dict of ``char -> node``. The ``None`` key of a node holds
+    the values of the key ending at that node, keyed by their kind.
+    """
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        node = self._find(key.lower())
+        return node is not None and None in node
+
+    def add(self, key, value=None, kind=None):
+        node = self._root
+        for char in key.lower():
+            child = node.get(char)
+            if child is None:
+                child = node[char] = {}
+            node = child
+        values = node.get(None)
+        if values is None:
+            values = node[None] = {}
+            self._size += 1
+        values[kind] = key if value is None else value
+
+    def complete(self, prefix, limit=None):
+        """
+        Yield ``(value, kind)`` tuples of all keys starting with ``prefix``
+        in lexicographic order of the keys.
+        """
+        node = self._find(prefix.lower())
+        if node is None:
+            return
+        found = 0
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            values = node.get(None)
+            if values:
+                for kind, value in values.items():
+                    yield value, kind
+                found += 1
+                if limit and found >= limit:
+                    return
+            stack.extend(node[c] for c in sorted(
+                (c for c in node if c is not None), reverse=True))
+
+    def _find(self, key):
+        node = self._root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+
+def build_index(snapshot):
+    """
+    Index all names of a catalog snapshot.
+
+    Returns two ``PrefixTrie`` instances: one of plain names and one of
+    qualified ``schema.table`` and ``table.column`` names. Column names also
+    cover nested object columns like ``obj['child']``.
+    """
+    names = PrefixTrie()
+    qualified = PrefixTrie()
+    for schema in snapshot.schemas:
+        names.add(schema, kind='schema')
+    for schema, table in snapshot.tables:
+        names.add(table, kind='table')
+        qualified.add(schema + '.' + table, kind='table')
+    for table, column in snapshot.columns:
+        names.add(column, kind='column')
+        qualified.add(table + '.' + column, kind='column')
+    for function in snapshot.functions:
+        names.add(function, kind='function')
+    return names, qualified
+
+
+class Catalog:
+    """
+    In-memory snapshot of the schemas, tables, columns and the user defined
+    and built-in functions of the connected cluster.
+
+    The snapshot is loaded and periodically refreshed on a background thread
+    using a dedicated cursor, so lookups never wait for the network. A
+    refreshed index replaces the previous one as a whole. While
+    autocompletion is turned off, the snapshot is not refreshed.
+
+    If a ``MetadataCache`` is given, the catalog starts from the cached
+    snapshot and stores every refreshed snapshot in it.
+    """
+
+    REFRESH_INTERVAL = 300
+
+    TABLES_QUERY = """
+        SELECT table_schema, table_name
+        FROM information_schema.tables"""
+
+    COLUMNS_QUERY = """
+        SELECT table_name, column_name
+        FROM information_schema.columns
+        WHERE table_schema NOT IN ('information_schema', 'pg_catalog')"""
+
+    FUNCTIONS_QUERY = """
+        SELECT DISTINCT routine_name
+        FROM information_schema.routines
+        WHERE routine_type = 'FUNCTION'"""
+
+    BUILTIN_FUNCTIONS_QUERY = """
+        SELECT DISTINCT proname
+        FROM pg_catalog.pg_proc"""
+
+    LOOKUP_TABLES_QUERY = """
+        SELECT table_schema, table_name
+        FROM information_schema.tables
+        WHERE table_name ILIKE ?
+        LIMIT ?"""
+
+    LOOKUP_COLUMNS_QUERY = """
+        SELECT DISTINCT column_name
+        FROM information_schema.columns
+        WHERE column_name ILIKE ?
+        AND table_schema NOT IN ('information_schema', 'pg_catalog')
+        LIMIT ?"""
+
+    def __init__(self, cmd, refresh_interval=REFRESH_INTERVAL, cache=None):
+        self.cmd = cmd
+        self.refresh_interval = refresh_interval
+        self.cache = cache
+        self.snapshot = EMPTY_SNAPSHOT
+        self.names, self.qualified_names = PrefixTrie(), PrefixTrie()
+        self._stopped = threading.Event()
+        self._refresh_requested = threading.Event()
+        self._thread = None
+        # the snapshot is not refreshed while autocompletion is turned off
+        self._paused = False
+        cached = cache and cache.get('catalog')
+        if cached:
+            self.update(CatalogSnapshot(
+                cached['schemas'],
+                [tuple(t) for t in cached['tables']],
+                [tuple(c) for c in cached['columns']],
+                cached['functions'],
+            ))
+
+    def complete(self, prefix, limit=None):
+        if self._paused:
+            # autocompletion was turned on again
+            self._paused = False
+            self.refresh_async()
+        index = self.qualified_names if '.' in prefix else self.names
+        return index.complete(prefix, limit=limit)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='crash-catalog',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._refresh_requested.set()
+
+    def refresh_async(self):
+        """Request a refresh of the snapshot without waiting for it."""
+        self._refresh_requested.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self.cmd.should_autocomplete():
+                self.refresh()
+            else:
+                self._paused = True
+            self._refresh_requested.wait(self.refresh_interval)
+            self._refresh_requested.clear()
+
+    def refresh(self):
+        if not self.cmd.is_conn_available():
+            return False
+        try:
+            snapshot = self._load(self.cmd.connection.cursor())
+        except (ProgrammingError, ConnectionError) as e:
+            logger.debug('Could not load catalog: %s', e)
+            return False
+        self.update(snapshot)
+        if self.cache is not None:
+            self.cache.set('catalog', snapshot._asdict())
+        return True
+
+    def lookup(self, prefix, limit=100):
+        """
+        Look up the table and column names starting with ``prefix`` on the
+        cluster, for names which are not in the snapshot yet.
+
+        Returns a list of ``(value, kind)`` tuples. If names are found which
+        are missing from the snapshot, a refresh is requested.
+        """
+        if '.' in prefix or not self.cmd.is_conn_available():
+            return []
+        # `_` and `%` are wildcards of ILIKE, so matches are filtered here,
+        # and the case is kept for quoted mixed-case names
+        pattern = prefix + '%'
+        cursor = self.cmd.connection.cursor()
+        try:
+            cursor.execute(self.LOOKUP_TABLES_QUERY, (pattern, limit))
+            found = [(table, 'table') for _, table in cursor.fetchall()]
+            cursor.execute(self.LOOKUP_COLUMNS_QUERY, (pattern, limit))
+            found += [(column, 'column') for column, in cursor.fetchall()]
+        except (ProgrammingError, ConnectionError) as e:
+            logger.debug('Could not look up %s: %s', prefix, e)
+            return []
+        finally:
+            cursor.close()
+        found = [(value, kind) for value, kind in found
+                 if value.lower().startswith(prefix.lower())]
+        if any(value not in self.names for value, _ in found):
+            self.refresh_async()
+        return found
+
+    def update(self, snapshot):
+        names, qualified_names = build_index(snapshot)
+        self.snapshot = snapshot
+        self.names, self.qualified_names = names, qualified_names
+
+    def _load(self, cursor):
+        try:
+            cursor.execute(self.TABLES_QUERY)
+            tables = [tuple(row) for row in cursor.fetchall()]
+            cursor.execute(self.COLUMNS_QUERY)
+            columns = [tuple(row) for row in cursor.fetchall()]
+            try:
+                cursor.execute(self.FUNCTIONS_QUERY)
+                functions = [row[0] for row in cursor.fetchall()]
+            except ProgrammingError:
+                # `routine_type` is not available on older versions
+                functions = []
+            try:
+                cursor.execute(self.BUILTIN_FUNCTIONS_QUERY)
+                known = set(functions)
+                functions += [row[0] for row in cursor.fetchall() if row[0] not in known]
+            except ProgrammingError:
+                pass
+        finally:
+            cursor.close()
+        schemas = sorted(set(schema for schema, _ in tables))
+        return CatalogSnapshot(schemas, tables, columns, functions)
@@ -29,33 +29,38 @@ import sys
 import textwrap
 from argparse import ArgumentParser, ArgumentTypeError
 from collections import namedtuple
+from contextlib import nullcontext
 from getpass import getpass
 from operator import itemgetter
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Optional, Union
 
-import sqlparse
-import urllib3
 from platformdirs import user_config_dir, user_data_dir
-from urllib3.exceptions import LocationParseError
-from verlib2 import Version
-
-from crate.client import connect
-from crate.client.connection import Connection
-from crate.client.exceptions import ConnectionError, IntegrityError, ProgrammingError
 
 from ..crash import __version__ as crash_version
 from .commands import Command, built_in_commands
 from .config import Configuration, ConfigurationError
 from .outputs import OutputWriter
 from .printer import ColorPrinter, PrintWrapper
+from .results import SpilledRows, estimate_rows_size, parse_size, release_cursor_rows
 from .sysinfo import SysInfoCommand
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# The crate client, urllib3, sqlparse, verlib2 and pygments are imported
+# where they are needed, so `crash --version` and `crash -c` do not pay for
+# the dependencies they don't use. See `benchmarks/bench_import.py`.
+if TYPE_CHECKING:  # pragma: no cover
+    import sqlparse.sql
+
+    from crate.client.connection import Connection
+
 logging.getLogger('crate').addHandler(logging.NullHandler())
 
 USER_DATA_DIR = user_data_dir("Crate", "Crate")
 HISTORY_FILE_NAME = 'crash_history'
 HISTORY_PATH = os.path.join(USER_DATA_DIR, HISTORY_FILE_NAME)
+CACHE_DIR_NAME = 'cache'
+CACHE_PATH = os.path.join(USER_DATA_DIR, CACHE_DIR_NAME)
+SOCKET_FILE_NAME = 'crash.sock'
+SOCKET_PATH = os.path.join(USER_DATA_DIR, SOCKET_FILE_NAME)
 
 USER_CONFIG_DIR = user_config_dir("Crate", "Crate")
 CONFIG_FILE_NAME = 'crash.cfg'
@@ -69,8 +74,8 @@ Result = namedtuple('Result', ['cols',
 
 ConnectionMeta = namedtuple('ConnectionMeta', ['user', 'schema', 'cluster'])
 
-TABLE_SCHEMA_MIN_VERSION = Version("0.57.0")
-TABLE_TYPE_MIN_VERSION = Version("2.0.0")
+TABLE_SCHEMA_MIN_VERSION = "0.57.0"
+TABLE_TYPE_MIN_VERSION = "2.0.0"
 
 
 def parse_config_path(args=sys.argv):
@@ -98,6 +103,13 @@ def boolean(v):
             'Invalid choice `{v}`, expected one of: [yes, true, t, 1, no, false, f, 0]'.format(v=v))
 
 
+def size(v):
+    try:
+        return parse_size(v)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
 def get_parser(output_formats=[], conf=None):
     """
     Create an argument parser that reads default values from a
@@ -119,6 +131,10 @@ def get_parser(output_formats=[], conf=None):
                         dest='autocapitalize',
                         default=False,
                         help='enable automatic capitalization of SQL keywords while typing')
+    parser.add_argument('--fuzzy-completion', action='store_true',
+                        dest='fuzzy_completion',
+                        default=False,
+                        help='also complete SQL keywords which contain the typed characters in order')
     parser.add_argument('-U', '--username', type=str, metavar='USERNAME',
                         help='Authenticate as USERNAME.')
     parser.add_argument('-W', '--password', action='store_true',
@@ -136,6 +152,16 @@ def get_parser(output_formats=[], conf=None):
                        help='Execute the STATEMENT and exit.')
     group.add_argument('--sysinfo', action='store_true', default=False,
                        help='print system and cluster information')
+    group.add_argument('--daemon', action='store_true', default=False,
+                       help='keep connections open and run the statements of '
+                            '`crash --socket` on them')
+    group.add_argument('--replay', type=str, metavar='FILENAME',
+                       help='replay the workload in FILENAME, a crash history, SQL '
+                            'or NDJSON file, and print the latencies per statement')
+    parser.add_argument('--socket', type=str, nargs='?', const=SOCKET_PATH,
+                        metavar='FILENAME',
+                        help='run `-c` and stdin statements in the daemon listening '
+                             'on FILENAME, or listen on FILENAME with --daemon')
 
     parser.add_argument('--hosts', type=str, nargs='*',
                         default=_conf_or_default('hosts', ['localhost:4200']),
@@ -161,14 +187,41 @@ def get_parser(output_formats=[], conf=None):
                         choices=output_formats, metavar='FORMAT',
                         help=f'the output FORMAT of the SQL response.\n'
                              f'choose one of: {", ".join(output_formats)}')
+    parser.add_argument('--profile', type=str, metavar='FILENAME',
+                        help='profile the processing of the statements and write '
+                             'the profiles per statement type to FILENAME and next to it')
+    parser.add_argument('--profile-stacks', action='store_true', default=False,
+                        help='also write the collapsed stacks of the profiles for flame graphs')
+    parser.add_argument('--metrics-file', type=str, metavar='FILENAME',
+                        help='append the metrics of every statement to FILENAME, '
+                             'one JSON record per line')
+    parser.add_argument('--replay-workers', type=int, default=1, metavar='N',
+                        help='replay the workload on N concurrent connections')
+    parser.add_argument('--replay-rate', choices=('original', 'max'), default='original',
+                        help='replay the statements at the rate they were captured at, '
+                             'or as fast as possible')
+    parser.add_argument('--replay-max-gap', type=float, default=10.0, metavar='SECONDS',
+                        help='shorten the pauses between the replayed statements to '
+                             'SECONDS at most, 0 to keep them')
+    parser.add_argument('--spill-threshold', type=size, default='256MB', metavar='SIZE',
+                        help='move results which take more than SIZE of memory, e.g. '
+                             '64MB, to a temporary file before printing them, '
+                             '0 to keep all results in memory')
+    parser.add_argument('--max-result-rows', type=int, metavar='N',
+                        help='abort statements whose result has more than N rows')
+    parser.add_argument('--max-result-bytes', type=size, metavar='SIZE',
+                        help='abort statements whose result is larger than SIZE, e.g. '
+                             '512MB, or takes more than SIZE of memory once decoded')
     parser.add_argument('--version', action='store_true', default=False,
                         help='print the Crash version and exit')
 
-    try:
-        import argcomplete
-        argcomplete.autocomplete(parser)
-    except ImportError:
-        pass
+    # argcomplete only has something to do if it is invoked by the shell
+    if '_ARGCOMPLETE' in os.environ:
+        try:
+            import argcomplete
+            argcomplete.autocomplete(parser)
+        except ImportError:
+            pass
     return parser
 
 
@@ -191,6 +244,7 @@ class CrateShell:
                  is_tty=True,
                  autocomplete=True,
                  autocapitalize=True,
+                 fuzzy_completion=False,
                  verify_ssl=True,
                  cert_file=None,
                  key_file=None,
@@ -198,11 +252,29 @@ class CrateShell:
                  username=None,
                  password=None,
                  schema=None,
-                 timeout=None):
+                 timeout=None,
+                 batch=False):
         self.last_connected_servers = []
+        self.last_statement = None
+        # total duration in ms and row count of the statements run by the
+        # last call of `process`, None if none succeeded
+        self.last_result = None
 
         self.exit_code = 0
         self.expanded_mode = False
+        # print a breakdown of the time spent on every statement
+        self.timing = False
+        # `StatementProfiler` of the statements, if they are profiled
+        self.profiler = None
+        # `MetricsWriter` which logs the metrics of every statement
+        self.metrics = None
+        # results larger than this number of bytes are moved to a temporary
+        # file before they are printed, None to keep them in memory
+        self.spill_threshold = None
+        # statements whose result has more rows or takes more bytes are
+        # aborted, None for no limit
+        self.max_result_rows = None
+        self.max_result_bytes = None
         self.sys_info_cmd = SysInfoCommand(self)
         self.commands = {
             'q': self._quit,
@@ -218,6 +290,8 @@ class CrateShell:
         self.error_trace = error_trace
         self._autocomplete = autocomplete
         self._autocapitalize = autocapitalize
+        self._fuzzy_completion = fuzzy_completion
+        self._execute_large_paste = False
         self.verify_ssl = verify_ssl
         self.cert_file = cert_file
         self.key_file = key_file
@@ -226,10 +300,15 @@ class CrateShell:
         self.password = password
         self.schema = schema
         self.timeout = timeout
+        # in batch mode, the connection to the cluster is not checked and
+        # the session info is only fetched when it is used, so the first
+        # request is the first statement
+        self.batch = batch
 
         # establish connection
+        self._connect_info = None
         self.cursor = None
-        self.connection: Optional[Connection] = None
+        self.connection: Optional['Connection'] = None
         self._connect(crate_hosts)
 
     def __enter__(self):
@@ -247,6 +326,12 @@ class CrateShell:
     def should_autocapitalize(self):
         return self._autocapitalize
 
+    def should_fuzzy_complete(self):
+        return self._fuzzy_completion
+
+    def should_execute_large_paste(self):
+        return self._execute_large_paste
+
     def pprint(self, rows, cols):
         result = Result(cols,
                         rows,
@@ -256,12 +341,21 @@ class CrateShell:
         self.output_writer.write(result)
 
     def process_iterable(self, iterable):
-        self._process_lines([line for text in iterable for line in text.split('\n')])
+        self._process_lines(line for text in iterable for line in text.split('\n'))
 
     def process(self, text):
-        self._process_lines(text.split('\n'))
-
-    def _process_lines(self, lines):
+        self.last_result = None
+        self._process_lines(text.split('\n'), stream=False)
+
+    def _process_lines(self, lines, stream=True):
+        """
+        Execute the statements and commands of ``lines``.
+
+        If ``stream`` is true, statements are executed as soon as they are
+        complete, so ``lines`` can be a lazy iterable of a large script.
+        """
+        if stream:
+            from .lexer import ends_with_statement
         sql_lines = []
         for line in lines:
             line = line.strip()
@@ -271,18 +365,45 @@ class CrateShell:
                 sql_lines = []
             else:
                 sql_lines.append(line)
+                if stream and line.endswith(';') \
+                        and ends_with_statement('\n'.join(sql_lines)):
+                    self._process_sql('\n'.join(sql_lines))
+                    sql_lines = []
         self._process_sql('\n'.join(sql_lines))
 
     def _process_sql(self, text):
-        sql = sqlparse.format(text, strip_comments=False)
-        for statement in sqlparse.parse(sql):
+        if self.profiler is not None:
+            self.profiler.process_sql(self, text)
+            return
+        for statement in self._parse_sql(text):
             self._exec_and_print(statement)
 
+    def _parse_sql(self, text):
+        import sqlparse
+        sql = sqlparse.format(text, strip_comments=False)
+        return sqlparse.parse(sql)
+
+    def stop_profiling(self):
+        """Stop profiling the statements and write the profiles."""
+        profiler, self.profiler = self.profiler, None
+        paths = profiler.dump()
+        if paths:
+            self.logger.info('Profiled {0} statements ({1}), wrote {2}'.format(
+                sum(profiler.statements.values()), profiler.summary(), ', '.join(paths)))
+        else:
+            self.logger.info('No statements were profiled')
+
     def exit(self):
+        if self.profiler is not None:
+            self.stop_profiling()
+        if self.metrics is not None:
+            self.metrics.close()
+            self.metrics = None
         self.close()
         return self.exit_code
 
     def close(self):
+        from crate.client.exceptions import ProgrammingError
         if self.is_closed():
             raise ProgrammingError('CrateShell is already closed')
         if self.cursor:
@@ -298,12 +419,13 @@ class CrateShell:
     @noargs_command
     def _show_tables(self, *args):
         """ print the existing tables within the 'doc' schema """
+        from verlib2 import Version
         if self.connection is None:
             return
         v = self.connection.lowest_server_version
         schema_name = \
-            "table_schema" if v >= TABLE_SCHEMA_MIN_VERSION else "schema_name"
-        if v >= TABLE_TYPE_MIN_VERSION:
+            "table_schema" if v >= Version(TABLE_SCHEMA_MIN_VERSION) else "schema_name"
+        if v >= Version(TABLE_TYPE_MIN_VERSION):
             self._exec_and_print(textwrap.dedent(
                 f"""\
                 SELECT
@@ -345,6 +467,7 @@ class CrateShell:
         sys.exit(self.exit())
 
     def is_conn_available(self):
+        from verlib2 import Version
         return self.connection and \
             self.connection.lowest_server_version != Version("0.0.0")
 
@@ -352,7 +475,38 @@ class CrateShell:
         self.last_connected_servers = servers
         if self.cursor or self.connection:
             self.close()  # reset open cursor and connection
-        self.connection = connect(servers,
+        connection = self.create_connection(servers)
+        if not self.batch:
+            # raises a ConnectionError if none of the servers is available
+            connection.lowest_server_version
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self._connect_info = None
+        if not self.batch:
+            self._fetch_session_info()
+
+    @property
+    def connect_info(self):
+        if self._connect_info is None:
+            self._fetch_session_info()
+        return self._connect_info
+
+    @connect_info.setter
+    def connect_info(self, connect_info):
+        self._connect_info = connect_info
+
+    def create_connection(self, servers):
+        """
+        Create a new connection to ``servers`` with the settings of the shell,
+        e.g. for use on a background thread.
+
+        No request is sent until the connection is used.
+        """
+        import urllib3
+
+        from .connection import DeferredConnection
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        return DeferredConnection(servers,
                                   error_trace=self.error_trace,
                                   verify_ssl_cert=self.verify_ssl,
                                   cert_file=self.cert_file,
@@ -366,8 +520,6 @@ class CrateShell:
                                   socket_tcp_keepidle=120,
                                   socket_tcp_keepintvl=30,
                                   socket_tcp_keepcnt=8)
-        self.cursor = self.connection.cursor()
-        self._fetch_session_info()
 
     def _connect_and_print_result(self, servers):
         """ connect to the given server, e.g.: \\connect localhost:4200 """
@@ -379,6 +531,7 @@ class CrateShell:
         self._connect(self.last_connected_servers)
 
     def _get_server_information(self):
+        from crate.client.exceptions import ConnectionError
         results = []
         failed = 0
         client = self.connection.client
@@ -414,6 +567,9 @@ class CrateShell:
                 built_in_commands['check'](self, startup=True)
 
     def _fetch_session_info(self):
+        from verlib2 import Version
+
+        from crate.client.exceptions import ProgrammingError
         if self.is_conn_available() \
                 and self.connection.lowest_server_version >= Version("2.0"):
 
@@ -437,6 +593,7 @@ class CrateShell:
             self.connect_info = ConnectionMeta(None, None, None)
 
     def _try_exec_cmd(self, line):
+        from crate.client.exceptions import ProgrammingError
         words = line.split(' ', 1)
         if not words or not words[0]:
             return False
@@ -471,11 +628,17 @@ class CrateShell:
 
     def _exec(self, statement: str) -> bool:
         """Execute the statement, prints errors if any, but no results."""
+        from crate.client.exceptions import (
+            ConnectionError,
+            IntegrityError,
+            ProgrammingError,
+        )
         try:
             self.cursor.execute(statement)
             return True
         except ConnectionError as e:
-            if self.error_trace:
+            # the connection has not been checked before in batch mode
+            if self.error_trace or self.batch:
                 self.logger.warn(str(e))
             self.logger.warn(
                 'Use \\connect <server> to connect to one or more servers first.')
@@ -485,14 +648,40 @@ class CrateShell:
                 self.logger.critical('\n' + e.error_trace)
         return False
 
-    def _exec_and_print(self, expression: Union[str, sqlparse.sql.Statement]) -> bool:
+    def _exec_and_print(self, expression: Union[str, 'sqlparse.sql.Statement']) -> bool:
         """Execute the statement and print the output."""
+        # the guard reads the response before the timer measures it
+        with self._result_guard():
+            if not self.timing and self.metrics is None:
+                return self._exec_and_print_statement(expression)
+            from .timing import StatementTimer
+            with StatementTimer(self) as timer:
+                success = self._exec_and_print_statement(expression)
+        if self.timing and success:
+            self.logger.info(str(timer))
+        if self.metrics is not None:
+            self.metrics.record(expression, self.last_statement, timer)
+        return success
+
+    def _result_guard(self):
+        # without limits, the responses are read by the client and the rows
+        # are spilled by `_fetch_rows` after they are decoded
+        if not (self.max_result_rows or self.max_result_bytes) or self.connection is None:
+            return nullcontext()
+        from .connection import ResultGuard
+        return ResultGuard(self.connection.client, self.max_result_rows, self.max_result_bytes,
+                           self.spill_threshold)
+
+    def _exec_and_print_statement(self, expression: Union[str, 'sqlparse.sql.Statement']) -> bool:
         statement = to_statement(expression)
-        success = self._exec(str(statement).strip())
+        self.last_statement = str(statement).strip()
+        success = self._exec(self.last_statement)
         self.exit_code = self.exit_code or int(not success)
         if not success:
             return False
         cur = self.cursor
+        duration, rowcount = self.last_result or (0, 0)
+        self.last_result = (duration + max(cur.duration, 0), rowcount + max(cur.rowcount, 0))
         duration = ''
         if cur.duration > -1:
             duration = ' ({0:.3f} sec)'.format(float(cur.duration) / 1000.0)
@@ -503,15 +692,42 @@ class CrateShell:
             'duration': duration
         }
         if cur.description:
-            self.pprint(cur.fetchall(), [c[0] for c in cur.description])
+            rows = self._fetch_rows(cur)
+            try:
+                self.pprint(rows, [c[0] for c in cur.description])
+            finally:
+                if isinstance(rows, SpilledRows):
+                    rows.close()
             tmpl = '{command} {rowcount} row{s} in set{duration}'
         else:
             tmpl = '{command} OK, {rowcount} row{s} affected{duration}'
         self.logger.info(tmpl.format(**print_vars))
         return True
 
-
-def stmt_type(expression: Union[str, sqlparse.sql.Statement]):
+    def _fetch_rows(self, cur):
+        """
+        Return the rows of the last statement, which are spilled to a
+        temporary file if they take more than ``spill_threshold`` bytes.
+
+        If a result limit is set, the rows of responses larger than
+        ``spill_threshold`` are already spilled while the response is read,
+        see ``ResultGuard``.
+        """
+        rows = cur._result.get('rows')
+        if isinstance(rows, SpilledRows):
+            release_cursor_rows(cur)
+            return rows
+        rows = cur.fetchall()
+        if not self.spill_threshold or estimate_rows_size(rows) <= self.spill_threshold:
+            return rows
+        spilled = SpilledRows(rows)
+        # only the spilled rows are kept while they are printed
+        rows.clear()
+        release_cursor_rows(cur)
+        return spilled
+
+
+def stmt_type(expression: Union[str, 'sqlparse.sql.Statement']):
     """Extract type of statement, e.g. SELECT, INSERT, UPDATE, DELETE, ..."""
     statement = to_statement(expression)
     command_with_args = str(statement.token_first(skip_ws=True, skip_cm=True))
@@ -519,13 +735,14 @@ def stmt_type(expression: Union[str, sqlparse.sql.Statement]):
     return effective_command.upper()
 
 
-def to_statement(expression: Union[str, sqlparse.sql.Statement]) -> sqlparse.sql.Statement:
+def to_statement(expression: Union[str, 'sqlparse.sql.Statement']) -> 'sqlparse.sql.Statement':
     """
     Convert SQL expression to sqlparse Statement.
 
     This is mostly for backward-compatibility reasons, because the test cases
     also submit *string types* to both `_exec_and_print` and `stmt_type`.
     """
+    import sqlparse
     if isinstance(expression, sqlparse.sql.Statement):
         statement = expression
     elif isinstance(expression, str):
@@ -564,9 +781,10 @@ def host_and_port(host_or_port):
 
 
 def get_information_schema_query(lowest_server_version):
+    from verlib2 import Version
     schema_name = \
         "table_schema" if lowest_server_version >= \
-        TABLE_SCHEMA_MIN_VERSION else "schema_name"
+        Version(TABLE_SCHEMA_MIN_VERSION) else "schema_name"
 
     information_schema_query = \
         """ select count(distinct(table_name))
@@ -614,25 +832,53 @@ def main():
         printer.info(crash_version)
         sys.exit(0)
 
+    from urllib3.exceptions import LocationParseError
+
+    from crate.client.exceptions import ProgrammingError
+
+    if args.daemon:
+        from .daemon import serve
+        sys.exit(serve(args.socket or SOCKET_PATH, printer))
+
     crate_hosts = [host_and_port(h) for h in args.hosts]
     error_trace = args.verbose > 0
 
     password = _resolve_password(is_tty, args.force_passwd_prompt)
 
+    if args.socket and not args.sysinfo \
+            and (args.command or not sys.stdin.isatty()):
+        from .daemon import create_request, run_client
+        request = create_request(args, crate_hosts, password, is_tty)
+        exit_code = run_client(args.socket, request,
+                               stdin=None if args.command else sys.stdin,
+                               stdout=sys.stdout, stderr=sys.stderr)
+        if exit_code is not None:
+            if conf.modified:
+                conf.save()
+            sys.exit(exit_code)
+        # run the statements without the daemon
+        if error_trace:
+            printer.warn('No crash daemon is listening on ' + args.socket)
+
+    # Scripted runs, which cannot prompt for a password either, skip the
+    # connection checks and go straight to the statements.
+    batch = not is_tty and not error_trace and not args.sysinfo \
+        and bool(args.command or not sys.stdin.isatty())
+
     # Tries to create a connection to the server.
     # Prompts for the password automatically if the server only accepts
     # password authentication.
     cmd = None
     try:
         cmd = _create_shell(crate_hosts, error_trace, output_writer, is_tty,
-                            args, password=password)
+                            args, password=password, batch=batch)
     except (ProgrammingError, LocationParseError) as e:
         msg = getattr(e, 'message', str(e))
         if '401' in msg and not args.force_passwd_prompt and is_tty:
             password = getpass()
             try:
                 cmd = _create_shell(crate_hosts, error_trace, output_writer,
-                                    is_tty, args, password=password)
+                                    is_tty, args, password=password, batch=batch)
             except (ProgrammingError, LocationParseError) as ex:
                 printer.warn(str(ex))
                 sys.exit(1)
@@ -643,12 +889,29 @@ def main():
         printer.warn(str(e))
         sys.exit(1)
 
-    cmd._print_connect_result(verbose=error_trace)
-    if not cmd.is_conn_available():
-        sys.exit(1)
+    if not cmd.batch:
+        cmd._print_connect_result(verbose=error_trace)
+        if not cmd.is_conn_available():
+            sys.exit(1)
+
+    if args.profile:
+        from .profiler import StatementProfiler
+        cmd.profiler = StatementProfiler(args.profile, stacks=args.profile_stacks)
+    if args.metrics_file:
+        from .metrics import MetricsWriter
+        try:
+            cmd.metrics = MetricsWriter(args.metrics_file)
+        except OSError as e:
+            printer.warn(str(e))
+            sys.exit(1)
+    cmd.spill_threshold = args.spill_threshold or None
+    cmd.max_result_rows = args.max_result_rows or None
+    cmd.max_result_bytes = args.max_result_bytes or None
 
     def save_and_exit():
-        conf.save()
+        # only write the configuration if defaults were added to it
+        if conf.modified:
+            conf.save()
         sys.exit(cmd.exit())
 
     if args.sysinfo:
@@ -656,6 +919,12 @@ def main():
         cmd.sys_info_cmd.execute()
         save_and_exit()
 
+    if args.replay:
+        from .replay import replay
+        replay(cmd, args.replay, workers=max(args.replay_workers, 1),
+               paced=args.replay_rate == 'original', max_gap=args.replay_max_gap)
+        save_and_exit()
+
     if args.command:
         cmd.process(args.command)
         save_and_exit()
@@ -665,7 +934,7 @@ def main():
         save_and_exit()
 
     from .repl import loop
-    loop(cmd, args.history)
+    loop(cmd, args.history, cache_dir=CACHE_PATH)
     save_and_exit()
 
 
@@ -711,11 +980,13 @@ def _decode_timeouts(timeout):
         raise ValueError(f"Cannot decode timeout `{timeout}`, "
                          f"expected format `<connect_sec>,<read_sec>`")
 
+    import urllib3
+
     return urllib3.Timeout(connect=_decode_timeout(connect_timeout), read=_decode_timeout(read_timeout))
 
 
 def _create_shell(crate_hosts, error_trace, output_writer, is_tty, args,
-                  timeout=None, password=None):
+                  timeout=None, password=None, batch=False):
 
     # Explicit "timeout" function argument takes precedence.
     if timeout is not None:
@@ -731,6 +1002,7 @@ def _create_shell(crate_hosts, error_trace, output_writer, is_tty, args,
                       is_tty=is_tty,
                       autocomplete=args.autocomplete,
                       autocapitalize=args.autocapitalize,
+                      fuzzy_completion=args.fuzzy_completion,
                       verify_ssl=args.verify_ssl,
                       cert_file=args.cert_file,
                       key_file=args.key_file,
@@ -738,7 +1010,8 @@ def _create_shell(crate_hosts, error_trace, output_writer, is_tty, args,
                       username=args.username,
                       password=password,
                       schema=args.schema,
-                      timeout=timeout)
+                      timeout=timeout,
+                      batch=batch)
 
 
 def file_with_permissions(path):
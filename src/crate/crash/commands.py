@@ -18,10 +18,16 @@
 # software solely pursuant to the terms of the relevant commercial agreement.
 
 import functools
+import json
 import os
+import time
 from collections import OrderedDict
 
-from verlib2 import Version
+from colorama import Back, Fore, Style
+
+from .outputs import _transform_field
+
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
 
 
 class Command(object):
@@ -122,6 +128,17 @@ class ToggleAutoCapitalizeCommand(Command):
         )
 
 
+class ToggleExecutePasteCommand(Command):
+    """ toggle executing large pastes instead of inserting them """
+
+    @noargs_command
+    def __call__(self, cmd, *args, **kwargs):
+        cmd._execute_large_paste = not cmd._execute_large_paste
+        return 'Executing large pastes {0}'.format(
+            cmd._execute_large_paste and 'ON' or 'OFF'
+        )
+
+
 class ToggleVerboseCommand(Command):
     """ toggle verbose mode """
 
@@ -134,6 +151,159 @@ class ToggleVerboseCommand(Command):
         )
 
 
+class ToggleTimingCommand(Command):
+    """ toggle printing where the time of every statement was spent """
+
+    @noargs_command
+    def __call__(self, cmd, *args, **kwargs):
+        cmd.timing = not cmd.timing
+        return 'Timing {0}'.format(
+            cmd.timing and 'ON' or 'OFF'
+        )
+
+
+class ProfileCommand(Command):
+    """ profile the statements, e.g. \\profile on|stacks|off [FILENAME] """
+
+    ACTIONS = ('on', 'stacks', 'off')
+
+    def complete(self, cmd, text):
+        return (i for i in self.ACTIONS if i.startswith(text))
+
+    def __call__(self, cmd, args=''):
+        action, _, path = args.strip().partition(' ')
+        if action not in self.ACTIONS:
+            return 'Profiling {0}\nUse one of: {1}'.format(
+                cmd.profiler and 'ON' or 'OFF', ', '.join(self.ACTIONS))
+        if action == 'off':
+            if cmd.profiler is None:
+                return 'Profiling is not ON'
+            cmd.stop_profiling()
+            return 'Profiling OFF'
+        if cmd.profiler is not None:
+            cmd.stop_profiling()
+        from .profiler import PROFILE_FILE_NAME, StatementProfiler
+        cmd.profiler = StatementProfiler(path.strip() or PROFILE_FILE_NAME,
+                                         stacks=action == 'stacks')
+        return 'Profiling ON, writing to {0} when turned off'.format(cmd.profiler.path)
+
+
+class ExplainCommand(Command):
+    """ show the timings of EXPLAIN ANALYZE as a tree, e.g. \\explain [--save FILENAME] <QUERY> """
+
+    def __call__(self, cmd, args=''):
+        stmt = args.strip()
+        path = None
+        if stmt.startswith('--save'):
+            _, path, stmt = (stmt.split(None, 2) + ['', ''])[:3]
+            if not path:
+                cmd.logger.critical('Missing the file to save the plan to')
+                return
+        if not stmt:
+            cmd.logger.critical('No statement to explain')
+            return
+        success = cmd._exec('EXPLAIN ANALYZE ' + stmt)
+        cmd.exit_code = cmd.exit_code or int(not success)
+        if not success:
+            return
+        rows = cmd.cursor.fetchall()
+        if not rows:
+            cmd.logger.critical('EXPLAIN ANALYZE did not return a plan')
+            return
+        from .explain import load_plan, parse_plan, render_plan
+        plan = load_plan(rows[0][0])
+        writer = cmd.output_writer
+        lines = render_plan(parse_plan(plan), is_tty=writer.is_tty)
+        writer.writer.write('\n'.join(lines) + '\n')
+        if path:
+            with open(os.path.expanduser(path), 'w') as f:
+                json.dump(plan, f, indent=2)
+            return 'Saved the plan to {0}'.format(path)
+
+
+class BenchCommand(Command):
+    """ run a statement concurrently and show its latencies, e.g. \\bench [-n 100] [-c 4] [--warmup 10] <QUERY> """
+
+    COLUMNS = ['stat', 'wall_ms', 'server_ms', 'client_ms']
+
+    def __call__(self, cmd, args=''):
+        from .bench import parse_bench_args, run_benchmark
+        from .command import Result
+        try:
+            options, stmt = parse_bench_args(args)
+        except ValueError as e:
+            cmd.logger.critical(str(e))
+            return
+        if not stmt:
+            cmd.logger.critical('No statement to benchmark')
+            return
+        servers = list(cmd.last_connected_servers)
+        result = run_benchmark(lambda: cmd.create_connection(servers), stmt, **options)
+        rows = result.rows()
+        cmd.output_writer.write(Result(self.COLUMNS, rows, len(rows), -1, cmd.get_num_columns()))
+        cmd.logger.info('BENCH {0} run{1} on {2} connection{3}{4} in {5:.3f} sec, '
+                        '{6:,.1f} statements/sec, {7} error{8}'.format(
+                            result.runs, 's'[result.runs == 1:],
+                            options['concurrency'], 's'[options['concurrency'] == 1:],
+                            ' (interrupted)' if result.interrupted else '',
+                            result.elapsed, result.throughput,
+                            sum(result.errors.values()), 's'[sum(result.errors.values()) == 1:]))
+        for name, count in result.errors.most_common():
+            cmd.logger.critical('{0} x {1}: {2}'.format(count, name, result.error_messages[name]))
+        if result.errors:
+            cmd.exit_code = 1
+
+
+class TopCommand(Command):
+    """ show the running jobs or the nodes of the cluster, refreshed every N seconds, e.g. \\top [jobs|nodes] [2] """
+
+    def __call__(self, cmd, args=''):
+        from .top import TopScreen, parse_top_args, snapshot
+        try:
+            view, interval = parse_top_args(args)
+        except ValueError as e:
+            cmd.logger.critical(str(e))
+            return
+        if not cmd.output_writer.is_tty:
+            snapshot(cmd, view, interval)
+            return
+        TopScreen(cmd, view, interval).run()
+
+
+class LimitCommand(Command):
+    """ abort statements with larger results, e.g. \\limit rows 1000|bytes 512MB|off """
+
+    ACTIONS = ('rows', 'bytes', 'off')
+
+    def complete(self, cmd, text):
+        return (i for i in self.ACTIONS if i.startswith(text))
+
+    def __call__(self, cmd, args=''):
+        from .results import parse_size
+        action, _, value = args.strip().partition(' ')
+        value = value.strip()
+        try:
+            if action == 'off' and not value:
+                cmd.max_result_rows = cmd.max_result_bytes = None
+            elif action == 'rows' and value:
+                rows = 0 if value == 'off' else int(value) if value.isdigit() else -1
+                if rows < 0:
+                    raise ValueError('Invalid number of rows: {0}'.format(value))
+                cmd.max_result_rows = rows or None
+            elif action == 'bytes' and value:
+                cmd.max_result_bytes = (0 if value == 'off' else parse_size(value)) or None
+            elif action:
+                cmd.logger.critical('Use one of: rows <N>|off, bytes <SIZE>|off, off')
+                return
+        except ValueError as e:
+            cmd.logger.critical(str(e))
+            return
+        from .timing import format_bytes
+        return 'Result limits: rows {0}, bytes {1}'.format(
+            cmd.max_result_rows or 'OFF',
+            format_bytes(cmd.max_result_bytes) if cmd.max_result_bytes else 'OFF')
+
+
 class CheckBaseCommand(Command):
 
     check_name = None
@@ -184,6 +354,7 @@ class NodeCheckCommand(CheckBaseCommand):
     check_name = None
 
     def __call__(self, cmd, **kwargs):
+        from verlib2 import Version
         if cmd.connection.lowest_server_version >= Version("0.56.0"):
             startup = kwargs.get('startup', False)
             stmt = startup and self.STARTUP_STMT or self.DEFAULT_STMT
@@ -207,6 +378,7 @@ class ClusterCheckCommand(CheckBaseCommand):
     check_name = "CLUSTER CHECK"
 
     def __call__(self, cmd, **kwargs):
+        from verlib2 import Version
         if cmd.connection.lowest_server_version >= Version("0.52.0"):
             self.execute(cmd, self.STMT)
         else:
@@ -234,13 +406,101 @@ class CheckCommand(Command):
             cmd.logger.warn('No check for {}'.format(check_name))
 
 
+def highlight_changes(rows, previous):
+    """
+    Mark the cells of ``rows`` which differ from the same cell in ``previous``.
+
+    Rows that did not exist in the previous result count as changed entirely.
+    """
+    if previous is None:
+        return rows
+    highlighted = []
+    for i, row in enumerate(rows):
+        old = previous[i] if i < len(previous) else None
+        new_row = []
+        for j, value in enumerate(row):
+            if old is None or j >= len(old) or old[j] != value:
+                value = '{0}{1}{2}{3}'.format(
+                    Back.YELLOW, Fore.BLACK, _transform_field(value), Style.RESET_ALL)
+            new_row.append(value)
+        highlighted.append(new_row)
+    return highlighted
+
+
+class WatchCommand(Command):
+    """ re-run the last or given statement every N seconds, e.g. \\watch 2 """
+
+    HIGHLIGHT_FORMATS = ('tabular', 'mixed', 'dynamic')
+
+    def __call__(self, cmd, args):
+        interval, _, stmt = args.strip().partition(' ')
+        try:
+            interval = float(interval)
+        except ValueError:
+            cmd.logger.critical('Invalid interval: {0}'.format(interval))
+            return
+        if interval <= 0:
+            cmd.logger.critical('Interval must be greater than 0')
+            return
+        stmt = stmt.strip() or cmd.last_statement
+        if not stmt:
+            cmd.logger.critical('No statement to watch')
+            return
+        try:
+            self._watch(cmd, interval, stmt)
+        except KeyboardInterrupt:
+            cmd.logger.info('Stopped watching')
+
+    def _watch(self, cmd, interval, stmt):
+        writer = cmd.output_writer
+        redraw = writer.is_tty and not writer.pager
+        highlight = redraw and writer.output_format in self.HIGHLIGHT_FORMATS
+        previous = None
+        iteration = 0
+        while True:
+            started = time.monotonic()
+            iteration += 1
+            success = cmd._exec(stmt)
+            cmd.exit_code = cmd.exit_code or int(not success)
+            if not success:
+                return
+            cur = cmd.cursor
+            rows = cur.fetchall() if cur.description else []
+            if redraw:
+                writer.writer.write(CLEAR_SCREEN)
+            writer.writer.write('Every {0:g}s: {1}  [#{2} {3}]\n'.format(
+                interval, stmt, iteration, time.strftime('%H:%M:%S')))
+            if cur.description:
+                cols = [c[0] for c in cur.description]
+                shown = highlight_changes(rows, previous) if highlight else rows
+                cmd.pprint(shown, cols)
+            duration = ''
+            if cur.duration > -1:
+                duration = ' ({0:.3f} sec)'.format(float(cur.duration) / 1000.0)
+            cmd.logger.info('{0} row{1} {2}{3}'.format(
+                cur.rowcount,
+                's'[cur.rowcount == 1:],
+                'in set' if cur.description else 'affected',
+                duration))
+            previous = rows
+            time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
 built_in_commands = {
     '?': HelpCommand(),
     'r': ReadFileCommand(),
     'format': SwitchFormatCommand(),
     'autocomplete': ToggleAutocompleteCommand(),
     'autocapitalize': ToggleAutoCapitalizeCommand(),
+    'executepaste': ToggleExecutePasteCommand(),
     'verbose': ToggleVerboseCommand(),
+    'timing': ToggleTimingCommand(),
+    'profile': ProfileCommand(),
+    'explain': ExplainCommand(),
+    'bench': BenchCommand(),
+    'top': TopCommand(),
+    'limit': LimitCommand(),
     'check': CheckCommand(),
     'pager': SetPager(),
+    'watch': WatchCommand(),
 }
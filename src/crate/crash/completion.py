@@ -0,0 +1,164 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_toolkit.completion import Completer, Completion
+
+# the rest of the name before the cursor and the arguments of a function
+FUNCTION_CALL = re.compile(r'\w*\s*\(')
+
+
+class BackgroundCompleter(Completer):
+    """
+    Run the completions of ``completer`` off the UI thread.
+
+    The completions of ``completer``, which only uses local indexes, are
+    computed on a worker thread. Afterwards, names which are unknown to the
+    local catalog are looked up on the cluster with ``lookup(prefix)`` on a
+    second worker thread, and merged with the local completions. Names which
+    have local completions, keywords and function names are not looked up,
+    and a lookup only starts once the input did not change for ``delay``
+    seconds.
+
+    Every request has a time budget of ``budget`` seconds. Remote lookups
+    which take longer are not waited for, but their results are cached for
+    the following requests. Requests which are superseded by a newer one
+    are cancelled: they are skipped if they did not start yet, and their
+    results are discarded otherwise.
+    """
+
+    BUDGET = 0.3
+    DELAY = 0.1
+    CACHE_SIZE = 100
+
+    def __init__(self, completer, lookup=None, budget=BUDGET, delay=DELAY):
+        self.completer = completer
+        self.lookup = lookup
+        self.budget = budget
+        self.delay = delay
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._local_executor = ThreadPoolExecutor(1, thread_name_prefix='crash-complete')
+        self._remote_executor = ThreadPoolExecutor(1, thread_name_prefix='crash-lookup')
+        self._cache = OrderedDict()
+
+    def get_completions(self, document, complete_event):
+        return self.completer.get_completions(document, complete_event)
+
+    async def get_completions_async(self, document, complete_event):
+        generation = self._next_generation()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        try:
+            local = await asyncio.wait_for(
+                loop.run_in_executor(self._local_executor, self._complete_local,
+                                     document, complete_event, generation),
+                timeout=self.budget)
+        except asyncio.TimeoutError:
+            return
+        if local is None:
+            return
+        for completion in local:
+            yield completion
+
+        prefix = self._lookup_prefix(document, local)
+        if not prefix:
+            return
+        remote = self._cached(prefix)
+        if remote is None:
+            # debounce the lookups while typing
+            await asyncio.sleep(self.delay)
+            if not self._is_current(generation):
+                return
+            future = self._remote_executor.submit(self._lookup, prefix, generation)
+            try:
+                # shield the lookup, so it is cached even if it takes too long
+                remote = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)),
+                    timeout=max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                return
+        if remote is None or not self._is_current(generation):
+            return
+        seen = set(c.text for c in local)
+        for value, kind in remote:
+            if value not in seen:
+                yield Completion(value, -len(prefix), display_meta=kind)
+
+    def _next_generation(self):
+        with self._lock:
+            self._generation += 1
+            return self._generation
+
+    def _is_current(self, generation):
+        return self._generation == generation
+
+    def _complete_local(self, document, complete_event, generation):
+        if not self._is_current(generation):
+            return None
+        return list(self.completer.get_completions(document, complete_event))
+
+    def _lookup_prefix(self, document, local):
+        """
+        Return the name to look up on the cluster, if there are no ``local``
+        completions of it and the local catalog does not know any name
+        starting with it, and it is neither a keyword nor a function.
+        """
+        if self.lookup is None or local or not self.completer.cmd.should_autocomplete():
+            return None
+        name = self.completer.get_name_before_cursor(document)
+        if not name or name.lower() in self.completer.keyword_set:
+            return None
+        catalog = self.completer.catalog
+        if catalog is not None and any(catalog.complete(name, limit=1)):
+            return None
+        if FUNCTION_CALL.match(document.text_after_cursor):
+            return None
+        return name
+
+    def _lookup(self, prefix, generation):
+        if not self._is_current(generation):
+            return None
+        found = self.lookup(prefix)
+        with self._lock:
+            self._cache[prefix.lower()] = found
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return found
+
+    def _cached(self, prefix):
+        with self._lock:
+            found = self._cache.get(prefix.lower())
+            if found is not None:
+                self._cache.move_to_end(prefix.lower())
+            return found
+
+    def close(self):
+        self._next_generation()
+        self._local_executor.shutdown(wait=False)
+        self._remote_executor.shutdown(wait=False)
+        self.completer.close()
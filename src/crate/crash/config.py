@@ -71,6 +71,8 @@ class Configuration(object):
         if not path.endswith('.cfg'):
             raise ConfigurationError('Path to configuration file needs to end with .cfg')
         self.path = path
+        # whether values were set which are not saved yet
+        self.modified = False
         self.cfg = configparser.ConfigParser()
         self.read_and_create_if_necessary()
         self.add_crash_section_if_necessary()
@@ -86,6 +88,7 @@ class Configuration(object):
     def add_crash_section_if_necessary(self):
         if 'crash' not in self.cfg.sections():
             self.cfg.add_section('crash')
+            self.modified = True
 
     def get_or_set(self, key, default_value):
         option_type = type(default_value)
@@ -104,8 +107,10 @@ class Configuration(object):
         except configparser.NoOptionError:
             if default_value is not None:
                 self.cfg.set('crash', key, transform_to(default_value))
+                self.modified = True
         return default_value if value is None else transform_from(value)
 
     def save(self):
         with open(self.path, 'w') as fp:
             self.cfg.write(fp)
+        self.modified = False
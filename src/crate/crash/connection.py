@@ -0,0 +1,257 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import io
+import json
+import re
+import threading
+
+from urllib3.exceptions import HTTPError
+
+from crate.client.connection import Connection
+from crate.client.exceptions import ConnectionError, ProgrammingError
+from crate.client.http import _ex_to_message
+
+from .results import SpilledRows, estimate_rows_size, spill_rows
+from .timing import format_bytes
+
+# the row count follows the rows of a response
+ROWCOUNT = re.compile(rb'"rowcount"\s*:\s*(\d+)')
+# the response of a DML statement has no columns, its row count is the
+# number of affected rows
+NO_COLS = re.compile(rb'\s*\{\s*"cols"\s*:\s*\[\s*\]')
+
+
+class DeferredConnection(Connection):
+    """
+    Connection which requests the versions of the servers when
+    ``lowest_server_version`` is first used, instead of when it is created.
+
+    Creating the connection does not send any request, so the first request
+    to the cluster can be the first statement.
+    """
+
+    _lowest_version = None
+
+    @property
+    def lowest_server_version(self):
+        if self._lowest_version is None:
+            self._lowest_version = super()._lowest_server_version()
+        return self._lowest_version
+
+    @lowest_server_version.setter
+    def lowest_server_version(self, version):
+        self._lowest_version = version
+
+    def _lowest_server_version(self):
+        # called by `Connection.__init__`
+        return None
+
+
+class ResultTooLarge(ProgrammingError):
+    """
+    Raised if the result of a statement exceeds the limits of a
+    ``ResultGuard``.
+    """
+
+
+class ResultGuard:
+    """
+    Abort statements whose result has more than ``max_rows`` rows or takes
+    more than ``max_bytes`` bytes, before it is printed, and move the rows
+    of responses larger than ``spill_threshold`` bytes to a temporary file
+    while they are received.
+
+    While the guard is entered, the requests of ``client`` are hooked to:
+
+    - read the response in chunks and stop reading it as soon as it exceeds
+      ``max_bytes``, closing the HTTP connection
+    - check the row count at the end of the response before it is decoded;
+      the whole response is read before, so ``max_rows`` does not limit the
+      download but only the memory taken by the decoded rows
+    - estimate the memory of the decoded rows, which usually is a multiple
+      of the size of the response
+    - once the response exceeds ``spill_threshold``, decode the rest of it
+      row by row into ``SpilledRows``, which replace the rows of the result,
+      so neither the response nor the rows are kept in memory
+
+    The limits are checked in the thread which entered the guard only.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    # the bytes at the start and the end of a response which are searched
+    # for the columns and the row count
+    PEEK_SIZE = 1024
+
+    def __init__(self, client, max_rows=None, max_bytes=None, spill_threshold=None):
+        self.client = client
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.spill_threshold = spill_threshold
+        # the rows spilled by the last request, until its result is decoded
+        self._spilled = None
+        self._request = None
+        self._json_request = None
+        self._patched = False
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        client = self.client
+        self._patched = '_request' in vars(client)
+        self._request = client._request
+        self._json_request = client._json_request
+        client._request = self.request
+        client._json_request = self.json_request
+        return self
+
+    def __exit__(self, *exc):
+        if self._patched:
+            self.client._request = self._request
+            self.client._json_request = self._json_request
+        else:
+            del self.client._request
+            del self.client._json_request
+
+    def _is_guarded(self):
+        return threading.get_ident() == self._thread
+
+    def request(self, method, path, **kwargs):
+        if 'stream' in kwargs or not self._is_guarded():
+            # e.g. a redirect, whose response the outer request reads
+            return self._request(method, path, **kwargs)
+        response = self._request(method, path, stream=True, **kwargs)
+        body = io.BytesIO()
+        # error responses are small, and are decoded by the client
+        spill = self.spill_threshold and response.status == 200
+        try:
+            chunks = response.stream(self.CHUNK_SIZE, decode_content=True)
+            for chunk in chunks:
+                body.write(chunk)
+                self._check_size(body.tell())
+                if spill and body.tell() > self.spill_threshold:
+                    body = self._spill(body, chunks)
+                    break
+        except HTTPError as e:
+            # e.g. the response was cut off or timed out, which the client
+            # reports as unavailable server if it reads the response itself
+            response.close()
+            raise ConnectionError(
+                'Server not available, exception: {0}'.format(_ex_to_message(e))) from e
+        except BaseException:
+            # the rest of the response is not read
+            response.close()
+            raise
+        response.release_conn()
+        if not body.tell():
+            return response
+        if self.max_rows and self._spilled is None:
+            self._check_rowcount(body)
+        body.seek(0)
+        # the body is already decoded and is read from the buffer
+        from urllib3 import HTTPResponse
+        return HTTPResponse(body=body, headers=response.headers,
+                            status=response.status, reason=response.reason,
+                            decode_content=False, preload_content=False)
+
+    def _spill(self, body, chunks):
+        """
+        Decode the response which starts with ``body`` and continues with
+        ``chunks`` into ``SpilledRows``, return the response without rows.
+        """
+        size = body.tell()
+        spilled = SpilledRows()
+
+        def read():
+            nonlocal size
+            # the start of the response is released once it is decoded
+            data = memoryview(body.getvalue())
+            body.close()
+            for offset in range(0, len(data), self.CHUNK_SIZE):
+                yield data[offset:offset + self.CHUNK_SIZE]
+            del data
+            for chunk in chunks:
+                size += len(chunk)
+                self._check_size(size)
+                if self.max_rows and len(spilled) > self.max_rows:
+                    self._check_rows(len(spilled))
+                yield chunk
+
+        try:
+            result = spill_rows(read(), spilled)
+            if self.max_rows and result.get('cols'):
+                self._check_rows(max(result.get('rowcount', 0), len(spilled)))
+        except ValueError as e:
+            spilled.close()
+            raise ProgrammingError('Invalid server response: {0}'.format(e))
+        except BaseException:
+            spilled.close()
+            raise
+        self._spilled = spilled
+        body = io.BytesIO()
+        body.write(json.dumps(result).encode('utf-8'))
+        return body
+
+    def json_request(self, method, path, data):
+        if not self._is_guarded():
+            return self._json_request(method, path, data)
+        try:
+            result = self._json_request(method, path, data)
+        finally:
+            spilled, self._spilled = self._spilled, None
+        if spilled is not None:
+            result['rows'] = spilled
+            return result
+        rows = result.get('rows') if isinstance(result, dict) else None
+        if rows:
+            if self.max_rows:
+                self._check_rows(len(rows))
+            if self.max_bytes:
+                size = estimate_rows_size(rows)
+                if size > self.max_bytes:
+                    raise ResultTooLarge(
+                        'The result takes about {0} of memory, more than the limit of {1}'.format(
+                            format_bytes(size), format_bytes(self.max_bytes)))
+        return result
+
+    def _check_size(self, size):
+        if self.max_bytes and size > self.max_bytes:
+            raise ResultTooLarge(
+                'The result is larger than the limit of {0}'.format(
+                    format_bytes(self.max_bytes)))
+
+    def _check_rowcount(self, body):
+        with body.getbuffer() as view:
+            head = bytes(view[:self.PEEK_SIZE])
+            tail = bytes(view[-self.PEEK_SIZE:])
+        if NO_COLS.match(head):
+            return
+        match = ROWCOUNT.search(tail, tail.rfind(b']') + 1)
+        if match:
+            self._check_rows(int(match.group(1)))
+
+    def _check_rows(self, rowcount):
+        if rowcount > self.max_rows:
+            raise ResultTooLarge(
+                'The result has {0} rows, more than the limit of {1} rows'.format(
+                    rowcount, self.max_rows))
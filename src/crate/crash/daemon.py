@@ -0,0 +1,381 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import json
+import os
+import re
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+from .command import CrateShell, _decode_timeouts
+from .outputs import OutputWriter
+from .printer import ColorPrinter
+
+# statements which change the settings of the session, which is kept with
+# the connections of a shell
+SESSION_STATEMENT = re.compile(r'(?:^|;)\s*(?:SET|RESET|DISCARD)\b', re.IGNORECASE | re.MULTILINE)
+
+
+class DaemonError(Exception):
+    pass
+
+
+def create_request(args, crate_hosts, password, is_tty):
+    """
+    Create the request to run ``args.command``, or the statements sent after
+    the request, with the connection options, result limits, metrics,
+    profiling and output format of ``args``.
+    """
+    request = {
+        'options': {
+            'crate_hosts': crate_hosts,
+            'error_trace': args.verbose > 0,
+            'verify_ssl': args.verify_ssl,
+            'cert_file': args.cert_file,
+            'key_file': args.key_file,
+            'ca_cert_file': args.ca_cert_file,
+            'username': args.username,
+            'password': password,
+            'schema': args.schema,
+            'timeout': args.timeout,
+        },
+        # applied to the shell for this request only, the paths are
+        # resolved here since the daemon runs in another directory
+        'session': {
+            'spill_threshold': args.spill_threshold or None,
+            'max_result_rows': args.max_result_rows or None,
+            'max_result_bytes': args.max_result_bytes or None,
+            'metrics_file': args.metrics_file and os.path.abspath(args.metrics_file),
+            'profile': args.profile and os.path.abspath(args.profile),
+            'profile_stacks': args.profile_stacks,
+        },
+        'format': args.format,
+        'is_tty': is_tty,
+    }
+    if args.command:
+        request['command'] = args.command
+    return request
+
+
+def run_client(path, request, stdin=None, stdout=None, stderr=None):
+    """
+    Send ``request`` and the lines of ``stdin`` to the daemon listening on
+    ``path``, and write its output to ``stdout`` and ``stderr``.
+
+    Return the exit code, or None if no daemon is listening on ``path``.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    with sock:
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        # send the statements on another thread, so the daemon is never
+        # blocked by output which is not read yet
+        sender = threading.Thread(target=_send_lines, args=(sock, stdin or []),
+                                  name='crash-client', daemon=True)
+        sender.start()
+        exit_code = 1
+        for line in sock.makefile('r', encoding='utf-8'):
+            frame = json.loads(line)
+            if 'out' in frame:
+                stdout.write(frame['out'])
+            elif 'err' in frame:
+                stderr.write(frame['err'])
+            elif 'exit' in frame:
+                exit_code = frame['exit']
+        stdout.flush()
+        stderr.flush()
+    return exit_code
+
+
+def _send_lines(sock, lines):
+    try:
+        for line in lines:
+            sock.sendall(line.encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        # the daemon closed the connection
+        pass
+
+
+class _Channel:
+    """
+    Frames the output of a request, to be written to ``stdout`` or
+    ``stderr`` by the client.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.stdout = _Stream(self, 'out')
+        self.stderr = _Stream(self, 'err')
+
+    def send(self, **frame):
+        self.wfile.write((json.dumps(frame) + '\n').encode('utf-8'))
+
+
+class _Stream:
+
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+
+    def write(self, text, end=''):
+        self.channel.send(**{self.name: text + end})
+        if self.name == 'err':
+            # status messages follow the output of every statement
+            self.channel.wfile.flush()
+
+    def isatty(self):
+        return False
+
+
+class ShellPool:
+    """
+    Idle shells by their connection options.
+
+    A shell is only used by one request at a time. Up to ``max_idle`` idle
+    shells per connection options are kept, with their connection pools and
+    caches. The state which the commands of a request change, e.g. with
+    ``\timing``, is reset before the shell is used again.
+    """
+
+    MAX_IDLE = 4
+
+    def __init__(self, max_idle=MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, options):
+        key = json.dumps(options, sort_keys=True)
+        with self._lock:
+            shells = self._idle.get(key)
+            shell = shells.pop() if shells else None
+        if shell is None:
+            return key, self.create_shell(options)
+        reset_shell(shell)
+        return key, shell
+
+    def create_shell(self, options):
+        options = dict(options)
+        timeout = options.pop('timeout')
+        return CrateShell(is_tty=False,
+                          batch=True,
+                          timeout=None if timeout is None else _decode_timeouts(timeout),
+                          **options)
+
+    def release(self, key, shell, options, reusable=True):
+        if shell.is_closed():
+            return
+        if reusable and shell.last_connected_servers == options['crate_hosts'] \
+                and shell.error_trace == options['error_trace']:
+            with self._lock:
+                shells = self._idle.setdefault(key, [])
+                if len(shells) < self.max_idle:
+                    shells.append(shell)
+                    return
+        # the shell connected to other servers, changed the session, or
+        # there are enough idle ones
+        shell.close()
+
+    def close(self):
+        with self._lock:
+            shells = [shell for shells in self._idle.values() for shell in shells]
+            self._idle.clear()
+        for shell in shells:
+            if not shell.is_closed():
+                shell.close()
+
+
+def reset_shell(shell):
+    """
+    Reset the state of ``shell`` which the commands of a request may have
+    changed to the state of a new shell.
+    """
+    shell.exit_code = 0
+    shell.expanded_mode = False
+    shell.timing = False
+    shell.profiler = None
+    shell.metrics = None
+    shell.spill_threshold = None
+    shell.max_result_rows = None
+    shell.max_result_bytes = None
+    shell.last_statement = None
+    shell.last_result = None
+
+
+def _start_request(shell, session):
+    shell.spill_threshold = session.get('spill_threshold')
+    shell.max_result_rows = session.get('max_result_rows')
+    shell.max_result_bytes = session.get('max_result_bytes')
+    if session.get('profile'):
+        from .profiler import StatementProfiler
+        shell.profiler = StatementProfiler(session['profile'],
+                                           stacks=session.get('profile_stacks', False))
+    if session.get('metrics_file'):
+        from .metrics import MetricsWriter
+        shell.metrics = MetricsWriter(session['metrics_file'])
+
+
+def _finish_request(shell):
+    # write what `\profile` recorded, as if the shell exited
+    if shell.profiler is not None:
+        shell.stop_profiling()
+    if shell.metrics is not None:
+        shell.metrics.close()
+        shell.metrics = None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    # buffer the output, `_Stream` flushes it after every statement
+    wbufsize = -1
+
+    def handle(self):
+        channel = _Channel(self.wfile)
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            channel.stderr.write('Invalid request', end='\n')
+            channel.send(exit=1)
+            return
+        lines = (line.decode('utf-8') for line in self.rfile)
+        exit_code = self.server.execute(request, lines, channel)
+        channel.send(exit=exit_code)
+
+
+class CrashDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Run the statements sent by ``crash --socket`` with warm shells.
+
+    Every connection carries one request: the connection options and output
+    format as a line of JSON, followed by the statements if no command is
+    given. The output is sent back as lines of JSON, ``{"out": ...}`` for
+    stdout and ``{"err": ...}`` for stderr, followed by ``{"exit": code}``.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, pool=None):
+        self.path = path
+        self.pool = pool or ShellPool()
+        if os.path.exists(path):
+            if _is_listening(path):
+                raise DaemonError('A crash daemon is already listening on ' + path)
+            os.unlink(path)
+        base = os.path.dirname(path)
+        if base and not os.path.exists(base):
+            os.makedirs(base)
+        # the requests contain passwords: only the user may connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def execute(self, request, lines, channel):
+        options = request['options']
+        try:
+            key, shell = self.pool.acquire(options)
+        except Exception as e:
+            channel.stderr.write(getattr(e, 'message', None) or str(e), end='\n')
+            return 1
+        is_tty = request.get('is_tty', False)
+        shell.logger = ColorPrinter(is_tty, stream=channel.stderr)
+        # a new writer also resets the pager
+        shell.output_writer = OutputWriter(channel.stdout, is_tty)
+        shell.output_writer.output_format = request['format']
+        try:
+            _start_request(shell, request.get('session', {}))
+        except OSError as e:
+            # the metrics file cannot be written
+            channel.stderr.write(str(e), end='\n')
+            self.pool.release(key, shell, options)
+            return 1
+        session_changes = []
+
+        def watch(text):
+            if SESSION_STATEMENT.search(text):
+                session_changes.append(text)
+            return text
+
+        try:
+            if 'command' in request:
+                shell.process(watch(request['command']))
+            else:
+                shell.process_iterable(watch(line) for line in lines)
+            return shell.exit_code
+        except SystemExit as e:
+            # `\q` closes the shell
+            return e.code
+        finally:
+            _finish_request(shell)
+            # the session settings cannot be reset, so the shell is dropped
+            self.pool.release(key, shell, options, reusable=not session_changes)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def _is_listening(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def serve(path, printer):
+    """
+    Run a daemon on ``path`` until it is interrupted, return the exit code.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        printer.warn('--daemon is not supported on this platform')
+        return 1
+    try:
+        server = CrashDaemon(path)
+    except (DaemonError, OSError) as e:
+        printer.warn(str(e))
+        return 1
+    printer.info('Listening on ' + path)
+    # remove the socket if the daemon is terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
@@ -0,0 +1,179 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import json
+
+from colorama import Fore, Style
+
+# keys of the time of an object itself, instead of the sum of its children
+TIME_KEYS = ('Total', 'Time')
+
+# numbers in a plan which are not times
+NOT_TIMES = ('ShardId', 'Id')
+
+# levels which only group their children, which are shown in their place,
+# like lists
+FLATTENED = ('nodes',)
+
+MAX_NAME_LENGTH = 50
+
+
+class PlanNode:
+    """
+    Node of the timing tree of an ``EXPLAIN ANALYZE`` result. ``time`` is in
+    milliseconds, or None if the node has no timings.
+    """
+
+    def __init__(self, name, time=None, children=None, details=None):
+        self.name = name
+        self.time = time
+        self.children = children or []
+        self.details = details or []
+        self.hot = False
+
+
+def _is_time(key, value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) \
+        and not key.endswith('_count') and not key.endswith(NOT_TIMES)
+
+
+def _label(item, index):
+    if isinstance(item, dict):
+        name = item.get('QueryName') or item.get('name')
+        description = item.get('QueryDescription')
+        if name and description:
+            return '{0} {1}'.format(name, description)
+        if name:
+            return str(name)
+    return '[{0}]'.format(index)
+
+
+def _children(value):
+    """
+    Return the ``(name, value)`` pairs of the children of a dict or a list.
+    """
+    if isinstance(value, list):
+        return [(_label(item, i), item) for i, item in enumerate(value)]
+    pairs = []
+    for key, child in value.items():
+        if key in FLATTENED and isinstance(child, dict):
+            pairs.extend(child.items())
+        elif isinstance(child, list):
+            pairs.extend(_children(child))
+        else:
+            pairs.append((key, child))
+    return pairs
+
+
+def parse_plan(plan, name='EXPLAIN ANALYZE'):
+    """
+    Return the timing tree of the ``EXPLAIN ANALYZE`` result ``plan``.
+
+    Numbers in the plan are timings in milliseconds, except counters. The
+    time of an object is its ``Total`` or ``Time`` entry, or else the sum of
+    the times of its children. A plan which only wraps another object, like
+    ``{"Analyze": {...}}``, is unwrapped.
+    """
+    while isinstance(plan, dict) and len(plan) == 1 \
+            and isinstance(next(iter(plan.values())), dict):
+        name, plan = next(iter(plan.items()))
+    return _parse(plan, name)
+
+
+def _parse(plan, name):
+    if _is_time(name, plan):
+        return PlanNode(name, float(plan))
+    if not isinstance(plan, (dict, list)):
+        return PlanNode(name, details=[str(plan)])
+    if isinstance(plan, dict) and isinstance(plan.get('Phases'), dict) \
+            and _is_time('Execute', plan.get('Execute')):
+        # the phases are the breakdown of the execution
+        plan = dict(plan)
+        plan['Execute'] = dict(plan.pop('Phases'), Total=plan['Execute'])
+    node = PlanNode(name)
+    for key, value in _children(plan):
+        if key in TIME_KEYS and _is_time(key, value):
+            node.time = float(value)
+        elif isinstance(value, (dict, list)) or _is_time(key, value):
+            node.children.append(_parse(value, key))
+        elif key not in ('QueryName', 'QueryDescription'):
+            node.details.append('{0}={1}'.format(key, value))
+    if node.time is None:
+        times = [c.time for c in node.children if c.time is not None]
+        node.time = sum(times) if times else None
+    return node
+
+
+def mark_hottest_path(node):
+    """
+    Mark ``node`` and the child with the most time on every level below it.
+    """
+    while node is not None:
+        node.hot = True
+        timed = [c for c in node.children if c.time]
+        node = max(timed, key=lambda c: c.time) if timed else None
+
+
+def render_plan(root, is_tty=False):
+    """
+    Return the lines of the timing tree ``root``, with the time of every node,
+    its share of the time of the root, and the hottest path marked.
+    """
+    mark_hottest_path(root)
+    rows = []
+
+    def walk(node, prefix, connector):
+        rows.append((prefix + connector + node.name, node))
+        child_prefix = prefix + ('' if not connector else
+                                 '    ' if connector == '└── ' else '│   ')
+        for i, child in enumerate(node.children):
+            walk(child, child_prefix, '└── ' if i == len(node.children) - 1 else '├── ')
+
+    walk(root, '', '')
+    width = min(max(len(name) for name, _ in rows), MAX_NAME_LENGTH)
+    total = root.time
+    lines = []
+    for name, node in rows:
+        if len(name) > width:
+            name = name[:width - 1] + '…'
+        line = name.ljust(width)
+        if node.time is not None:
+            line += ' {0:>10.3f} ms'.format(node.time)
+            if total:
+                line += ' {0:>6.1f}%'.format(100.0 * node.time / total)
+        if node.hot:
+            line = Fore.RED + Style.BRIGHT + line + Style.RESET_ALL if is_tty else line + ' *'
+        if node.details:
+            line += '  ' + ', '.join(node.details)
+        lines.append(line)
+    return lines
+
+
+def load_plan(value):
+    """
+    Return the plan of the value of an ``EXPLAIN ANALYZE`` result, which is a
+    JSON string on some versions.
+    """
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
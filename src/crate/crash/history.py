@@ -0,0 +1,294 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from prompt_toolkit.history import History
+
+logger = logging.getLogger(__name__)
+
+DB_SUFFIX = '.sqlite'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY,
+        statement TEXT NOT NULL UNIQUE,
+        executed_at REAL NOT NULL,
+        duration REAL,
+        rowcount INTEGER
+    );
+"""
+
+FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+        statement, content='history', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+        INSERT INTO history_fts (rowid, statement)
+        VALUES (new.id, new.statement);
+    END;
+    CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+        INSERT INTO history_fts (history_fts, rowid, statement)
+        VALUES ('delete', old.id, old.statement);
+    END;
+"""
+
+# the trigram tokenizer can only match search strings of 3 or more characters
+MIN_FTS_LENGTH = 3
+
+
+def read_file_history(filename):
+    """
+    Read the entries of a history file written by prompt_toolkit's
+    ``FileHistory``, oldest first.
+    """
+    return [string for _, string in read_timed_file_history(filename)]
+
+
+def read_timed_file_history(filename):
+    """
+    Read the entries of a history file written by prompt_toolkit's
+    ``FileHistory`` as ``(executed_at, string)`` tuples, oldest first.
+
+    ``executed_at`` is the timestamp of the comment written before the entry,
+    or None if it is missing.
+    """
+    entries = []
+    lines = []
+    executed_at = None
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = line.decode('utf-8', errors='replace')
+            if line.startswith('+'):
+                lines.append(line[1:])
+                continue
+            if lines:
+                entries.append((executed_at, ''.join(lines)[:-1]))
+                executed_at = None
+            lines = []
+            if line.startswith('# '):
+                executed_at = _parse_timestamp(line[2:].strip())
+    if lines:
+        entries.append((executed_at, ''.join(lines)[:-1]))
+    return entries
+
+
+def _parse_timestamp(text):
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+class SQLiteHistory(History):
+    """
+    History stored in an SQLite database next to the given history file.
+
+    Every statement is stored once: running it again moves it to the end of
+    the history. Besides the statement, the time of the execution, its
+    duration and the row count are recorded. The statements are indexed with
+    a full text index, which is used to search them.
+
+    If the database does not exist yet, the entries of an existing history
+    file in the format of prompt_toolkit's ``FileHistory`` are imported.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, filename, max_length=10000):
+        super().__init__()
+        self.filename = filename
+        self.path = filename + DB_SUFFIX
+        self.max_length = max_length
+        self.has_fts = False
+        self._stored = set()
+        self._conn = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+        return self._conn
+
+    def _connect(self):
+        base = os.path.dirname(self.path)
+        if base and not os.path.exists(base):
+            os.makedirs(base)
+        is_new = not os.path.exists(self.path)
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None)
+        conn.executescript(SCHEMA)
+        has_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+        try:
+            conn.executescript(FTS_SCHEMA)
+            self.has_fts = True
+            if not has_index:
+                conn.execute("INSERT INTO history_fts (history_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            # FTS5 or its trigram tokenizer (SQLite >= 3.34) is not available
+            logger.debug('Could not create history search index: %s', e)
+        if is_new and os.path.isfile(self.filename):
+            self._import(conn, read_file_history(self.filename))
+        return conn
+
+    def _import(self, conn, strings):
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN')
+            for string in strings[-self.max_length:]:
+                self._insert(conn, string, now)
+        logger.debug('Imported %d history entries from %s', len(strings), self.filename)
+
+    def _insert(self, conn, string, executed_at):
+        # delete and insert instead of updating, so that the entry gets a new
+        # id and becomes the most recent one
+        conn.execute('DELETE FROM history WHERE statement = ?', (string,))
+        conn.execute(
+            'INSERT INTO history (statement, executed_at) VALUES (?, ?)',
+            (string, executed_at))
+
+    async def load(self):
+        """
+        Yield the entries most recent first, fetching them in batches, so the
+        prompt is usable before the whole history is loaded.
+        """
+        if self._loaded:
+            for item in self._loaded_strings:
+                yield item
+            return
+        self._loaded_strings = []
+        for batch in self._batches():
+            self._loaded_strings.extend(batch)
+            self._stored.update(batch)
+            for item in batch:
+                yield item
+            await asyncio.sleep(0)
+        self._loaded = True
+
+    def load_history_strings(self):
+        for batch in self._batches():
+            yield from batch
+
+    def _batches(self):
+        last_id = None
+        while True:
+            with self._lock:
+                if last_id is None:
+                    rows = self.conn.execute(
+                        'SELECT id, statement FROM history ORDER BY id DESC LIMIT ?',
+                        (self.BATCH_SIZE,)).fetchall()
+                else:
+                    rows = self.conn.execute(
+                        'SELECT id, statement FROM history WHERE id < ? '
+                        'ORDER BY id DESC LIMIT ?',
+                        (last_id, self.BATCH_SIZE)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [statement for _, statement in rows]
+
+    def append_string(self, string):
+        try:
+            self._loaded_strings.remove(string)
+        except ValueError:
+            pass
+        self._stored.add(string)
+        super().append_string(string)
+
+    def is_stored(self, string):
+        """Return whether ``string`` is a loaded entry of the history."""
+        return string in self._stored
+
+    def can_search(self, text):
+        """Return whether ``search`` can use the full text index for ``text``."""
+        return self.has_fts and len(text) >= MIN_FTS_LENGTH
+
+    def store_string(self, string):
+        conn = self.conn
+        with self._lock, conn:
+            conn.execute('BEGIN')
+            self._insert(conn, string, time.time())
+            conn.execute(
+                'DELETE FROM history WHERE id <= '
+                '(SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                (self.max_length,))
+
+    def record_result(self, string, duration, rowcount):
+        """
+        Record the duration in milliseconds and the row count of the last
+        execution of ``string``.
+        """
+        with self._lock:
+            self.conn.execute(
+                'UPDATE history SET duration = ?, rowcount = ? WHERE statement = ?',
+                (duration, rowcount, string))
+
+    def search(self, text, limit=None):
+        """
+        Return the entries containing ``text``, ignoring case, most recent
+        first.
+        """
+        if self.can_search(text):
+            # quote the search text so it is matched as a single phrase
+            query = ('SELECT rowid, statement FROM history_fts '
+                     'WHERE history_fts MATCH ? ORDER BY rowid DESC')
+            args = ['"' + text.replace('"', '""') + '"']
+        else:
+            query = ('SELECT id, statement FROM history '
+                     'WHERE instr(lower(statement), ?) ORDER BY id DESC')
+            args = [text.lower()]
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, args).fetchall()
+        return [statement for _, statement in rows]
+
+    def entries(self, limit=None):
+        """
+        Return ``(statement, executed_at, duration, rowcount)`` tuples, most
+        recent first.
+        """
+        query = ('SELECT statement, executed_at, duration, rowcount '
+                 'FROM history ORDER BY id DESC')
+        args = []
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        with self._lock:
+            return self.conn.execute(query, args).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -29,6 +29,13 @@ from prompt_toolkit.keys import Keys
 TAB_WIDTH = 4
 WHITESPACE_RE = re.compile(r'\s+$')
 
+# pastes of at least this many characters skip the per-keystroke processing
+LARGE_PASTE_SIZE = 64 * 1024
+
+
+class LargePaste(str):
+    """Text of a large paste which is executed instead of inserted."""
+
 
 def mk_filter(buf, fn):
     @Condition
@@ -78,3 +85,13 @@ def bind_keys(buf, key_bindings):
     @handle(Keys.Backspace, filter=mk_filter(buf, _line_ends_with_tab))
     def on_backspace(event):
         event.cli.current_buffer.delete_before_cursor(TAB_WIDTH)
+
+    @handle(Keys.BracketedPaste)
+    def on_paste(event):
+        data = event.data.replace('\r\n', '\n').replace('\r', '\n')
+        if len(data) < LARGE_PASTE_SIZE or event.current_buffer is not buf:
+            event.current_buffer.insert_text(data)
+        elif buf.execute_large_paste():
+            event.app.exit(result=LargePaste(data))
+        else:
+            buf.insert_large_paste(data)
@@ -34,9 +34,11 @@ from prompt_toolkit.layout.processors import (
     ConditionalProcessor,
     HighlightSearchProcessor,
 )
-from prompt_toolkit.lexers import PygmentsLexer
+from prompt_toolkit.lexers import DynamicLexer, SimpleLexer
 from prompt_toolkit.widgets import SearchToolbar
 
+from .lexer import IncrementalPygmentsLexer
+
 
 def create_layout(buffer,
                   lexer=None,
@@ -68,7 +70,11 @@ def create_layout(buffer,
             HighlightSearchProcessor(),
             has_focus(SEARCH_BUFFER)),
     ] + (extra_input_processors or [])
-    lexer = PygmentsLexer(lexer, sync_from_start=True)
+    sql_lexer = IncrementalPygmentsLexer(lexer)
+    plain_lexer = SimpleLexer()
+    # large pastes are not highlighted
+    lexer = DynamicLexer(
+        lambda: plain_lexer if getattr(buffer, 'large_paste', False) else sql_lexer)
     sidebar_token = [
         ('class:status-toolbar', "[ctrl+d]"),
         ('class:status-toolbar.text', " Exit")
@@ -143,3 +149,27 @@ def create_layout(buffer,
         )
     ])
     return Layout(HSplit([in_out_area, bottom_toolbar]))
+
+
+def create_full_screen_layout(get_header_tokens, get_body_tokens, get_footer_tokens):
+    """
+    Creates the `Layout` of the full screen views of Crash, e.g. ``\\top``
+
+    +-------------------------------------------+
+    | header_tokens                             |
+    +-------------------------------------------+
+    | body_tokens                               |
+    |                                           |
+    +-------------------------------------------+
+    | footer_tokens                             |
+    +-------------------------------------------+
+    """
+    return Layout(HSplit([
+        Window(FormattedTextControl(get_header_tokens),
+               height=Dimension.exact(1),
+               style='class:bottom-toolbar'),
+        Window(FormattedTextControl(get_body_tokens), wrap_lines=False),
+        Window(FormattedTextControl(get_footer_tokens),
+               height=Dimension.exact(1),
+               style='class:bottom-toolbar'),
+    ]))
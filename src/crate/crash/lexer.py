@@ -0,0 +1,206 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+from prompt_toolkit.lexers import Lexer
+from prompt_toolkit.styles.pygments import pygments_token_to_classname
+from pygments.lexers.sql import PostgresLexer
+from pygments.token import Comment, Error, Punctuation, Text
+
+
+class _StyleCache(dict):
+
+    def __missing__(self, ttype):
+        style = self[ttype] = 'class:' + pygments_token_to_classname(ttype)
+        return style
+
+
+_styles = _StyleCache()
+
+
+def _is_boundary_token(ttype, value, at_boundary):
+    """
+    Return whether the lexer is at a statement boundary after the token.
+
+    Only whitespace and single line comments may follow the ``;`` which ends
+    a statement, anything else starts a new statement or is part of a string
+    or comment spanning multiple lines.
+    """
+    if ttype in Punctuation and value == ';':
+        return True
+    if ttype in Text or ttype in Comment.Single:
+        return at_boundary
+    return False
+
+
+_sql_lexer = PostgresLexer(stripnl=False, stripall=False, ensurenl=False)
+
+
+def ends_with_statement(text):
+    """
+    Return whether ``text`` ends with a complete statement, i.e. with a ``;``
+    which is not part of a string, quoted identifier or comment.
+    """
+    at_boundary = False
+    for _, ttype, value in _sql_lexer.get_tokens_unprocessed(text):
+        if ttype in Error:
+            # e.g. a dollar quoted string which is not closed yet
+            return False
+        at_boundary = _is_boundary_token(ttype, value, at_boundary)
+    return at_boundary
+
+
+class _LexState:
+    """
+    Lexed lines of a single document.
+
+    ``boundaries[i]`` is true if the line ``i`` ends at a statement boundary,
+    so lexing can restart at line ``i + 1``. There are no boundaries after an
+    error token, as it may turn into e.g. a dollar quoted string once the
+    closing quote is typed further down.
+    """
+
+    def __init__(self, lines, fragments=None, boundaries=None):
+        self.lines = lines
+        self.fragments = fragments or []
+        self.boundaries = boundaries or []
+        self.tokens = None
+        self.line = []
+        self.at_boundary = True
+        self.after_error = False
+        # lines that can be copied from the previous state once lexing reaches
+        # a statement boundary within the unchanged end of the document
+        self.previous = None
+        self.reusable_from = len(lines)
+        self.offset = 0
+
+
+class IncrementalPygmentsLexer(Lexer):
+    """
+    Lexer for the input buffer which keeps the lexed lines of the previous
+    document.
+
+    Lines before the last statement boundary preceding the first changed line
+    are reused. Lexing restarts at that boundary and stops as soon as it
+    reaches a statement boundary within the unchanged end of the document,
+    whose lines are reused as well. Lines are only lexed when requested, so
+    the cost of a redraw depends on the edit and the visible lines, not on
+    the size of the buffer.
+    """
+
+    def __init__(self, pygments_lexer_cls):
+        self.pygments_lexer = pygments_lexer_cls(stripnl=False, stripall=False, ensurenl=False)
+        self._state = _LexState([])
+
+    def lex_document(self, document):
+        state = self._state = self._next_state(self._state, document.lines)
+
+        def get_line(lineno):
+            while len(state.fragments) <= lineno and self._lex_line(state):
+                pass
+            try:
+                return state.fragments[lineno]
+            except IndexError:
+                return []
+        return get_line
+
+    def _next_state(self, previous, lines):
+        old = previous.lines
+        lexed = len(previous.fragments)
+        if lines == old:
+            return previous
+        start, limit = 0, min(lexed, len(lines))
+        while start < limit and old[start] == lines[start]:
+            start += 1
+        while start > 0 and not previous.boundaries[start - 1]:
+            start -= 1
+        state = _LexState(lines, previous.fragments[:start], previous.boundaries[:start])
+
+        unchanged = 0
+        limit = min(len(old), len(lines)) - start
+        while unchanged < limit and old[-1 - unchanged] == lines[-1 - unchanged]:
+            unchanged += 1
+        if unchanged:
+            state.previous = previous
+            state.reusable_from = len(lines) - unchanged
+            state.offset = len(old) - len(lines)
+        self._start_tokens(state)
+        return state
+
+    def _start_tokens(self, state):
+        lineno = len(state.fragments)
+        state.tokens = self.pygments_lexer.get_tokens_unprocessed('\n'.join(state.lines[lineno:]))
+        state.line = []
+        state.at_boundary = True
+        state.after_error = False
+
+    def _lex_line(self, state):
+        """Lex the next line of ``state``; return false if there is none."""
+        count = len(state.fragments)
+        if count >= len(state.lines):
+            return False
+        for _, ttype, value in state.tokens:
+            style = _styles[ttype]
+            if ttype in Error:
+                state.after_error = True
+            *complete, rest = value.split('\n')
+            for part in complete:
+                if part:
+                    state.line.append((style, part))
+                state.at_boundary = _is_boundary_token(ttype, part, state.at_boundary)
+                if self._end_line(state):
+                    # lexing continues at the next line of the new text
+                    return True
+            if rest:
+                state.line.append((style, rest))
+                state.at_boundary = _is_boundary_token(ttype, rest, state.at_boundary)
+            if len(state.fragments) > count:
+                return True
+        # the last line does not end with a newline
+        self._end_line(state)
+        return True
+
+    def _end_line(self, state):
+        """
+        Finish the current line; return true if lexing was restarted because
+        the following lines were reused.
+        """
+        state.fragments.append(state.line)
+        state.boundaries.append(state.at_boundary and not state.after_error)
+        state.line = []
+        if state.previous is not None and state.boundaries[-1] \
+                and len(state.fragments) >= state.reusable_from:
+            return self._reuse_previous(state)
+        return False
+
+    def _reuse_previous(self, state):
+        previous = state.previous
+        start = len(state.fragments) + state.offset
+        if not 0 < start <= len(previous.boundaries) or not previous.boundaries[start - 1]:
+            return False
+        end = len(previous.fragments)
+        while end > start and not previous.boundaries[end - 1]:
+            end -= 1
+        state.fragments.extend(previous.fragments[start:end])
+        state.boundaries.extend(previous.boundaries[start:end])
+        state.previous = None
+        self._start_tokens(state)
+        return True
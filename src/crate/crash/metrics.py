@@ -0,0 +1,137 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# longest normalized statement which is written to a record
+MAX_STATEMENT_LENGTH = 1000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+_STOP = object()
+
+
+def normalize(statement):
+    """
+    Return ``statement`` with its string and number literals replaced by
+    ``?`` and its whitespace collapsed, so statements which only differ in
+    their values are the same.
+    """
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    return _WHITESPACE.sub(' ', statement).strip().rstrip(';')
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def create_record(statement, kind, timer):
+    """
+    Return the metrics of a statement, which ran within ``timer``, as a dict.
+    """
+    normalized = normalize(statement)
+    failed = timer.error is not None
+    return {
+        'fingerprint': fingerprint(normalized),
+        'statement': normalized[:MAX_STATEMENT_LENGTH],
+        'type': kind,
+        'host': timer.host,
+        'started': datetime.fromtimestamp(timer.started, timezone.utc).isoformat(),
+        'wall_ms': round(timer.wall * 1000.0, 3),
+        'server_ms': None if failed else round(timer.server * 1000.0, 3),
+        'rowcount': None if failed else timer.rowcount,
+        'bytes_sent': timer.bytes_sent,
+        'bytes_received': timer.bytes_received,
+        'retries': timer.retries,
+        'error': timer.error,
+    }
+
+
+class MetricsWriter:
+    """
+    Append the metrics of every executed statement to the file ``path``,
+    one JSON record per line.
+
+    ``record`` only queues the statement: a background thread builds the
+    records and writes them in batches, so the statements don't wait for
+    the file. ``close`` writes the remaining records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # fail early if the file cannot be written
+        self._file = open(path, 'a', encoding='utf-8')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='crash-metrics', daemon=True)
+        self._thread.start()
+
+    def record(self, expression, statement, timer):
+        """
+        Queue the metrics of a statement: its parsed ``expression``, its text
+        and the ``StatementTimer`` it ran in.
+        """
+        self._queue.put((expression, statement, timer))
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        from .command import stmt_type
+        stopped = False
+        while not stopped:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for item in items:
+                if item is _STOP:
+                    stopped = True
+                    continue
+                expression, statement, timer = item
+                try:
+                    kind = stmt_type(expression)
+                except IndexError:
+                    kind = None
+                record = create_record(statement, kind, timer)
+                lines.append(json.dumps(record) + '\n')
+            try:
+                self._file.write(''.join(lines))
+                self._file.flush()
+            except OSError as e:
+                logger.warning('Could not write metrics to %s: %s', self.path, e)
+        self._file.close()
@@ -1,18 +1,12 @@
 import csv
 import json
+import re
 import subprocess
 import sys
 
 from colorama import Fore, Style
-from pygments import highlight
-from pygments.formatters import TerminalFormatter
-from pygments.lexers.data import JsonLexer
-from tabulate import tabulate
-
-from .tabulate import monkeypatch as monkeypatch_tabulate
-
-monkeypatch_tabulate()
 
+from .results import SpilledRows
 
 if sys.version_info[:2] == (2, 6):
     OrderedDict = dict
@@ -24,6 +18,21 @@ NULL = 'NULL'
 TRUE = 'TRUE'
 FALSE = 'FALSE'
 
+# number of rows which are formatted at once if the rows of a result are
+# spilled to disk
+CHUNK_SIZE = 1000
+
+
+def _get_tabulate():
+    """
+    Import tabulate and register the ``cratedb`` table format on first use.
+    """
+    import tabulate
+    if 'cratedb' not in tabulate.multiline_formats:
+        from .tabulate import monkeypatch
+        monkeypatch()
+    return tabulate.tabulate
+
 
 def _val_len(v):
     if not v:
@@ -45,12 +54,100 @@ def _transform_field(field):
         return field
 
 
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_NO_VALUE = object()
+
+
+def _align_row(rows):
+    """
+    Return a row which makes tabulate format any part of ``rows`` with the
+    column types, widths and decimal alignment it uses for all of them, or
+    None if there is no such row.
+
+    The row has the most generic type of every column, its most decimals and
+    the width of its widest value after the decimal alignment. If any value
+    spans several lines, so does the row, as tabulate formats the rows of
+    such a table differently.
+    """
+    import tabulate as t
+    types = None
+    multiline = False
+    for row in rows:
+        if types is None:
+            types = [bool] * len(row)
+        for i, value in enumerate(map(_transform_field, row)):
+            if isinstance(value, str) and t._ansi_codes.search(value):
+                # the formatting of all values depends on escape sequences
+                return None
+            types[i] = t._more_generic(types[i], t._type(value))
+    if types is None:
+        return None
+    # the widest value per number of decimals of every column
+    widths = [{} for _ in types]
+    for row in rows:
+        for i, value in enumerate(map(_transform_field, row)):
+            text = t._format(value, types[i], '', missingval=NULL, has_invisible=False)
+            if types[i] not in (int, float):
+                # only numbers keep their surrounding whitespace
+                text = text.strip()
+            lines = re.split('[\r\n]', text)
+            multiline = multiline or len(lines) > 1
+            width = max(t._visible_width(line) for line in lines)
+            points = t._afterpoint(text)
+            if width > widths[i].get(points, -1):
+                widths[i][points] = width
+    row = []
+    for type_, column in zip(types, widths):
+        points = max(column)
+        if type_ in (int, float):
+            # decimal alignment pads the values with fewer decimals
+            width = max(w + points - p for p, w in column.items())
+        else:
+            width = max(column.values())
+        value = _align_value(type_, width, points)
+        if value is _NO_VALUE or t._more_generic(type_, t._type(value)) is not type_:
+            return None
+        row.append(value)
+    if multiline:
+        carriers = [i for i, v in enumerate(row) if types[i] is str and v]
+        if not carriers:
+            return None
+        row[carriers[0]] += '\n' + row[carriers[0]]
+    return row
+
+
+def _align_value(type_, width, points):
+    if type_ is str:
+        return 'x' * width
+    if type_ is int and width > 0:
+        return '1' * width
+    if type_ is float and width > points >= 0:
+        return '1' * (width - points - 1) + '.' + '1' * points
+    if type_ is float and points == -1 and width == 3:
+        # a column of NaN, which has no decimals
+        return float('nan')
+    if type_ is bool and width == len(NULL):
+        # a column without any value
+        return None
+    return _NO_VALUE
+
+
 class OutputWriter(object):
 
     def __init__(self, writer, is_tty):
         self.is_tty = is_tty
-        self._json_lexer = JsonLexer()
-        self._formatter = TerminalFormatter()
+        # pygments is only imported to highlight JSON on a tty
+        self._highlighter = None
         self.writer = writer
         self.pager = None
         self._output_format = 'tabular'
@@ -81,9 +178,18 @@ class OutputWriter(object):
     def to_json_str(self, obj, **kwargs):
         json_str = json.dumps(obj, indent=2, **kwargs)
         if self.is_tty:
-            return highlight(json_str, self._json_lexer, self._formatter).rstrip('\n')
+            return self._highlight(json_str).rstrip('\n')
         return json_str
 
+    def _highlight(self, json_str):
+        if self._highlighter is None:
+            from pygments import highlight
+            from pygments.formatters import TerminalFormatter
+            from pygments.lexers.data import JsonLexer
+            self._highlighter = (highlight, JsonLexer(), TerminalFormatter())
+        highlight, lexer, formatter = self._highlighter
+        return highlight(json_str, lexer, formatter)
+
     def write(self, result):
         output_f = self._formats[self.output_format]
         if self.pager:
@@ -110,16 +216,54 @@ class OutputWriter(object):
                     self.writer.write(line)
             self.writer.write('\n')
 
+    def _json_part(self, json_str):
+        if self.is_tty:
+            # the lexer drops leading newlines
+            text = json_str.lstrip('\n')
+            newlines = json_str[:len(json_str) - len(text)]
+            return newlines + self._highlight(text).rstrip('\n')
+        return json_str
+
+    def _json_array(self, items, indent=0):
+        """
+        Format ``items`` like ``to_json_str`` formats a list nested
+        ``indent`` spaces deep, a chunk of items at a time.
+        """
+        padding = ' ' * (indent + 2)
+        empty = True
+        for chunk in _chunks(items):
+            yield self._json_part(('[\n' if empty else ',\n') + ',\n'.join(
+                padding + json.dumps(item, indent=2).replace('\n', '\n' + padding)
+                for item in chunk))
+            empty = False
+        yield self._json_part('[]' if empty else '\n' + ' ' * indent + ']')
+
     def raw(self, result):
         duration = result.duration
-        yield self.to_json_str(dict(
+        duration = duration > -1 and float(duration) / 1000.0 or duration
+        if isinstance(result.rows, SpilledRows):
+            return self._raw_chunks(result, duration)
+        return iter([self.to_json_str(dict(
             rows=result.rows,
             cols=result.cols,
             rowcount=result.rowcount,
-            duration=duration > -1 and float(duration) / 1000.0 or duration,
-        ))
+            duration=duration,
+        ))])
+
+    def _raw_chunks(self, result, duration):
+        yield self._json_part('{\n  "rows": ')
+        yield from self._json_array(result.rows, indent=2)
+        # the other keys follow the rows
+        yield self._json_part(',' + json.dumps(dict(
+            cols=result.cols,
+            rowcount=result.rowcount,
+            duration=duration,
+        ), indent=2)[1:])
 
     def tabular(self, result):
+        if isinstance(result.rows, SpilledRows):
+            return self._tabular_chunks(result)
+        tabulate = _get_tabulate()
         rows = [list(map(_transform_field, row)) for row in result.rows]
         return tabulate(rows,
                         headers=result.cols,
@@ -129,6 +273,40 @@ class OutputWriter(object):
                         stralign="left",
                         missingval=NULL)
 
+    def _tabular_chunks(self, result):
+        """
+        Format the rows of ``result`` like ``tabular`` a chunk at a time, so
+        only a chunk of formatted rows is in memory.
+
+        A row with the widest values of all rows is formatted with every
+        chunk and removed again, so all chunks have the same column widths.
+        """
+        tabulate = _get_tabulate()
+        align_row = _align_row(result.rows)
+        if align_row is None:
+            yield self.tabular(result._replace(rows=list(result.rows)))
+            return
+        header_lines = 3 + max(c.count('\n') for c in result.cols) if result.cols else 3
+        # the align row and the bottom border are not part of a chunk
+        tail = 2 + sum(str(v).count('\n') for v in align_row)
+        for i, chunk in enumerate(_chunks(result.rows)):
+            rows = [list(map(_transform_field, row)) for row in chunk]
+            rows.append(align_row)
+            lines = tabulate(rows,
+                             headers=result.cols,
+                             tablefmt="cratedb",
+                             floatfmt="",
+                             numalign="decimal",
+                             stralign="left",
+                             missingval=NULL).split('\n')
+            if i == 0:
+                yield '\n'.join(lines[:header_lines]) + '\n'
+            body = lines[header_lines:-tail]
+            if body:
+                yield '\n'.join(body) + '\n'
+            bottom = lines[-1]
+        yield bottom
+
     def mixed(self, result):
         padding = max_col_len = max(len(c) for c in result.cols)
         if self.is_tty:
@@ -144,8 +322,10 @@ class OutputWriter(object):
             yield row_delimiter + '\n'
 
     def json(self, result):
+        if isinstance(result.rows, SpilledRows):
+            return self._json_array(OrderedDict(zip(result.cols, x)) for x in result.rows)
         obj = [OrderedDict(zip(result.cols, x)) for x in result.rows]
-        yield self.to_json_str(obj)
+        return iter([self.to_json_str(obj)])
 
     def csv(self, result):
         wr = csv.writer(self.writer, doublequote=False, escapechar='\\', quotechar="'")
@@ -173,7 +353,7 @@ class OutputWriter(object):
         rows = (json.dumps(dict(zip(result.cols, x))) for x in result.rows)
         for row in rows:
             if self.is_tty:
-                yield highlight(row, self._json_lexer, self._formatter)
+                yield self._highlight(row)
             else:
                 yield row + '\n'
 
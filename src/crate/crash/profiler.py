@@ -0,0 +1,151 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import cProfile
+import os
+import pstats
+from collections import Counter, defaultdict
+
+PROFILE_FILE_NAME = 'crash.prof'
+
+# paths through the call graph with less time are left out of the stacks
+MIN_STACK_TIME = 1e-6
+
+_PROFILER_DISABLE = "<method 'disable' of '_lsprof.Profiler' objects>"
+
+
+def _label(func):
+    filename, lineno, name = func
+    if filename == '~':
+        # built-in functions
+        return name.replace(';', ',')
+    return '{0} ({1}:{2})'.format(name, os.path.basename(filename), lineno).replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """
+    Return the time in seconds of every call stack in ``stats``, keyed by the
+    stack in the collapsed format of flame graph tools: the frames from the
+    root to the leaf, separated by semicolons.
+
+    cProfile only records the callers of a function, not complete stacks, so
+    the time of a function is split between the stacks leading to it in
+    proportion to the time of the calls of each caller.
+    """
+    entries = stats.stats
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees[caller].append((func, cumulative))
+    stacks = Counter()
+
+    def walk(func, stack, seen, time):
+        _, _, own, cumulative, _ = entries[func]
+        if cumulative <= 0:
+            return
+        share = time / cumulative
+        if own * share > 0:
+            stacks[stack] += own * share
+        for callee, edge in callees[func]:
+            # recursive calls are already accounted for by their caller
+            if callee in seen or edge * share < MIN_STACK_TIME:
+                continue
+            walk(callee, stack + ';' + _label(callee), seen | {callee}, edge * share)
+
+    for func, (_, _, _, cumulative, callers) in entries.items():
+        # the profiler itself shows up as a root, stopping the profile
+        if not callers and func[2] != _PROFILER_DISABLE:
+            walk(func, _label(func), {func}, cumulative)
+    return stacks
+
+
+class StatementProfiler:
+    """
+    Profile the processing of statements with cProfile: parsing, execution,
+    fetching and writing the result.
+
+    The profiles are aggregated per statement type. ``dump`` writes them to
+    ``path``, and the profile of each type next to it, e.g. to
+    ``crash.SELECT.prof``. If ``stacks`` is true, the collapsed stacks of
+    every profile are written as well, e.g. to ``crash.SELECT.folded``, which
+    can be turned into flame graphs.
+    """
+
+    def __init__(self, path=PROFILE_FILE_NAME, stacks=False):
+        self.path = path
+        self.stacks = stacks
+        self.statements = Counter()
+        self._stats = {}
+
+    def process_sql(self, cmd, text):
+        """
+        Parse and execute the statements of ``text`` with ``cmd``, profiling
+        each of them. The parsing is accounted to the first statement.
+        """
+        from .command import stmt_type
+        profile = cProfile.Profile()
+        statements = profile.runcall(cmd._parse_sql, text)
+        for statement in statements:
+            if profile is None:
+                profile = cProfile.Profile()
+            profile.runcall(cmd._exec_and_print, statement)
+            try:
+                kind = stmt_type(statement)
+            except IndexError:
+                # a statement without any word
+                kind = 'OTHER'
+            self.add(kind, profile)
+            profile = None
+
+    def add(self, kind, profile):
+        self.statements[kind] += 1
+        self._stats.setdefault(kind, pstats.Stats()).add(profile)
+
+    def dump(self):
+        """
+        Write the profiles and return the paths of the written files.
+        """
+        if not self._stats:
+            return []
+        root, ext = os.path.splitext(self.path)
+        profiles = [(kind, '{0}.{1}{2}'.format(root, kind, ext or '.prof'), stats)
+                    for kind, stats in sorted(self._stats.items())]
+        total = pstats.Stats()
+        total.add(*(stats for _, _, stats in profiles))
+        profiles.insert(0, (None, self.path, total))
+        paths = []
+        for kind, path, stats in profiles:
+            stats.dump_stats(path)
+            paths.append(path)
+            if self.stacks:
+                path = os.path.splitext(path)[0] + '.folded'
+                with open(path, 'w') as f:
+                    for stack, time in sorted(collapsed_stacks(stats).items()):
+                        # flame graph tools expect integer sample counts
+                        f.write('{0} {1}\n'.format(stack, max(int(time * 1e6), 1)))
+                paths.append(path)
+        return paths
+
+    def summary(self):
+        return ', '.join('{0} {1}'.format(count, kind)
+                         for kind, count in sorted(self.statements.items()))
@@ -20,18 +20,20 @@
 # with Crate these terms will supersede the license and you may use the
 # software solely pursuant to the terms of the relevant commercial agreement.
 
+import io
 import os
 import re
+import threading
+from collections import Counter
 from getpass import getpass
 
 from prompt_toolkit import Application
 from prompt_toolkit.application import get_app
 from prompt_toolkit.buffer import Buffer
 from prompt_toolkit.completion import Completer, Completion
+from prompt_toolkit.document import Document
 from prompt_toolkit.enums import DEFAULT_BUFFER, EditingMode
 from prompt_toolkit.filters import Condition, HasFocus, IsDone
-from prompt_toolkit.formatted_text import PygmentsTokens
-from prompt_toolkit.history import FileHistory
 from prompt_toolkit.key_binding import KeyBindings, merge_key_bindings
 from prompt_toolkit.key_binding.bindings.open_in_editor import (
     load_open_in_editor_bindings,
@@ -42,6 +44,7 @@ from prompt_toolkit.layout.processors import (
     HighlightMatchingBracketProcessor,
 )
 from prompt_toolkit.output import create_output
+from prompt_toolkit.search import SearchDirection
 from prompt_toolkit.styles.pygments import style_from_pygments_cls
 from pygments.lexers.sql import PostgresLexer
 from pygments.style import Style
@@ -58,9 +61,14 @@ from pygments.token import (
 
 from crate.client.exceptions import ConnectionError, ProgrammingError
 
+from .cache import MetadataCache
+from .catalog import Catalog, PrefixTrie
 from .commands import Command
-from .keybinding import bind_keys
+from .completion import BackgroundCompleter
+from .history import SQLiteHistory
+from .keybinding import LargePaste, bind_keys
 from .layout import create_layout
+from .toolbar import HealthPoller, Toolbar
 
 MAX_HISTORY_LENGTH = 10000
 
@@ -93,23 +101,6 @@ class CrateStyle(Style):
     }
 
 
-class TruncatedFileHistory(FileHistory):
-
-    def __init__(self, filename, max_length=1000):
-        super().__init__(filename)
-        base = os.path.dirname(filename)
-        if not os.path.exists(base):
-            os.makedirs(base)
-        if not os.path.exists(filename):
-            with open(filename, 'a'):
-                os.utime(filename, None)
-        self.max_length = max_length
-
-    def append(self, string):
-        self.strings = self.strings[:max(0, self.max_length - 1)]
-        super().append(string)
-
-
 class SQLCompleter(Completer):
 
     fallback_keywords = [
@@ -150,17 +141,105 @@ class SQLCompleter(Completer):
         "values", "view", "when", "where", "window", "with", "without", "work",
         "write", "year", "zone"]
 
-    def __init__(self, cmd):
-        self.cmd = cmd
-        self.keywords = self._populate_keywords()
+    # names of tables, columns and nested object columns, e.g. doc.t1, obj['child']
+    NAME_RE = re.compile(r"[\w.\[\]']+$")
+
+    CATALOG_COMPLETIONS_LIMIT = 100
+
+    WORD_RE = re.compile(r'\w+')
+
+    MAX_USAGE_ENTRIES = 10000
 
-    def _populate_keywords(self):
+    def __init__(self, cmd, catalog=None, cache=None):
+        self.cmd = cmd
+        self.catalog = catalog
+        self.cache = cache
+        self.usage = Counter()
+        self._revalidation = None
+        if cache is None:
+            self.keywords = self._populate_keywords()
+        else:
+            # start from the cached keywords and fetch the current ones in
+            # the background, so the server round-trip does not delay the prompt
+            self.keywords = cache.get('keywords') or self.fallback_keywords
+            self._revalidation = threading.Thread(target=self._revalidate_keywords,
+                                                  name='crash-keywords',
+                                                  daemon=True)
+            self._revalidation.start()
+
+    @property
+    def keywords(self):
+        return self._keywords
+
+    @keywords.setter
+    def keywords(self, keywords):
+        index = PrefixTrie()
+        for keyword in keywords:
+            index.add(keyword)
+        self._keyword_index = index
+        self.keyword_set = frozenset(keywords)
+        self._keywords = keywords
+
+    def _populate_keywords(self, cursor=None):
+        cursor = cursor or self.cmd.cursor
         try:
-            self.cmd.cursor.execute("SELECT word FROM pg_catalog.pg_get_keywords()")
-            return [i[0] for i in self.cmd.cursor.fetchall()]
+            cursor.execute("SELECT word FROM pg_catalog.pg_get_keywords()")
+            return [i[0] for i in cursor.fetchall()]
         except (ProgrammingError, ConnectionError):
             return self.fallback_keywords
 
+    def _revalidate_keywords(self):
+        try:
+            cursor = self.cmd.connection.cursor()
+        except ProgrammingError:
+            return
+        try:
+            keywords = self._populate_keywords(cursor)
+        finally:
+            cursor.close()
+        if keywords is not self.fallback_keywords:
+            self.keywords = keywords
+            self.cache.set('keywords', keywords)
+
+    def learn(self, text):
+        """Count the words of an executed statement to rank completions by recent use."""
+        self.usage.update(self.WORD_RE.findall(text.lower()))
+        if len(self.usage) > self.MAX_USAGE_ENTRIES:
+            self.usage = Counter(dict(self.usage.most_common(self.MAX_USAGE_ENTRIES // 2)))
+
+    def _rank(self, name):
+        return (-self.usage[name.lower()], len(name), name)
+
+    def close(self):
+        if self.catalog is not None:
+            self.catalog.stop()
+
+    def complete_keyword(self, word):
+        """
+        Return the keywords starting with ``word``, most used and shortest first.
+
+        If fuzzy completion is enabled, keywords containing the characters of
+        ``word`` in the same order follow, ranked by how close together the
+        characters appear and how early the match starts.
+        """
+        word = word.lower()
+        matches = sorted((kw for kw, _ in self._keyword_index.complete(word)), key=self._rank)
+        if not self.cmd.should_fuzzy_complete():
+            return matches
+        pattern = re.compile('.*?'.join(map(re.escape, word)))
+        scored = []
+        for keyword in self._keywords:
+            if keyword.startswith(word):
+                continue
+            match = pattern.search(keyword)
+            if match:
+                scored.append((match.end() - match.start() - len(word),
+                               match.start(),
+                               self._rank(keyword),
+                               keyword))
+        scored.sort()
+        return matches + [keyword for *_, keyword in scored]
+
     def get_command_completions(self, line):
         if ' ' not in line:
             cmd = line[1:]
@@ -183,14 +262,51 @@ class SQLCompleter(Completer):
             return
         # start autocomplete on 3rd character for non-command keys
         if len(word_before_cursor) >= 3:
-            for keyword in self.keywords:
-                if keyword.startswith(word_before_cursor.lower()):
-                    yield Completion(keyword.upper(), -len(word_before_cursor))
+            for keyword in self.complete_keyword(word_before_cursor):
+                yield Completion(keyword.upper(), -len(word_before_cursor))
+        if self.catalog is not None:
+            yield from self.get_catalog_completions(document)
+
+    def get_name_before_cursor(self, document):
+        """Return the (qualified) name before the cursor if it is long enough to complete."""
+        if document.text.startswith('\\'):
+            return None
+        match = self.NAME_RE.search(document.current_line_before_cursor)
+        name = match and match.group(0)
+        if not name or len(name) < 3:
+            return None
+        return name
+
+    def get_catalog_completions(self, document):
+        name = self.get_name_before_cursor(document)
+        if not name:
+            return
+        matches = sorted(self.catalog.complete(name, limit=self.CATALOG_COMPLETIONS_LIMIT),
+                         key=lambda match: self._rank(match[0]))
+        for value, kind in matches:
+            yield Completion(value, -len(name), display_meta=kind)
+
+
+def _ends_with_semicolon(text):
+    # only look at the end of the text, which may be a large paste
+    i = len(text) - 1
+    while i >= 0 and text[i].isspace():
+        i -= 1
+    return i >= 0 and text[i] == ';'
 
 
 class CrashBuffer(Buffer):
+    """
+    Input buffer of the REPL.
+
+    Text inserted by ``insert_large_paste`` sets ``large_paste`` until the
+    buffer is reset, which turns off the processing done on every change:
+    capitalization, completion while typing and syntax highlighting.
+    """
 
-    def __init__(self, *args, **kwargs):
+    SEARCH_INDEX_LIMIT = 500
+
+    def __init__(self, *args, execute_large_paste=lambda: False, **kwargs):
 
         @Condition
         def is_multiline():
@@ -199,45 +315,151 @@ class CrashBuffer(Buffer):
                 return False
             if doc.text.startswith('\\'):
                 return False
-            return not doc.text.rstrip().endswith(';')
+            return not _ends_with_semicolon(doc.text)
 
+        self.execute_large_paste = execute_large_paste
         super().__init__(*args, multiline=is_multiline, **kwargs)
 
+    def reset(self, *args, **kwargs):
+        self.large_paste = False
+        super().reset(*args, **kwargs)
+
+    def insert_large_paste(self, data):
+        self.large_paste = True
+        self.insert_text(data, fire_event=False)
+
+    def _search(self, search_state, include_current_position=False, count=1):
+        """
+        Search like ``Buffer._search``, but only examine the history entries
+        which the full text index of the history reports to contain the text.
+        Lines which are not stored in the history, e.g. edited entries, are
+        always examined.
+
+        Text contained in many entries is searched for without the index, as
+        a nearby entry will match anyway.
+        """
+        text = search_state.text
+        can_search = getattr(self.history, 'can_search', None)
+        if not (can_search and can_search(text)):
+            return super()._search(search_state, include_current_position, count)
+        matches = set(self.history.search(text, limit=self.SEARCH_INDEX_LIMIT))
+        if len(matches) >= self.SEARCH_INDEX_LIMIT:
+            return super()._search(search_state, include_current_position, count)
+        ignore_case = search_state.ignore_case()
+        forward = search_state.direction == SearchDirection.FORWARD
+        lines = self._working_lines
+
+        def is_candidate(line):
+            return line in matches or not self.history.is_stored(line)
+
+        def search_once(working_index, document):
+            if forward:
+                new_index = document.find(text,
+                                          include_current_position=include_current_position,
+                                          ignore_case=ignore_case)
+                if new_index is not None:
+                    return working_index, Document(document.text,
+                                                   document.cursor_position + new_index)
+                for i in range(working_index + 1, len(lines) + 1):
+                    i %= len(lines)
+                    if not is_candidate(lines[i]):
+                        continue
+                    new_index = Document(lines[i], 0).find(
+                        text, include_current_position=True, ignore_case=ignore_case)
+                    if new_index is not None:
+                        return i, Document(lines[i], new_index)
+            else:
+                new_index = document.find_backwards(text, ignore_case=ignore_case)
+                if new_index is not None:
+                    return working_index, Document(document.text,
+                                                   document.cursor_position + new_index)
+                for i in range(working_index - 1, -2, -1):
+                    i %= len(lines)
+                    if not is_candidate(lines[i]):
+                        continue
+                    new_index = Document(lines[i], len(lines[i])).find_backwards(
+                        text, ignore_case=ignore_case)
+                    if new_index is not None:
+                        return i, Document(lines[i], len(lines[i]) + new_index)
+            return None
+
+        working_index = self.working_index
+        document = self.document
+        for _ in range(count):
+            result = search_once(working_index, document)
+            if result is None:
+                return None
+            working_index, document = result
+        return working_index, document.cursor_position
+
 
 class Capitalizer:
+    """
+    Capitalize SQL keywords while typing.
+
+    Only the text inserted since the previous call is examined, widened to
+    the start of the token it was inserted into. Text which was not seen
+    before, e.g. after the document was replaced, is examined up to the
+    cursor.
+    """
 
-    KEYWORD_RE = r'(?:"\w+)|(?:\'\w+)|\w+'
+    KEYWORD_RE = re.compile(r'(?:"\w+)|(?:\'\w+)|\w+')
 
     def __init__(self, cmd, completer):
         self.cmd = cmd
+        # position and original spelling of the last capitalized token
         self.last_changed = None
         self.completer = completer
+        self._text = ''
 
     def apply_capitalization(self, buffer):
-        if not self.cmd.should_autocapitalize():
-            return
-
-        current_line = buffer.document.text
+        document = buffer.document
+        text = document.text
 
-        if current_line.startswith('\\'):
+        if not self.cmd.should_autocapitalize() or text.startswith('\\') \
+                or getattr(buffer, 'large_paste', False):
+            self._text = text
             return
 
-        cursor_position = buffer.document.cursor_position
-
-        if self.last_changed and self.is_prefix(current_line[:cursor_position].lower(), self.last_changed.lower()):
-            diff = len(self.last_changed) - len(current_line)
-            current_line = self.last_changed + current_line[diff:]
-
-        new_line = re.sub(self.KEYWORD_RE, self.keyword_replacer, current_line[:cursor_position])
-
-        if new_line != buffer.document.text:
-            buffer.delete_before_cursor(cursor_position)
-            buffer.delete(len(new_line) - cursor_position)
-            buffer.insert_text(new_line, overwrite=False, move_cursor=True, fire_event=False)
-            self.last_changed = current_line[:cursor_position]
+        cursor_position = document.cursor_position
+        start = self._token_start(text, self._edit_start(text, cursor_position))
+        current = text[start:cursor_position]
+
+        if self.last_changed and self.last_changed[0] == start:
+            original = self.last_changed[1]
+            if self.is_prefix(current.lower(), original.lower()):
+                current = original + current[len(original):]
+
+        new_text = self.KEYWORD_RE.sub(self.keyword_replacer, current)
+
+        if new_text != text[start:cursor_position]:
+            buffer.delete_before_cursor(cursor_position - start)
+            buffer.insert_text(new_text, overwrite=False, move_cursor=True, fire_event=False)
+            self.last_changed = (start, current)
+        self._text = buffer.text
+
+    def _edit_start(self, text, cursor_position):
+        """
+        Return the position where the text inserted since the previous call
+        starts, or 0 if the text changed in any other way.
+        """
+        previous = self._text
+        start = cursor_position - (len(text) - len(previous))
+        if start < 0 or start > cursor_position:
+            return 0
+        if text[:start] != previous[:start] or text[cursor_position:] != previous[start:]:
+            return 0
+        return start
+
+    def _token_start(self, text, position):
+        while position > 0 and (text[position - 1].isalnum() or text[position - 1] == '_'):
+            position -= 1
+        if position > 0 and text[position - 1] in '"\'':
+            position -= 1
+        return position
 
     def keyword_replacer(self, match):
-        if match.group(0).lower() in self.completer.keywords:
+        if match.group(0).lower() in self.completer.keyword_set:
             return match.group(0).upper()
         else:
             return match.group(0)
@@ -246,56 +468,51 @@ class Capitalizer:
         return string.startswith(prefix) and string != prefix
 
 
-def create_buffer(cmd, history_file):
+def create_buffer(cmd, history_file, cache_dir=None):
     def accept(buff):
+        completer.learn(buff.document.text)
         get_app().exit(result=buff.document.text)
         return True
 
-    history = TruncatedFileHistory(history_file, max_length=MAX_HISTORY_LENGTH)
-    completer = SQLCompleter(cmd)
+    history = SQLiteHistory(history_file, max_length=MAX_HISTORY_LENGTH)
+    cache = None
+    if cache_dir and cmd.is_conn_available():
+        cache = MetadataCache.for_shell(cache_dir, cmd)
+    catalog = Catalog(cmd, cache=cache)
+    catalog.start()
+    completer = SQLCompleter(cmd, catalog=catalog, cache=cache)
+    threading.Thread(target=_learn_from_history,
+                     args=(completer, history),
+                     name='crash-usage',
+                     daemon=True).start()
     buffer = CrashBuffer(
         name=DEFAULT_BUFFER,
         history=history,
-        completer=completer,
+        completer=BackgroundCompleter(completer, lookup=catalog.lookup),
         enable_history_search=True,
         accept_handler=accept,
         on_text_insert=Capitalizer(cmd, completer).apply_capitalization,
-        tempfile_suffix=lambda: '.sql'
+        tempfile_suffix=lambda: '.sql',
+        execute_large_paste=cmd.should_execute_large_paste,
     )
-    buffer.complete_while_typing = lambda cli=None: cmd.should_autocomplete()
+    buffer.complete_while_typing = \
+        lambda cli=None: cmd.should_autocomplete() and not buffer.large_paste
     return buffer
 
 
-def get_toolbar_tokens(cmd):
-    return _get_toolbar_tokens(cmd.is_conn_available(),
-                               cmd.connection.client.active_servers,
-                               cmd.connect_info)
-
-
-def _get_toolbar_tokens(is_connected, servers, info):
-    if is_connected:
-        hosts = ', '.join(re.sub(r'^https?:\/\/', '', a) for a in servers)
-        return PygmentsTokens([
-            (Token.Toolbar.Status.Key, 'USER: '),
-            (Token.Toolbar.Status, info.user or '--'),
-            (Token.Toolbar.Status, ' | '),
-            (Token.Toolbar.Status.Key, 'SCHEMA: '),
-            (Token.Toolbar.Status, info.schema or 'doc'),
-            (Token.Toolbar.Status, ' | '),
-            (Token.Toolbar.Status.Key, 'CLUSTER: '),
-            (Token.Toolbar.Status, info.cluster or '--'),
-            (Token.Toolbar.Status, ' | '),
-            (Token.Toolbar.Status.Key, 'HOSTS: '),
-            (Token.Toolbar.Status, hosts)
-        ])
-    else:
-        return PygmentsTokens([(Token.Toolbar.Status, 'not connected')])
-
-
-def loop(cmd, history_file):
-    buf = create_buffer(cmd, history_file)
+def _learn_from_history(completer, history, limit=1000):
+    for i, text in enumerate(history.load_history_strings()):
+        if i >= limit:
+            break
+        completer.learn(text)
+
+
+def loop(cmd, history_file, cache_dir=None):
+    buf = create_buffer(cmd, history_file, cache_dir=cache_dir)
     key_bindings = KeyBindings()
     bind_keys(buf, key_bindings)
+    poller = HealthPoller(cmd)
+    toolbar = Toolbar(cmd, poller)
     layout = create_layout(
         buffer=buf,
         multiline=True,
@@ -303,9 +520,10 @@ def loop(cmd, history_file):
         extra_input_processors=[
             ConditionalProcessor(
                 processor=HighlightMatchingBracketProcessor(chars='[](){}'),
-                filter=HasFocus(DEFAULT_BUFFER) & ~IsDone())
+                filter=HasFocus(DEFAULT_BUFFER) & ~IsDone()
+                & ~Condition(lambda: buf.large_paste))
         ],
-        get_bottom_toolbar_tokens=lambda: get_toolbar_tokens(cmd),
+        get_bottom_toolbar_tokens=toolbar.get_tokens,
         get_prompt_tokens=lambda: [('class:prompt', 'cr> ')]
     )
     output = create_output()
@@ -320,12 +538,28 @@ def loop(cmd, history_file):
         output=output
     )
     cmd.get_num_columns = lambda: output.get_size().columns
+    poller.on_change = app.invalidate
+    poller.start()
+
+    try:
+        _run(app, buf, cmd)
+    finally:
+        poller.stop()
+        buf.completer.close()
+        buf.history.close()
+
 
+def _run(app, buf, cmd):
     while True:
         try:
             text = app.run()
-            if text:
+            if isinstance(text, LargePaste):
+                # executed without being added to the history
+                cmd.process_iterable(io.StringIO(text))
+            elif text:
                 cmd.process(text)
+                if cmd.last_result is not None:
+                    buf.history.record_result(text, *cmd.last_result)
             buf.reset()
         except ProgrammingError as e:
             if '401' in e.message:
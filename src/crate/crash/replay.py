@@ -0,0 +1,370 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from .bench import PERCENTILES, BenchmarkResult, percentile
+from .metrics import fingerprint, normalize
+
+# a statement of a workload, and its offset in seconds from the first one,
+# None if its time is unknown
+WorkloadEntry = namedtuple('WorkloadEntry', ['offset', 'stmt', 'args'])
+
+STATEMENT_KEYS = ('stmt', 'statement')
+TIMESTAMP_KEYS = ('ts', 'timestamp', 'started', 'executed_at')
+
+# longest statement which is shown in the report
+MAX_STATEMENT_LENGTH = 60
+
+
+def load_workload(path):
+    """
+    Return the statements of the workload in the file ``path`` as a list of
+    ``WorkloadEntry``, in the order they were executed.
+
+    ``path`` can be the history of crash, as an SQLite database or in the
+    format of prompt_toolkit's ``FileHistory``, a file with SQL statements,
+    or a file with one JSON record per line with the statement in ``stmt`` or
+    ``statement``, its optional ``args`` and the time it was executed at in
+    ``ts``, ``timestamp``, ``started`` or ``executed_at``. Raise
+    ``ValueError`` if it is invalid.
+    """
+    from .history import DB_SUFFIX
+    if _is_sqlite(path):
+        timed = _read_sqlite_history(path)
+    elif not os.path.exists(path) and os.path.isfile(path + DB_SUFFIX):
+        # the history of crash is stored next to the given history file
+        timed = _read_sqlite_history(path + DB_SUFFIX)
+    else:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        lines = [line for line in text.splitlines() if line.strip()]
+        if lines and lines[0].lstrip().startswith('{'):
+            return _offsets(_read_ndjson(lines, path))
+        elif lines and all(line[0] in '#+' for line in lines) \
+                and any(line[0] == '+' for line in lines):
+            from .history import read_timed_file_history
+            timed = read_timed_file_history(path)
+        else:
+            timed = [(None, text)]
+    return _offsets((ts, stmt, None) for ts, string in timed for stmt in split_statements(string))
+
+
+def split_statements(text):
+    """
+    Return the SQL statements of ``text`` without their trailing semicolons,
+    skipping the lines of crash commands like ``\\timing``.
+    """
+    import sqlparse
+    sql = '\n'.join(line for line in text.splitlines() if not line.strip().startswith('\\'))
+    statements = []
+    for statement in sqlparse.split(sql):
+        statement = statement.strip().rstrip(';').strip()
+        # skip statements which only consist of comments
+        if statement and sqlparse.format(statement, strip_comments=True).strip():
+            statements.append(statement)
+    return statements
+
+
+def _is_sqlite(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(16) == b'SQLite format 3\x00'
+    except OSError:
+        return False
+
+
+def _read_sqlite_history(path):
+    # open the database read only, it is not created or migrated
+    conn = sqlite3.connect('file:{0}?mode=ro'.format(path), uri=True)
+    try:
+        return conn.execute(
+            'SELECT executed_at, statement FROM history ORDER BY executed_at, id').fetchall()
+    except sqlite3.DatabaseError as e:
+        raise ValueError('Cannot read the history in {0}: {1}'.format(path, e))
+    finally:
+        conn.close()
+
+
+def _read_ndjson(lines, path):
+    for number, line in enumerate(lines, 1):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError('Invalid JSON in line {0} of {1}'.format(number, path))
+        stmt = next((record[k] for k in STATEMENT_KEYS if k in record), None) \
+            if isinstance(record, dict) else None
+        if not isinstance(stmt, str):
+            raise ValueError('No statement in line {0} of {1}'.format(number, path))
+        ts = next((record[k] for k in TIMESTAMP_KEYS if record.get(k) is not None), None)
+        try:
+            ts = _to_timestamp(ts)
+        except ValueError:
+            raise ValueError('Invalid timestamp in line {0} of {1}: {2}'.format(number, path, ts))
+        stmt = stmt.strip().rstrip(';').strip()
+        if stmt:
+            yield ts, stmt, record.get('args')
+
+
+def _to_timestamp(value):
+    """
+    Return ``value``, seconds since the epoch or an ISO 8601 date, in
+    seconds since the epoch.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        # `fromisoformat` only understands `Z` since Python 3.11
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        return datetime.fromisoformat(value).timestamp()
+    raise ValueError(value)
+
+
+def _offsets(timed):
+    """
+    Turn ``(timestamp, stmt, args)`` tuples into ``WorkloadEntry``. The
+    offsets never decrease, and are None for all of them if a timestamp is
+    missing.
+    """
+    timed = list(timed)
+    if not timed or any(ts is None for ts, _, _ in timed):
+        return [WorkloadEntry(None, stmt, args) for _, stmt, args in timed]
+    first = timed[0][0]
+    entries = []
+    offset = 0.0
+    for ts, stmt, args in timed:
+        offset = max(offset, ts - first)
+        entries.append(WorkloadEntry(offset, stmt, args))
+    return entries
+
+
+def compress_gaps(entries, max_gap):
+    """
+    Shorten the idle time between two consecutive statements of ``entries``
+    to at most ``max_gap`` seconds, moving the later statements forward.
+    """
+    compressed = []
+    previous = None
+    shift = 0.0
+    for entry in entries:
+        if entry.offset is not None:
+            if previous is not None and entry.offset - previous > max_gap:
+                shift += entry.offset - previous - max_gap
+            previous = entry.offset
+            entry = entry._replace(offset=entry.offset - shift)
+        compressed.append(entry)
+    return compressed
+
+
+class ReplayResult:
+    """
+    Latencies of the replayed statements, grouped by their fingerprint.
+    """
+
+    COLUMNS = ['fingerprint', 'statement', 'runs', 'errors', 'min_ms']
+    COLUMNS += ['p{0}_ms'.format(p) for p in PERCENTILES]
+    COLUMNS += ['max_ms', 'server_p50_ms', 'server_p99_ms']
+
+    def __init__(self):
+        # fingerprint -> (normalized statement, BenchmarkResult)
+        self.statements = {}
+        self.elapsed = 0.0
+        self.interrupted = False
+        # how late the statements started compared to the captured workload
+        self.max_lag = 0.0
+
+    @property
+    def runs(self):
+        return sum(result.runs for _, result in self.statements.values())
+
+    @property
+    def errors(self):
+        return sum(sum(result.errors.values()) for _, result in self.statements.values())
+
+    @property
+    def throughput(self):
+        return self.runs / self.elapsed if self.elapsed > 0 else 0.0
+
+    def result_of(self, normalized):
+        """Return the ``BenchmarkResult`` of the ``normalized`` statement."""
+        key = fingerprint(normalized)
+        if key not in self.statements:
+            self.statements[key] = (normalized, BenchmarkResult())
+        return self.statements[key][1]
+
+    def error_messages(self):
+        """Return ``(count, name, message)`` of the errors, most frequent first."""
+        errors = {}
+        for _, result in self.statements.values():
+            for name, count in result.errors.items():
+                total, message = errors.get(name, (0, result.error_messages[name]))
+                errors[name] = (total + count, message)
+        return sorted(((count, name, message) for name, (count, message) in errors.items()),
+                      key=lambda e: -e[0])
+
+    def rows(self):
+        """
+        Return the latency distribution of every fingerprint as table rows,
+        the fingerprints with the largest total time first.
+        """
+        def ms(value):
+            return None if value is None else round(value, 3)
+
+        rows = []
+        items = sorted(self.statements.items(), key=lambda item: -sum(item[1][1].wall))
+        for key, (normalized, result) in items:
+            wall, server = sorted(result.wall), sorted(result.server)
+            if len(normalized) > MAX_STATEMENT_LENGTH:
+                normalized = normalized[:MAX_STATEMENT_LENGTH - 3] + '...'
+            rows.append([key, normalized, result.runs, sum(result.errors.values()),
+                         ms(wall[0] if wall else None)]
+                        + [ms(percentile(wall, p)) for p in PERCENTILES]
+                        + [ms(wall[-1] if wall else None),
+                           ms(percentile(server, 50)), ms(percentile(server, 99))])
+        return rows
+
+
+def run_replay(create_connection, entries, workers=1, paced=True):
+    """
+    Execute the ``WorkloadEntry`` ``entries`` in their order from ``workers``
+    threads, each with its own connection from ``create_connection()``.
+
+    If ``paced`` is true, every statement is started at its offset from the
+    start of the replay, so the statements arrive at the rate they were
+    captured at, otherwise they run as fast as possible. Stop early on
+    ``KeyboardInterrupt``.
+    """
+    result = ReplayResult()
+    lock = threading.Lock()
+    stopped = threading.Event()
+    pending = iter(entries)
+    begin = time.perf_counter()
+
+    def take():
+        with lock:
+            if stopped.is_set():
+                return None
+            return next(pending, None)
+
+    def wait_for(entry):
+        if not paced or entry.offset is None:
+            return True
+        delay = begin + entry.offset - time.perf_counter()
+        if delay > 0:
+            return not stopped.wait(delay)
+        with lock:
+            result.max_lag = max(result.max_lag, -delay)
+        return True
+
+    def work(connection):
+        cursor = connection.cursor()
+        try:
+            entry = take()
+            while entry is not None and wait_for(entry):
+                normalized = normalize(entry.stmt)
+                started = time.perf_counter()
+                try:
+                    cursor.execute(entry.stmt, entry.args)
+                    if cursor.description:
+                        cursor.fetchall()
+                except Exception as e:
+                    with lock:
+                        result.result_of(normalized).add_error(e)
+                else:
+                    wall = (time.perf_counter() - started) * 1000.0
+                    with lock:
+                        result.result_of(normalized).add(wall, max(cursor.duration, 0))
+                entry = take()
+        finally:
+            cursor.close()
+            connection.close()
+
+    threads = [threading.Thread(target=work, args=(create_connection(),),
+                                name='crash-replay-{0}'.format(i), daemon=True)
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # let the workers finish their current statement
+        stopped.set()
+        result.interrupted = True
+        for thread in threads:
+            thread.join()
+    result.elapsed = time.perf_counter() - begin
+    return result
+
+
+def replay(cmd, path, workers=1, paced=True, max_gap=None):
+    """
+    Replay the workload in ``path`` on the servers ``cmd`` is connected to,
+    and print the latencies per fingerprint with the output writer of ``cmd``.
+
+    If ``max_gap`` is set, paced replays skip the idle time between two
+    statements beyond ``max_gap`` seconds, e.g. the pauses of a history.
+    """
+    from .command import Result
+    try:
+        entries = load_workload(path)
+    except (OSError, ValueError) as e:
+        cmd.logger.critical(str(e))
+        cmd.exit_code = 1
+        return
+    if not entries:
+        cmd.logger.critical('No statements to replay in ' + path)
+        cmd.exit_code = 1
+        return
+    if paced and entries[0].offset is None:
+        cmd.logger.warn('The statements in {0} have no timestamps, '
+                        'replaying them as fast as possible'.format(path))
+        paced = False
+    if paced and max_gap:
+        entries = compress_gaps(entries, max_gap)
+    servers = list(cmd.last_connected_servers)
+    result = run_replay(lambda: cmd.create_connection(servers), entries, workers, paced)
+    rows = result.rows()
+    cmd.output_writer.write(Result(ReplayResult.COLUMNS, rows, len(rows), -1, cmd.get_num_columns()))
+    lag = ', {0:.3f} sec behind schedule at most'.format(result.max_lag) if paced else ''
+    cmd.logger.info('REPLAY {0} statement{1} ({2} fingerprint{3}) on {4} worker{5}{6} '
+                    'in {7:.3f} sec, {8:,.1f} statements/sec{9}, {10} error{11}'.format(
+                        result.runs, 's'[result.runs == 1:],
+                        len(result.statements), 's'[len(result.statements) == 1:],
+                        workers, 's'[workers == 1:],
+                        ' (interrupted)' if result.interrupted else '',
+                        result.elapsed, result.throughput, lag,
+                        result.errors, 's'[result.errors == 1:]))
+    for count, name, message in result.error_messages():
+        cmd.logger.critical('{0} x {1}: {2}'.format(count, name, message))
+    if result.errors:
+        cmd.exit_code = 1
@@ -0,0 +1,263 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import codecs
+import json
+import marshal
+import mmap
+import re
+import struct
+import sys
+import tempfile
+
+# rows whose size is measured to estimate the size of a result
+SAMPLE_SIZE = 1000
+
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?i?b?)\s*$', re.IGNORECASE)
+_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+_FRAME = struct.Struct('<I')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def parse_size(value):
+    """
+    Return the number of bytes of ``value``, e.g. ``512``, ``64KB`` or
+    ``1.5GiB``. Units are powers of 1024. Raise ``ValueError`` if it is
+    invalid.
+    """
+    match = _SIZE.match(str(value))
+    if not match:
+        raise ValueError('Invalid size: {0}'.format(value))
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit[:1].lower()])
+
+
+def estimate_size(value):
+    """
+    Return the approximate number of bytes ``value``, a decoded JSON value,
+    takes in memory.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return size
+
+
+def estimate_rows_size(rows):
+    """
+    Return the approximate number of bytes the list ``rows`` takes in memory,
+    measuring at most ``SAMPLE_SIZE`` rows spread over the result.
+    """
+    count = len(rows)
+    if count <= SAMPLE_SIZE:
+        measured = sum(estimate_size(row) for row in rows)
+    else:
+        step = count / SAMPLE_SIZE
+        sample = sum(estimate_size(rows[int(i * step)]) for i in range(SAMPLE_SIZE))
+        measured = int(sample * count / SAMPLE_SIZE)
+    return sys.getsizeof(rows) + measured
+
+
+def release_cursor_rows(cursor):
+    """
+    Drop the decoded response of ``cursor`` after its rows were fetched, so
+    they can be freed before the next statement runs. The row count, the
+    duration and the description stay available.
+    """
+    result = getattr(cursor, '_result', None)
+    if result and 'rows' in result:
+        result['rows'] = []
+
+
+class SpilledRows:
+    """
+    Rows of a result which are kept in a temporary file instead of memory.
+
+    Every row is stored as a length-prefixed ``marshal`` record, which is
+    compact and fast to decode for the JSON types of a result. The file is
+    memory-mapped to read the rows back, which can be done any number of
+    times, e.g. to measure the column widths before printing the rows. The
+    file has no name and is removed when it is closed or crash exits.
+    """
+
+    def __init__(self, rows=(), dir=None):
+        self._file = tempfile.TemporaryFile(prefix='crash-result-', dir=dir)
+        self._map = None
+        self._count = 0
+        self.extend(rows)
+
+    @property
+    def size(self):
+        """The number of bytes of the file."""
+        return self._file.seek(0, 2)
+
+    def append(self, row):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        data = marshal.dumps(row)
+        self._file.seek(0, 2)
+        self._file.write(_FRAME.pack(len(data)))
+        self._file.write(data)
+        self._count += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        if not self._count:
+            return
+        if self._map is None:
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._map
+        offset = 0
+        end = len(data)
+        while offset < end:
+            length, = _FRAME.unpack_from(data, offset)
+            offset += _FRAME.size
+            yield marshal.loads(data[offset:offset + length])
+            offset += length
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spill_rows(chunks, rows):
+    """
+    Decode the JSON response of a statement from the byte strings ``chunks``
+    and append its rows one at a time to ``rows``, e.g. ``SpilledRows``.
+    Return the response with an empty list of rows.
+
+    Only a row and the chunks it spans are decoded at a time, so the memory
+    used does not grow with the size of the result. Raise ``ValueError`` if
+    the response is invalid.
+    """
+    return _ResponseDecoder(chunks).decode(rows)
+
+
+class _ResponseDecoder:
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._text = ''
+        self._pos = 0
+        self._done = False
+
+    def decode(self, rows):
+        result = {}
+        self._expect('{')
+        if self._peek() == '}':
+            return result
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'rows' and self._peek() == '[':
+                self._pos += 1
+                self._rows(rows)
+                result['rows'] = []
+            else:
+                result[key] = self._value()
+            if self._expect(',}') == '}':
+                return result
+
+    def _rows(self, rows):
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            rows.append(self._value())
+            if self._expect(',]') == ']':
+                return
+
+    def _read(self):
+        if self._done:
+            raise ValueError('Incomplete response')
+        text = self._text[self._pos:]
+        self._pos = 0
+        # read at least as much as is left, so a value which spans several
+        # chunks is only decoded a few times
+        parts = [text]
+        size = 0
+        while size <= len(text):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                parts.append(self._utf8.decode(b'', final=True))
+                self._done = True
+                break
+            parts.append(self._utf8.decode(chunk))
+            size += len(parts[-1])
+        self._text = ''.join(parts)
+
+    def _peek(self):
+        """Skip the whitespace and return the next character."""
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            self._read()
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError('Expected {0} at {1!r}'.format(
+                ' or '.join(chars), self._text[self._pos:self._pos + 20]))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if self._done:
+                    raise
+            else:
+                # a number at the end of the text may continue in the next chunk
+                if end < len(self._text) or self._done:
+                    self._pos = end
+                    return value
+            self._read()
@@ -23,10 +23,8 @@
 
 from collections import namedtuple
 
-from verlib2 import Version
-
 Result = namedtuple('Result', ['rows', 'cols'])
-SYSINFO_MIN_VERSION = Version("0.54.0")
+SYSINFO_MIN_VERSION = "0.54.0"
 
 
 class SysInfoCommand:
@@ -71,9 +69,10 @@ from sys.nodes
 
     def execute(self):
         """ print system and cluster info """
+        from verlib2 import Version
         if not self.cmd.is_conn_available():
             return
-        if self.cmd.connection.lowest_server_version >= SYSINFO_MIN_VERSION:
+        if self.cmd.connection.lowest_server_version >= Version(SYSINFO_MIN_VERSION):
             success, rows = self._sys_info()
             self.cmd.exit_code = self.cmd.exit_code or int(not success)
             if success:
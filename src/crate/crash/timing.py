@@ -0,0 +1,218 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import threading
+import time
+
+
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024 or unit == 'MiB':
+            break
+        size /= 1024.0
+    return '{0:.0f} {1}'.format(size, unit) if unit == 'B' else '{0:.1f} {1}'.format(size, unit)
+
+
+class StatementTimer:
+    """
+    Breakdown of the time spent on a statement, from sending it to printing
+    its result.
+
+    While the timer is entered, the client of the connection, the cursor and
+    the output writer of ``cmd`` are hooked to measure:
+
+    - ``network``: the HTTP requests, minus the duration reported by the
+      server
+    - ``decode``: decoding the JSON responses
+    - ``fetch``: fetching the rows from the cursor
+    - ``render``: formatting the result
+    - ``write``: writing the formatted result to the output
+
+    It also records the servers the requests were sent to, including the
+    ones which failed and were retried, and the class of the error the
+    statement failed with, if any.
+
+    The hooks are removed when the timer exits, so statements which are not
+    timed don't pay for them. Requests of other threads, e.g. of the
+    autocompletion, are not counted.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.wall = 0.0
+        self.server = 0.0
+        self.request = 0.0
+        self.json_request = 0.0
+        self.fetch = 0.0
+        self.output = 0.0
+        self.write = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.rowcount = -1
+        self.servers = []
+        self.error = None
+        self.started = None
+        self._thread = None
+        self._restore = []
+        self._started = None
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        cmd = self.cmd
+        if cmd.connection is not None:
+            client = cmd.connection.client
+            self._hook(client, '_request', self._timed_request(client._request))
+            self._hook(client, '_json_request', self._timed_json_request(client._json_request))
+            self._hook(client, '_get_server', self._recorded_server(client._get_server))
+        if cmd.cursor is not None:
+            self._hook(cmd.cursor, 'execute', self._recorded_error(cmd.cursor.execute))
+            self._hook(cmd.cursor, 'fetchall', self._timed('fetch', cmd.cursor.fetchall))
+        writer = cmd.output_writer
+        self._hook(writer, 'write', self._timed('output', writer.write))
+        self._hook(writer, 'writer', _TimedWriter(writer.writer, self))
+        self.started = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self._started
+        cursor = self.cmd.cursor
+        if cursor is not None:
+            self.rowcount = cursor.rowcount
+            if cursor.duration > -1:
+                self.server = cursor.duration / 1000.0
+        while self._restore:
+            self._restore.pop()()
+
+    def _hook(self, obj, name, value):
+        """
+        Set the attribute ``name`` of ``obj`` to ``value`` until the timer
+        exits.
+        """
+        patched = name in vars(obj)
+        original = getattr(obj, name)
+        setattr(obj, name, value)
+
+        def restore():
+            if patched:
+                setattr(obj, name, original)
+            else:
+                delattr(obj, name)
+        self._restore.append(restore)
+
+    def _is_timed(self):
+        return threading.get_ident() == self._thread
+
+    def _timed(self, attribute, method):
+        """
+        Return ``method``, adding the time of its calls to ``attribute``.
+        """
+        def timed(*args, **kwargs):
+            if not self._is_timed():
+                return method(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                setattr(self, attribute, getattr(self, attribute) + time.perf_counter() - started)
+        return timed
+
+    def _timed_request(self, method):
+        timed = self._timed('request', method)
+
+        def request(*args, **kwargs):
+            response = timed(*args, **kwargs)
+            if self._is_timed():
+                self.bytes_received += len(response.data or b'')
+            return response
+        return request
+
+    def _timed_json_request(self, method):
+        timed = self._timed('json_request', method)
+
+        def json_request(http_method, path, data):
+            if self._is_timed():
+                self.bytes_sent += len(data)
+            return timed(http_method, path, data)
+        return json_request
+
+    def _recorded_server(self, method):
+        def get_server():
+            server = method()
+            if self._is_timed():
+                self.servers.append(server)
+            return server
+        return get_server
+
+    def _recorded_error(self, method):
+        def execute(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                if self._is_timed():
+                    self.error = type(e).__name__
+                raise
+        return execute
+
+    @property
+    def host(self):
+        return self.servers[-1] if self.servers else None
+
+    @property
+    def retries(self):
+        return max(len(self.servers) - 1, 0)
+
+    @property
+    def network(self):
+        return max(self.request - self.server, 0.0)
+
+    @property
+    def decode(self):
+        # also includes the compression of large requests
+        return max(self.json_request - self.request, 0.0)
+
+    @property
+    def render(self):
+        return max(self.output - self.write, 0.0)
+
+    def __str__(self):
+        phases = [('total', self.wall), ('server', self.server), ('network', self.network),
+                  ('decode', self.decode), ('fetch', self.fetch), ('render', self.render),
+                  ('write', self.write)]
+        return 'Timing: {0} | sent {1}, received {2}'.format(
+            ', '.join('{0} {1:.3f}'.format(name, value) for name, value in phases) + ' sec',
+            format_bytes(self.bytes_sent),
+            format_bytes(self.bytes_received))
+
+
+class _TimedWriter:
+    """
+    Output which measures the time its ``write`` calls take.
+    """
+
+    def __init__(self, writer, timer):
+        self._writer = writer
+        self.write = timer._timed('write', writer.write)
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
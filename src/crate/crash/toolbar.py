@@ -0,0 +1,189 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import logging
+import re
+import threading
+from collections import namedtuple
+
+from prompt_toolkit.formatted_text import PygmentsTokens
+from pygments.token import Token
+
+from crate.client.exceptions import ConnectionError, ProgrammingError
+
+logger = logging.getLogger(__name__)
+
+ClusterHealth = namedtuple('ClusterHealth', ['health', 'nodes'])
+
+HEALTH_BY_SEVERITY = {1: 'GREEN', 2: 'YELLOW', 3: 'RED'}
+
+
+def get_toolbar_tokens(is_connected, servers, info, last_result=None, health=None):
+    if not is_connected:
+        return PygmentsTokens([(Token.Toolbar.Status, 'not connected')])
+    hosts = ', '.join(re.sub(r'^https?:\/\/', '', a) for a in servers)
+    tokens = [
+        (Token.Toolbar.Status.Key, 'USER: '),
+        (Token.Toolbar.Status, info.user or '--'),
+        (Token.Toolbar.Status, ' | '),
+        (Token.Toolbar.Status.Key, 'SCHEMA: '),
+        (Token.Toolbar.Status, info.schema or 'doc'),
+        (Token.Toolbar.Status, ' | '),
+        (Token.Toolbar.Status.Key, 'CLUSTER: '),
+        (Token.Toolbar.Status, info.cluster or '--'),
+        (Token.Toolbar.Status, ' | '),
+        (Token.Toolbar.Status.Key, 'HOSTS: '),
+        (Token.Toolbar.Status, hosts)
+    ]
+    if health is not None:
+        tokens += [
+            (Token.Toolbar.Status, ' | '),
+            (Token.Toolbar.Status.Key, 'HEALTH: '),
+            (Token.Toolbar.Status, '{0} ({1} node{2})'.format(
+                health.health, health.nodes, 's'[health.nodes == 1:])),
+        ]
+    if last_result is not None:
+        duration, rowcount = last_result
+        last = '{0:.3f} sec'.format(duration / 1000.0)
+        if duration > 0:
+            last += ', {0:,.0f} rows/sec'.format(rowcount / (duration / 1000.0))
+        tokens += [
+            (Token.Toolbar.Status, ' | '),
+            (Token.Toolbar.Status.Key, 'LAST: '),
+            (Token.Toolbar.Status, last),
+        ]
+    return PygmentsTokens(tokens)
+
+
+class Toolbar:
+    """
+    Bottom toolbar of the REPL.
+
+    The tokens are cached and only rebuilt if the state they are built from
+    changed. Getting the tokens never does any network I/O: the cluster
+    health is taken from the last result of a ``HealthPoller``.
+    """
+
+    def __init__(self, cmd, poller=None):
+        self.cmd = cmd
+        self.poller = poller
+        self._state = None
+        self._tokens = None
+
+    def get_tokens(self):
+        cmd = self.cmd
+        is_connected = bool(cmd.is_conn_available())
+        state = (
+            is_connected,
+            tuple(cmd.connection.client.active_servers) if is_connected else (),
+            cmd.connect_info,
+            cmd.last_result,
+            self.poller and self.poller.health,
+        )
+        if state != self._state:
+            self._tokens = get_toolbar_tokens(*state)
+            self._state = state
+        return self._tokens
+
+
+class HealthPoller:
+    """
+    Poll the health and the number of nodes of the cluster the shell is
+    connected to on a background thread, using a dedicated connection.
+
+    ``on_change`` is called whenever the result changed, e.g. to redraw the
+    toolbar.
+    """
+
+    INTERVAL = 10
+
+    HEALTH_QUERY = "SELECT max(severity) FROM sys.health"
+
+    NODES_QUERY = "SELECT count(*) FROM sys.nodes"
+
+    def __init__(self, cmd, interval=INTERVAL, on_change=None):
+        self.cmd = cmd
+        self.interval = interval
+        self.on_change = on_change
+        self.health = None
+        self._servers = None
+        self._connection = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='crash-health',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.poll()
+            self._stopped.wait(self.interval)
+        if self._connection is not None:
+            self._connection.close()
+
+    def poll(self):
+        health = None
+        if self.cmd.is_conn_available():
+            try:
+                health = self._query(self._get_connection())
+            except (ProgrammingError, ConnectionError) as e:
+                logger.debug('Could not poll cluster health: %s', e)
+        if health != self.health:
+            self.health = health
+            if self.on_change is not None:
+                self.on_change()
+        return health
+
+    def _get_connection(self):
+        # follow the shell if it connects to other servers
+        servers = list(self.cmd.last_connected_servers)
+        if self._connection is None or servers != self._servers:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = self.cmd.create_connection(servers)
+            self._servers = servers
+        return self._connection
+
+    def _query(self, connection):
+        cursor = connection.cursor()
+        try:
+            try:
+                cursor.execute(self.HEALTH_QUERY)
+                severity = cursor.fetchone()[0]
+                # no health issues are reported for a healthy cluster
+                health = HEALTH_BY_SEVERITY.get(severity or 1, '--')
+            except ProgrammingError:
+                # `sys.health` is not available on older versions
+                health = '--'
+            cursor.execute(self.NODES_QUERY)
+            nodes = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        return ClusterHealth(health, nodes)
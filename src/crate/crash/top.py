@@ -0,0 +1,558 @@
+# vim: set fileencodings=utf-8
+# -*- coding: utf-8; -*-
+#
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 2.0
+
+Job = namedtuple('Job', ['id', 'node', 'username', 'running_ms', 'operations', 'stmt'])
+
+Node = namedtuple('Node', ['name', 'cpus', 'load_1', 'cpu_percent', 'heap_percent',
+                           'disk_percent', 'read_bytes_per_sec', 'write_bytes_per_sec',
+                           'queued', 'rejected_per_sec', 'connections'])
+
+# counters of a node, to compute their rates between two polls
+NodeSample = namedtuple('NodeSample', ['timestamp', 'bytes_read', 'bytes_written', 'rejected'])
+
+WARN = 'class:top.warn'
+ALERT = 'class:top.alert'
+
+
+def format_duration(ms):
+    seconds = max(ms, 0) / 1000.0
+    if seconds < 60:
+        return '{0:.1f}s'.format(seconds)
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes < 60:
+        return '{0}m{1:02d}s'.format(minutes, seconds)
+    hours, minutes = divmod(minutes, 60)
+    return '{0}h{1:02d}m'.format(hours, minutes)
+
+
+def _percent(part, total):
+    if part is None or not total or part < 0 or total < 0:
+        return None
+    return round(part * 100.0 / total, 1)
+
+
+def _rate(previous, sample, field):
+    """
+    Return the increase of the counter ``field`` per second between the
+    samples, or None if it is unknown, e.g. if the node was restarted.
+    """
+    if previous is None:
+        return None
+    seconds = (sample.timestamp - previous.timestamp) / 1000.0
+    before, after = getattr(previous, field), getattr(sample, field)
+    if seconds <= 0 or before is None or after is None or before < 0 or after < before:
+        return None
+    return round((after - before) / seconds, 1)
+
+
+def _level(value, warn, alert):
+    if value is None or value < warn:
+        return ''
+    return ALERT if value >= alert else WARN
+
+
+def _fit(text, width):
+    text = ' '.join(str(text).split())
+    if len(text) > width:
+        return text[:max(width - 3, 0)] + '...'
+    return text.ljust(width)
+
+
+class JobsView:
+    """
+    The running jobs of the cluster, with their running time and their
+    number of operations.
+
+    Only the ``limit`` jobs which come first in the sort order are fetched,
+    and their operations are counted by the cluster, so a poll transfers at
+    most one row per shown job, however many operations are running. The
+    running time is computed against the clock of the cluster.
+    """
+
+    name = 'jobs'
+
+    COLUMNS = ['id', 'node', 'username', 'running_ms', 'operations', 'stmt']
+
+    # key -> sort order
+    SORT_KEYS = OrderedDict([('d', 'duration'), ('n', 'node'), ('u', 'user')])
+
+    ORDER_BY = {
+        'duration': 'started',
+        'node': "node['name'], started",
+        'user': 'username, started',
+    }
+
+    JOBS_QUERY = ("SELECT id, node['name'], username, started, CURRENT_TIMESTAMP, stmt "
+                  "FROM sys.jobs ORDER BY {0} LIMIT ?")
+
+    OPERATIONS_QUERY = ("SELECT job_id, count(*) FROM sys.operations "
+                        "WHERE job_id = ANY(?) GROUP BY job_id")
+
+    HEADERS = ['JOB', 'NODE', 'USER', 'RUNNING', 'OPS', 'STATEMENT']
+    WIDTHS = [36, 16, 12, 9, 5]
+
+    can_kill = True
+    has_rates = False
+
+    def __init__(self, limit=200):
+        self.limit = limit
+        self.sort = 'duration'
+
+    def poll(self, cursor):
+        """Return the running jobs as a list of ``Job``, in the sort order."""
+        own = {self.JOBS_QUERY.format(order) for order in self.ORDER_BY.values()}
+        own.add(self.OPERATIONS_QUERY)
+        cursor.execute(self.JOBS_QUERY.format(self.ORDER_BY[self.sort]), (self.limit,))
+        rows = [row for row in cursor.fetchall() if row[5] not in own]
+        operations = {}
+        if rows:
+            cursor.execute(self.OPERATIONS_QUERY, ([row[0] for row in rows],))
+            operations = dict(cursor.fetchall())
+        return [Job(id, node, username, now - started if started and now else 0,
+                    operations.get(id, 0), stmt)
+                for id, node, username, started, now, stmt in rows]
+
+    def sort_rows(self, rows):
+        """Sort ``rows`` client side, e.g. until the next poll after a change."""
+        if self.sort == 'node':
+            return sorted(rows, key=lambda job: (job.node or '', -job.running_ms))
+        if self.sort == 'user':
+            return sorted(rows, key=lambda job: (job.username or '', -job.running_ms))
+        return sorted(rows, key=lambda job: -job.running_ms)
+
+    def key(self, row):
+        return row.id
+
+    def cells(self, row):
+        return [row.id, row.node or '', row.username or '',
+                format_duration(row.running_ms), str(row.operations), row.stmt or '']
+
+    def kill(self, cursor, row):
+        cursor.execute("KILL '{0}'".format(row.id.replace("'", "''")))
+        return 'Killed job ' + row.id
+
+    def describe(self, row):
+        return 'job {0} ({1})'.format(row.id, _fit(row.stmt or '', 40).strip())
+
+
+class NodesView:
+    """
+    The resource usage of the nodes of the cluster.
+
+    The disk throughput and the thread pool rejections are counters, which
+    are turned into rates per second between two polls, using the sample
+    time of the nodes. Values above the thresholds are highlighted, and the
+    nodes are sorted by their CPU usage by default, so the busiest node is
+    on top.
+    """
+
+    name = 'nodes'
+
+    COLUMNS = list(Node._fields)
+
+    SORT_KEYS = OrderedDict([('c', 'cpu'), ('l', 'load'), ('h', 'heap'), ('n', 'name')])
+
+    QUERY = ("SELECT id, name, os_info['available_processors'], load['1'], os['cpu']['used'], "
+             "heap['used'], heap['max'], fs['total']['used'], fs['total']['size'], "
+             "fs['total']['bytes_read'], fs['total']['bytes_written'], "
+             "thread_pools['queued'], thread_pools['rejected'], "
+             "connections['http']['open'], connections['psql']['open'], os['timestamp'] "
+             "FROM sys.nodes")
+
+    HEADERS = ['NODE', 'LOAD', 'CPU%', 'HEAP%', 'DISK%', 'READ/s', 'WRITE/s', 'QUEUE',
+               'REJ/s', 'CONNS']
+    WIDTHS = [16, 6, 5, 5, 5, 12, 12, 6, 7]
+
+    # (warn, alert) thresholds, the load is per CPU and the disk thresholds
+    # are the default disk watermarks of CrateDB
+    LOAD_LEVELS = (0.7, 1.0)
+    CPU_LEVELS = (70, 90)
+    HEAP_LEVELS = (75, 90)
+    DISK_LEVELS = (85, 90)
+
+    can_kill = False
+    has_rates = True
+
+    def __init__(self):
+        self.sort = 'cpu'
+        self._samples = {}
+
+    def poll(self, cursor):
+        """
+        Return the nodes as a list of ``Node``, with the rates since the
+        previous poll.
+        """
+        cursor.execute(self.QUERY)
+        now = time.time() * 1000.0
+        samples = {}
+        nodes = []
+        for (id, name, cpus, load, cpu, heap_used, heap_max, fs_used, fs_size, bytes_read,
+             bytes_written, queued, rejected, http, psql, timestamp) in cursor.fetchall():
+            sample = NodeSample(timestamp or now, bytes_read, bytes_written,
+                                sum(r for r in rejected or [] if r and r > 0))
+            previous = self._samples.get(id)
+            samples[id] = sample
+            nodes.append(Node(
+                name, cpus, load,
+                cpu if cpu is not None and cpu >= 0 else None,
+                _percent(heap_used, heap_max),
+                _percent(fs_used, fs_size),
+                _rate(previous, sample, 'bytes_read'),
+                _rate(previous, sample, 'bytes_written'),
+                sum(q for q in queued or [] if q and q > 0),
+                _rate(previous, sample, 'rejected'),
+                (http or 0) + (psql or 0)))
+        self._samples = samples
+        return self.sort_rows(nodes)
+
+    def sort_rows(self, rows):
+        if self.sort == 'name':
+            return sorted(rows, key=lambda node: node.name or '')
+        field = {'cpu': 'cpu_percent', 'load': 'load_1', 'heap': 'heap_percent'}[self.sort]
+        return sorted(rows, key=lambda node: -(getattr(node, field) or 0))
+
+    def key(self, row):
+        return row.name
+
+    def cells(self, row):
+        from .timing import format_bytes
+
+        def number(value, pattern='{0:.0f}'):
+            return '-' if value is None else pattern.format(value)
+
+        def throughput(value):
+            return '-' if value is None else format_bytes(value) + '/s'
+
+        load_per_cpu = row.load_1 / row.cpus if row.load_1 is not None and row.cpus else None
+        return [
+            row.name or '',
+            (number(row.load_1, '{0:.2f}'), _level(load_per_cpu, *self.LOAD_LEVELS)),
+            (number(row.cpu_percent), _level(row.cpu_percent, *self.CPU_LEVELS)),
+            (number(row.heap_percent), _level(row.heap_percent, *self.HEAP_LEVELS)),
+            (number(row.disk_percent), _level(row.disk_percent, *self.DISK_LEVELS)),
+            throughput(row.read_bytes_per_sec),
+            throughput(row.write_bytes_per_sec),
+            (number(row.queued), WARN if row.queued else ''),
+            (number(row.rejected_per_sec, '{0:.1f}'), ALERT if row.rejected_per_sec else ''),
+            number(row.connections),
+        ]
+
+
+VIEWS = OrderedDict([('jobs', JobsView), ('nodes', NodesView)])
+
+
+def parse_top_args(args):
+    """
+    Return the view and the interval of ``\\top [VIEW] [INTERVAL]``. Raise
+    ``ValueError`` if they are invalid.
+    """
+    view, interval = 'jobs', DEFAULT_INTERVAL
+    words = args.split()
+    if words and words[0] in VIEWS:
+        view = words.pop(0)
+    if words:
+        try:
+            interval = float(words.pop(0))
+        except ValueError:
+            raise ValueError('Invalid interval: {0}'.format(args.split()[-1]))
+        if interval <= 0:
+            raise ValueError('Interval must be greater than 0')
+    if words:
+        raise ValueError('Usage: \\top [{0}] [INTERVAL]'.format('|'.join(VIEWS)))
+    return VIEWS[view](), interval
+
+
+def render_table(view, rows, selected, width, height):
+    """
+    Return the formatted text of the header and the ``rows`` of ``view``
+    which fit into ``height`` lines of ``width`` columns, scrolled so that
+    the ``selected`` row is shown.
+
+    The cells of ``view`` are strings, or ``(string, style)`` tuples to
+    highlight them.
+    """
+    widths = list(view.WIDTHS)
+    # the last column gets the remaining width
+    widths.append(max(width - sum(widths) - len(widths), 10))
+    tokens = _row_tokens(view.HEADERS, widths, 'class:top.columns')
+    visible = max(height - 1, 1)
+    first = max(0, selected - visible + 1) if selected is not None else 0
+    for index, row in enumerate(rows[first:first + visible], first):
+        style = 'class:top.selected' if index == selected else ''
+        tokens += _row_tokens(view.cells(row), widths, style)
+    return tokens
+
+
+def _row_tokens(cells, widths, style):
+    tokens = []
+    for cell, width in zip(cells, widths):
+        text, cell_style = cell if isinstance(cell, tuple) else (cell, '')
+        cell_style = ' '.join(s for s in (style, cell_style) if s)
+        if tokens:
+            tokens.append((style, ' '))
+        tokens.append((cell_style, _fit(text, width)))
+    tokens.append((style, '\n'))
+    # merge the cells of the same style
+    merged = [tokens[0]]
+    for token in tokens[1:]:
+        if token[0] == merged[-1][0]:
+            merged[-1] = (token[0], merged[-1][1] + token[1])
+        else:
+            merged.append(token)
+    return merged
+
+
+class TopScreen:
+    """
+    Full screen view of ``view``, polled every ``interval`` seconds on a
+    dedicated connection on a background thread.
+
+    A poll starts only after the previous one finished, and the screen is
+    only redrawn after a poll or a key press. Kills are sent on the polling
+    thread as well, so the connection is only used by that thread and the
+    keys are handled while a statement runs.
+    """
+
+    def __init__(self, cmd, view, interval=DEFAULT_INTERVAL, input=None, output=None):
+        self.cmd = cmd
+        self.view = view
+        self.interval = interval
+        self.rows = []
+        self.error = None
+        self.updated = None
+        self.message = ''
+        self.selected = 0
+        self.confirm = None
+        self._selected_key = None
+        # the row to kill on the next poll
+        self._kill = None
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+        self._connection = cmd.create_connection(list(cmd.last_connected_servers))
+        self.app = self._create_app(input, output)
+
+    def _create_app(self, input, output):
+        from prompt_toolkit import Application
+        from prompt_toolkit.key_binding import KeyBindings
+        from prompt_toolkit.styles import Style, merge_styles
+        from prompt_toolkit.styles.pygments import style_from_pygments_cls
+
+        from .layout import create_full_screen_layout
+        from .repl import CrateStyle
+
+        bindings = KeyBindings()
+
+        @bindings.add('q')
+        @bindings.add('c-c')
+        @bindings.add('c-d')
+        def _(event):
+            event.app.exit()
+
+        @bindings.add('up')
+        def _(event):
+            self.move(-1)
+
+        @bindings.add('down')
+        def _(event):
+            self.move(1)
+
+        for key, sort in self.view.SORT_KEYS.items():
+            bindings.add(key)(lambda event, sort=sort: self.sort_by(sort))
+
+        if self.view.can_kill:
+            @bindings.add('k')
+            def _(event):
+                self.ask_kill()
+
+            @bindings.add('y')
+            def _(event):
+                self.kill()
+
+            # every other key cancels, the bindings of the keys above take
+            # precedence over this one
+            @bindings.add('<any>')
+            def _(event):
+                self.confirm = None
+
+        style = merge_styles([
+            style_from_pygments_cls(CrateStyle),
+            Style.from_dict({
+                'top.columns': 'bold',
+                'top.selected': 'reverse',
+                'top.error': 'ansired',
+                'top.warn': 'ansiyellow',
+                'top.alert': 'bold ansired',
+            }),
+        ])
+        return Application(
+            layout=create_full_screen_layout(self.get_header_tokens,
+                                             self.get_body_tokens,
+                                             self.get_footer_tokens),
+            key_bindings=bindings,
+            style=style,
+            full_screen=True,
+            input=input,
+            output=output)
+
+    def run(self):
+        thread = threading.Thread(target=self._poll, name='crash-top', daemon=True)
+        thread.start()
+        try:
+            self.app.run()
+        finally:
+            self._stopped.set()
+            self._wake.set()
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            row, self._kill = self._kill, None
+            if row is not None:
+                self.send_kill(row)
+            self.refresh()
+            self.app.invalidate()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+        self._connection.close()
+
+    def refresh(self):
+        cursor = self._connection.cursor()
+        try:
+            rows = self.view.poll(cursor)
+            error = None
+        except Exception as e:
+            # e.g. a SQL error, a lost connection or an unexpected result,
+            # which are shown until the next poll succeeds
+            rows = self.rows
+            error = getattr(e, 'message', None) or str(e) or type(e).__name__
+        finally:
+            cursor.close()
+        self.set_rows(self.view.sort_rows(rows))
+        self.error = error
+        self.updated = time.strftime('%H:%M:%S')
+
+    def set_rows(self, rows):
+        # keep the selected row selected if it moved
+        keys = [self.view.key(row) for row in rows]
+        if self._selected_key in keys:
+            self.selected = keys.index(self._selected_key)
+        self.selected = min(self.selected, max(len(rows) - 1, 0))
+        self.rows = rows
+        self._selected_key = keys[self.selected] if rows else None
+
+    def move(self, delta):
+        self.confirm = None
+        self.selected = min(max(self.selected + delta, 0), max(len(self.rows) - 1, 0))
+        if self.rows:
+            self._selected_key = self.view.key(self.rows[self.selected])
+
+    def sort_by(self, sort):
+        self.confirm = None
+        self.view.sort = sort
+        self.set_rows(self.view.sort_rows(self.rows))
+        # fetch the first rows of the new order right away
+        self._wake.set()
+
+    def ask_kill(self):
+        if self.rows:
+            self.confirm = self.rows[self.selected]
+
+    def kill(self):
+        row, self.confirm = self.confirm, None
+        if row is None:
+            return
+        self.message = 'Killing {0}'.format(self.view.describe(row))
+        self._kill = row
+        self._wake.set()
+
+    def send_kill(self, row):
+        cursor = self._connection.cursor()
+        try:
+            self.message = self.view.kill(cursor, row)
+        except Exception as e:
+            self.message = getattr(e, 'message', None) or str(e) or type(e).__name__
+        finally:
+            cursor.close()
+
+    def get_header_tokens(self):
+        text = ' crash top - {0} | {1} {0} | sort: {2} | every {3:g}s'.format(
+            self.view.name, len(self.rows), self.view.sort, self.interval)
+        if self.updated:
+            text += ' | updated ' + self.updated
+        tokens = [('', text)]
+        if self.error:
+            tokens.append(('class:top.error', ' | ' + self.error))
+        return tokens
+
+    def get_body_tokens(self):
+        size = self.app.output.get_size()
+        return render_table(self.view, self.rows, self.selected if self.rows else None,
+                            size.columns, size.rows - 2)
+
+    def get_footer_tokens(self):
+        if self.confirm is not None:
+            return [('class:top.error', ' Kill {0}? Press y to confirm'.format(self.view.describe(self.confirm)))]
+        keys = ['[up/down] select']
+        keys += ['[{0}] {1}'.format(key, sort) for key, sort in self.view.SORT_KEYS.items()]
+        if self.view.can_kill:
+            keys.append('[k] kill')
+        keys.append('[q] quit')
+        text = ' ' + '  '.join(keys)
+        if self.message:
+            text += ' | ' + self.message
+        return [('', text)]
+
+
+def snapshot(cmd, view, interval=DEFAULT_INTERVAL):
+    """
+    Print the rows of ``view`` once with the output writer of ``cmd``, e.g.
+    if the output is not a terminal. Views with rates are polled twice,
+    ``interval`` seconds apart.
+    """
+    from crate.client.exceptions import ConnectionError, ProgrammingError
+
+    from .command import Result
+    connection = cmd.create_connection(list(cmd.last_connected_servers))
+    cursor = connection.cursor()
+    try:
+        rows = view.poll(cursor)
+        if view.has_rates:
+            time.sleep(interval)
+            rows = view.poll(cursor)
+    except (ProgrammingError, ConnectionError) as e:
+        cmd.logger.critical(getattr(e, 'message', None) or str(e))
+        cmd.exit_code = 1
+        return
+    finally:
+        cursor.close()
+        connection.close()
+    rows = [list(row) for row in rows]
+    cmd.output_writer.write(Result(view.COLUMNS, rows, len(rows), -1, cmd.get_num_columns()))
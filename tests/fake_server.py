@@ -0,0 +1,290 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+A stand-in for the HTTP endpoint of CrateDB, which only uses the standard
+library, for tests and benchmarks which do not need a real cluster.
+
+Statements are answered by the first route whose pattern matches them, or
+with a synthetic result set of ``rows`` rows and ``width`` columns, whose
+object columns are nested ``nesting`` levels deep. Every response is delayed
+by ``latency`` seconds.
+
+Run it standalone to use it with crash::
+
+    python -m tests.fake_server --port 4200 --rows 1000 --width 8
+"""
+
+import gzip
+import json
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# type ids of the `col_types` of a response
+BOOLEAN = 3
+TEXT = 4
+DOUBLE = 6
+BIGINT = 10
+OBJECT = 12
+
+Request = namedtuple('Request', ['method', 'path', 'stmt', 'args', 'bulk_args'])
+
+
+class SQLError(Exception):
+    """
+    Error response of a statement, e.g. ``SQLError('SQLParseException[...]')``.
+    """
+
+    def __init__(self, message, code=4000, status=400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+
+
+class PartialResponse:
+    """
+    Response of a statement whose body is cut off after ``size`` bytes. The
+    connection is closed after waiting ``stall`` seconds, e.g. to run into
+    the read timeout of the client.
+    """
+
+    def __init__(self, result, size, stall=0):
+        self.result = result
+        self.size = size
+        self.stall = stall
+
+
+def synthetic_value(col, row, nesting):
+    kind = col % 5
+    if kind == 0:
+        return row
+    if kind == 1:
+        return 'value {0}-{1}'.format(row, col)
+    if kind == 2:
+        return row * 1.5
+    if kind == 3:
+        return row % 2 == 0
+    value = {'id': row, 'tags': ['a', 'b']}
+    for level in range(nesting):
+        value = {'level': nesting - level, 'child': value}
+    return value
+
+
+def synthetic_type(col):
+    return [BIGINT, TEXT, DOUBLE, BOOLEAN, OBJECT][col % 5]
+
+
+def synthetic_result(rows, width, nesting=0):
+    """
+    Return a result with ``rows`` rows of ``width`` columns, cycling through
+    bigint, text, double, boolean and object columns.
+    """
+    return {
+        'cols': ['col{0}'.format(i) for i in range(width)],
+        'col_types': [synthetic_type(i) for i in range(width)],
+        'rows': [[synthetic_value(col, row, nesting) for col in range(width)]
+                 for row in range(rows)],
+        'rowcount': rows,
+    }
+
+
+class FakeCrateDB:
+    """
+    Fake CrateDB node listening on ``host:port``, a free port by default.
+
+    ``route(pattern, response)`` answers the statements matching the regular
+    expression ``pattern`` (ignoring case) with ``response``: a result dict,
+    an ``SQLError``, a ``PartialResponse``, or a callable which takes the
+    statement and its arguments and returns or raises one of these. All received requests are
+    recorded in ``requests``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, rows=10, width=3, nesting=0,
+                 latency=0, version='5.8.0', node_name='fake',
+                 cluster_name='fake-cluster'):
+        self.rows = rows
+        self.width = width
+        self.nesting = nesting
+        self.latency = latency
+        self.version = version
+        self.node_name = node_name
+        self.cluster_name = cluster_name
+        self.requests = []
+        self._routes = []
+        self._server = ThreadingHTTPServer((host, port), _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+        self.route(r'^\s*select current_user, current_schema, name from sys\.cluster',
+                   {'cols': ['current_user', 'current_schema', 'name'],
+                    'col_types': [TEXT, TEXT, TEXT],
+                    'rows': [['crate', 'doc', cluster_name]],
+                    'rowcount': 1})
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def route(self, pattern, response):
+        # routes added later take precedence
+        self._routes.insert(0, (re.compile(pattern, re.IGNORECASE | re.DOTALL), response))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05},
+                                        name='fake-cratedb', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def info(self):
+        return {
+            'ok': True,
+            'status': 200,
+            'name': self.node_name,
+            'cluster_name': self.cluster_name,
+            'version': {'number': self.version},
+        }
+
+    def execute(self, stmt, args, bulk_args):
+        """
+        Return the response of a statement as a dict, or raise ``SQLError``.
+        """
+        started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        if bulk_args is not None:
+            result = {'cols': [], 'results': [{'rowcount': 1} for _ in bulk_args]}
+        else:
+            result = self._resolve(stmt, args)
+        if isinstance(result, PartialResponse):
+            return result
+        result.setdefault('duration', (time.perf_counter() - started) * 1000.0)
+        return result
+
+    def _resolve(self, stmt, args):
+        for pattern, response in self._routes:
+            if pattern.search(stmt):
+                if callable(response):
+                    response = response(stmt, args)
+                if isinstance(response, SQLError):
+                    raise response
+                if isinstance(response, PartialResponse):
+                    return response
+                return dict(response)
+        return synthetic_result(self.rows, self.width, self.nesting)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        fake.requests.append(Request('GET', self.path, None, None, None))
+        self._send(200, fake.info())
+
+    def do_POST(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if url.path != '/_sql':
+            self._send(404, {'error': {'message': 'No handler found', 'code': 4040}})
+            return
+        payload = json.loads(body)
+        stmt = payload.get('stmt', '')
+        args = payload.get('args')
+        bulk_args = payload.get('bulk_args')
+        fake.requests.append(Request('POST', self.path, stmt, args, bulk_args))
+        params = parse_qs(url.query)
+        try:
+            result = fake.execute(stmt, args, bulk_args)
+        except SQLError as e:
+            response = {'error': {'message': e.message, 'code': e.code}}
+            if params.get('error_trace') == ['true']:
+                response['error_trace'] = 'io.crate.exceptions: ' + e.message
+            self._send(e.status, response)
+            return
+        if isinstance(result, PartialResponse):
+            self._send(200, result.result, size=result.size)
+            time.sleep(result.stall)
+            self.close_connection = True
+            return
+        if params.get('types') != ['true']:
+            result.pop('col_types', None)
+        self._send(200, result)
+
+    def _send(self, status, obj, size=None):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:size])
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4200)
+    parser.add_argument('--rows', type=int, default=10,
+                        help='number of rows of the synthetic results')
+    parser.add_argument('--width', type=int, default=3,
+                        help='number of columns of the synthetic results')
+    parser.add_argument('--nesting', type=int, default=0,
+                        help='nesting depth of the object columns')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of every response in seconds')
+    args = parser.parse_args()
+    server = FakeCrateDB(args.host, args.port, rows=args.rows, width=args.width,
+                         nesting=args.nesting, latency=args.latency)
+    print('Listening on ' + server.url)
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+from unittest import TestCase
+
+from crate.crash.bench import (
+    BenchmarkResult,
+    parse_bench_args,
+    percentile,
+    run_benchmark,
+)
+from crate.crash.command import CrateShell
+from tests.fake_server import FakeCrateDB, SQLError
+from tests.util import FakeServerTestCase
+
+
+class ParseBenchArgsTest(TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(parse_bench_args(' select 1 '),
+                         ({'iterations': 100, 'concurrency': 1, 'warmup': 0}, 'select 1'))
+
+    def test_options(self):
+        self.assertEqual(parse_bench_args('-n 10 --warmup 2 -c 4 select -1'),
+                         ({'iterations': 10, 'concurrency': 4, 'warmup': 2}, 'select -1'))
+
+    def test_comment_is_not_an_option(self):
+        self.assertEqual(parse_bench_args('-n 5 -- comment\nselect 1')[1], '-- comment\nselect 1')
+
+    def test_invalid(self):
+        for args in ('-n', '-n x select 1', '-c 0 select 1', '--warmup -1 select 1'):
+            with self.assertRaises(ValueError, msg=args):
+                parse_bench_args(args)
+
+
+class BenchmarkResultTest(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_rows(self):
+        result = BenchmarkResult()
+        for wall, server in [(4.0, 1.0), (2.0, 1.5), (3.0, 1.0)]:
+            result.add(wall, server)
+        result.add_error(ValueError('boom'))
+        self.assertEqual(result.runs, 4)
+        self.assertEqual(result.rows(), [
+            ['min', 2.0, 1.0, 0.5],
+            ['p50', 3.0, 1.0, 2.0],
+            ['p95', 4.0, 1.5, 3.0],
+            ['p99', 4.0, 1.5, 3.0],
+            ['max', 4.0, 1.5, 3.0],
+            ['mean', 3.0, 1.167, 1.833],
+        ])
+        self.assertEqual(result.error_messages, {'ValueError': 'boom'})
+
+    def test_no_runs(self):
+        self.assertEqual(BenchmarkResult().rows()[0], ['min', None, None, None])
+
+
+class RunBenchmarkTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB(rows=2, width=2).start()
+        self.cmd = CrateShell([self.server.url], is_tty=False, batch=True)
+
+    def tearDown(self):
+        self.cmd.close()
+        self.server.stop()
+
+    def test_run(self):
+        connections = []
+
+        def create_connection():
+            connection = self.cmd.create_connection([self.server.url])
+            connections.append(connection)
+            return connection
+
+        self.server.route(r'^select x', {'cols': ['x'], 'rows': [[1]], 'rowcount': 1})
+        result = run_benchmark(create_connection, 'select x', 20, concurrency=3, warmup=5)
+        self.assertEqual(len(connections), 3)
+        self.assertEqual(len([r for r in self.server.requests if r.stmt == 'select x']), 25)
+        self.assertEqual(len(result.wall), 20)
+        self.assertEqual(result.runs, 20)
+        self.assertGreater(result.throughput, 0)
+        self.assertTrue(all(w >= s for w, s in zip(result.wall, result.server)))
+        self.assertFalse(result.interrupted)
+
+    def test_errors(self):
+        self.server.route(r'^select fail', SQLError('SQLParseException[boom]'))
+        result = run_benchmark(lambda: self.cmd.create_connection([self.server.url]),
+                               'select fail', 4, concurrency=2)
+        self.assertEqual(result.errors, {'ProgrammingError': 4})
+        self.assertEqual(result.error_messages, {'ProgrammingError': 'SQLParseException[boom]'})
+        self.assertEqual(result.wall, [])
+
+
+class BenchCommandTest(FakeServerTestCase):
+
+    server_options = {'rows': 2, 'width': 2}
+
+    def setUp(self):
+        super().setUp()
+        self.server.route(r'^select fail', SQLError('SQLParseException[boom]'))
+
+    def test_command(self):
+        code, output, messages = self.run_main('--format', 'json',
+                                                '-c', '\\bench -n 10 -c 2 select 1')
+        self.assertEqual(code, 0)
+        stats = json.loads(output)
+        self.assertEqual([s['stat'] for s in stats], ['min', 'p50', 'p95', 'p99', 'max', 'mean'])
+        self.assertEqual(set(stats[0]), {'stat', 'wall_ms', 'server_ms', 'client_ms'})
+        self.assertRegex(messages[-1], r'^BENCH 10 runs on 2 connections in [\d.]+ sec, '
+                                       r'[\d,.]+ statements/sec, 0 errors$')
+
+    def test_errors_fail(self):
+        code, _, messages = self.run_main('--format', 'json', '-c', '\\bench -n 3 select fail')
+        self.assertEqual(code, 1)
+        self.assertEqual(messages[-1], '3 x ProgrammingError: SQLParseException[boom]')
@@ -0,0 +1,109 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from verlib2 import Version
+
+from crate.crash.cache import MetadataCache
+from crate.crash.catalog import Catalog, CatalogSnapshot
+from crate.crash.command import ConnectionMeta
+from crate.crash.repl import SQLCompleter
+
+
+class MetadataCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_set_and_get(self):
+        cache = MetadataCache(self.tmp_dir, 'my cluster', Version('5.4.5'))
+        self.assertIsNone(cache.get('keywords'))
+        cache.set('keywords', ['select', 'from'])
+        self.assertEqual(cache.get('keywords'), ['select', 'from'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmp_dir, 'my_cluster', 'keywords.json')))
+
+    def test_invalidated_by_version(self):
+        MetadataCache(self.tmp_dir, 'cr8', '5.4.5').set('keywords', ['select'])
+        self.assertIsNone(MetadataCache(self.tmp_dir, 'cr8', '5.5.0').get('keywords'))
+        self.assertEqual(MetadataCache(self.tmp_dir, 'cr8', '5.4.5').get('keywords'), ['select'])
+
+    def test_keyed_by_cluster(self):
+        MetadataCache(self.tmp_dir, 'cr8', '5.4.5').set('keywords', ['select'])
+        self.assertIsNone(MetadataCache(self.tmp_dir, 'other', '5.4.5').get('keywords'))
+
+    def test_invalidated_by_ttl(self):
+        cache = MetadataCache(self.tmp_dir, 'cr8', '5.4.5', ttl=60)
+        with patch('crate.crash.cache.time.time', return_value=1000):
+            cache.set('keywords', ['select'])
+        with patch('crate.crash.cache.time.time', return_value=1050):
+            self.assertEqual(cache.get('keywords'), ['select'])
+        with patch('crate.crash.cache.time.time', return_value=1061):
+            self.assertIsNone(cache.get('keywords'))
+
+    def test_corrupt_entry(self):
+        cache = MetadataCache(self.tmp_dir, 'cr8', '5.4.5')
+        cache.set('keywords', ['select'])
+        with open(os.path.join(cache.path, 'keywords.json'), 'w') as f:
+            f.write('{"version": ')
+        self.assertIsNone(cache.get('keywords'))
+
+    def test_for_shell(self):
+        cmd = Mock(connect_info=ConnectionMeta('crate', 'doc', 'cr8'),
+                   last_connected_servers=['localhost:4200'])
+        cmd.connection.lowest_server_version = Version('5.4.5')
+        cache = MetadataCache.for_shell(self.tmp_dir, cmd)
+        self.assertEqual(cache.path, os.path.join(self.tmp_dir, 'cr8'))
+        self.assertEqual(cache.version, '5.4.5')
+
+    def test_completer_starts_from_cache(self):
+        cache = MetadataCache(self.tmp_dir, 'cr8', '5.4.5')
+        cache.set('keywords', ['cached'])
+        cmd = Mock()
+        cmd.connection.cursor.return_value.fetchall.return_value = [('select',)]
+        completer = SQLCompleter(cmd, cache=cache)
+        self.assertIn(completer.keywords, (['cached'], ['select']))
+        completer._revalidation.join()
+        self.assertEqual(completer.keywords, ['select'])
+        self.assertEqual(cache.get('keywords'), ['select'])
+        cmd.cursor.execute.assert_not_called()
+
+    def test_catalog_starts_from_cache(self):
+        cache = MetadataCache(self.tmp_dir, 'cr8', '5.4.5')
+        snapshot = CatalogSnapshot(['doc'], [('doc', 't1')], [('t1', 'x')], [])
+        Catalog(Mock(), cache=cache).update(snapshot)
+        self.assertIsNone(cache.get('catalog'))
+
+        cursor = Mock()
+        cursor.fetchall.side_effect = [[['doc', 't1']], [['t1', 'x']], [], []]
+        cmd = Mock()
+        cmd.connection.cursor.return_value = cursor
+        self.assertTrue(Catalog(cmd, cache=cache).refresh())
+
+        catalog = Catalog(Mock(), cache=cache)
+        self.assertEqual(catalog.snapshot, snapshot)
+        self.assertEqual(list(catalog.complete('t1')), [('t1', 'table')])
@@ -0,0 +1,140 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import time
+from unittest import TestCase
+from unittest.mock import Mock
+
+from crate.client.exceptions import ProgrammingError
+from crate.crash.catalog import Catalog, CatalogSnapshot, PrefixTrie, build_index
+
+
+class PrefixTrieTest(TestCase):
+
+    def setUp(self):
+        self.trie = PrefixTrie()
+        for word in ['select', 'selection', 'set', 'Sensors', 'table']:
+            self.trie.add(word)
+
+    def test_complete_in_lexicographic_order(self):
+        self.assertEqual(
+            [value for value, _ in self.trie.complete('se')],
+            ['select', 'selection', 'Sensors', 'set'])
+
+    def test_complete_is_case_insensitive(self):
+        self.assertEqual(list(self.trie.complete('SENS')), [('Sensors', None)])
+
+    def test_complete_limit(self):
+        self.assertEqual(len(list(self.trie.complete('s', limit=2))), 2)
+
+    def test_complete_unknown_prefix(self):
+        self.assertEqual(list(self.trie.complete('x')), [])
+
+    def test_len_and_contains(self):
+        self.assertEqual(len(self.trie), 5)
+        self.assertIn('SET', self.trie)
+        self.assertNotIn('se', self.trie)
+
+    def test_same_key_different_kinds(self):
+        self.trie.add('table', kind='column')
+        self.assertEqual(len(self.trie), 5)
+        self.assertEqual(sorted(self.trie.complete('table'), key=str),
+                         sorted([('table', None), ('table', 'column')], key=str))
+
+
+class CatalogTest(TestCase):
+
+    snapshot = CatalogSnapshot(
+        schemas=['doc', 'sys'],
+        tables=[('doc', 'sensors'), ('sys', 'nodes')],
+        columns=[('sensors', 'id'), ('sensors', "payload['temperature']")],
+        functions=['my_udf'],
+    )
+
+    def test_build_index(self):
+        names, qualified = build_index(self.snapshot)
+        self.assertEqual(list(names.complete('sens')), [('sensors', 'table')])
+        self.assertEqual(list(names.complete("payload['")),
+                         [("payload['temperature']", 'column')])
+        self.assertEqual(list(names.complete('my_')), [('my_udf', 'function')])
+        self.assertEqual(list(qualified.complete('doc.')), [('doc.sensors', 'table')])
+        self.assertEqual(list(qualified.complete('sensors.p')),
+                         [("sensors.payload['temperature']", 'column')])
+
+    def test_refresh(self):
+        cursor = Mock()
+        cursor.fetchall.side_effect = [
+            [['doc', 'sensors'], ['sys', 'nodes']],
+            [['sensors', 'id']],
+            [['my_udf']],
+            [['my_udf'], ['abs']],
+        ]
+        cmd = Mock()
+        cmd.connection.cursor.return_value = cursor
+        catalog = Catalog(cmd)
+        self.assertTrue(catalog.refresh())
+        self.assertEqual(catalog.snapshot, CatalogSnapshot(
+            ['doc', 'sys'], [('doc', 'sensors'), ('sys', 'nodes')],
+            [('sensors', 'id')], ['my_udf', 'abs']))
+        self.assertEqual(list(catalog.complete('sens')), [('sensors', 'table')])
+        cursor.close.assert_called_once_with()
+
+    def test_refresh_keeps_snapshot_on_error(self):
+        cmd = Mock()
+        cmd.connection.cursor.return_value.execute.side_effect = ProgrammingError('nope')
+        catalog = Catalog(cmd)
+        catalog.update(self.snapshot)
+        self.assertFalse(catalog.refresh())
+        self.assertEqual(catalog.snapshot, self.snapshot)
+
+    def test_refresh_without_connection(self):
+        cmd = Mock()
+        cmd.is_conn_available.return_value = False
+        self.assertFalse(Catalog(cmd).refresh())
+        cmd.connection.cursor.assert_not_called()
+
+    def test_no_refresh_while_autocomplete_is_off(self):
+        cmd = Mock()
+        cmd.should_autocomplete.return_value = False
+        catalog = Catalog(cmd, refresh_interval=0.01)
+        catalog.start()
+        time.sleep(0.05)
+        catalog.stop()
+        catalog._thread.join()
+        cmd.connection.cursor.assert_not_called()
+        # completing again refreshes the snapshot
+        catalog.refresh_async = Mock()
+        list(catalog.complete('sens'))
+        catalog.refresh_async.assert_called_once_with()
+
+    def test_lookup(self):
+        cursor = Mock()
+        cursor.fetchall.side_effect = [
+            [['doc', 'sensors'], ['doc', 'sensor1']],
+            [['sensor_id']],
+        ]
+        cmd = Mock()
+        cmd.connection.cursor.return_value = cursor
+        catalog = Catalog(cmd)
+        catalog.update(self.snapshot)
+        catalog.refresh_async = Mock()
+        self.assertEqual(catalog.lookup('Sensor_'), [('sensor_id', 'column')])
+        cursor.execute.assert_called_with(Catalog.LOOKUP_COLUMNS_QUERY, ('Sensor_%', 100))
+        catalog.refresh_async.assert_called_once_with()
+        self.assertEqual(catalog.lookup('doc.sens'), [])
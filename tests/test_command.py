@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 # vim: set fileencodings=utf-8
 
+import subprocess
+import sys
 from unittest import TestCase
+from unittest.mock import Mock, patch
 
 from verlib2 import Version
 
 from crate.crash.command import (
+    ConnectionMeta,
+    CrateShell,
     Result,
     _decode_timeout,
     _decode_timeouts,
@@ -151,6 +156,103 @@ class CommandUtilsTest(TestCase):
                                              "expected format `<connect_sec>,<read_sec>`")
 
 
+class ProcessLinesTest(TestCase):
+
+    def test_statements_are_executed_when_complete(self):
+        events = []
+        cmd = Mock(spec=CrateShell)
+        cmd._process_sql.side_effect = lambda text: events.append(('exec', text))
+        cmd._try_exec_cmd.side_effect = lambda line: events.append(('cmd', line))
+
+        def lines():
+            for line in ["select 1;", "select 'a;", "b';", "create function f() as $$ x;",
+                         "$$;", "\\dt", "select 2"]:
+                events.append(('read', line))
+                yield line
+
+        CrateShell._process_lines(cmd, lines())
+        self.assertEqual(events, [
+            ('read', 'select 1;'),
+            ('exec', 'select 1;'),
+            ('read', "select 'a;"),
+            ('read', "b';"),
+            ('exec', "select 'a;\nb';"),
+            ('read', 'create function f() as $$ x;'),
+            ('read', '$$;'),
+            ('exec', 'create function f() as $$ x;\n$$;'),
+            ('read', '\\dt'),
+            ('exec', ''),
+            ('cmd', 'dt'),
+            ('read', 'select 2'),
+            ('exec', 'select 2'),
+        ])
+
+
+@patch('crate.client.http.Client.sql')
+@patch('crate.client.http.Client.server_infos',
+       return_value=('http://localhost:4200', 'node', '5.8.0'))
+class BatchModeTest(TestCase):
+
+    def create_shell(self, batch):
+        return CrateShell(output_writer=Mock(), is_tty=False, batch=batch)
+
+    def test_statement_is_first_request(self, server_infos, sql):
+        sql.return_value = {'cols': ['x'], 'rows': [[1]], 'rowcount': 1, 'duration': 1}
+        cmd = self.create_shell(batch=True)
+        cmd.process('select 1;')
+        server_infos.assert_not_called()
+        sql.assert_called_once_with('select 1;', None, None)
+
+        # the session info is fetched when it is needed
+        sql.return_value = {'cols': ['u', 's', 'n'], 'rows': [['crate', 'doc', 'c']],
+                            'rowcount': 1, 'duration': 1}
+        self.assertEqual(cmd.connect_info, ConnectionMeta('crate', 'doc', 'c'))
+        server_infos.assert_called_once()
+        self.assertEqual(sql.call_count, 2)
+
+    def test_interactive_mode_checks_connection(self, server_infos, sql):
+        sql.return_value = {'cols': ['u', 's', 'n'], 'rows': [['crate', 'doc', 'c']],
+                            'rowcount': 1, 'duration': 1}
+        cmd = self.create_shell(batch=False)
+        server_infos.assert_called_once()
+        sql.assert_called_once()
+        self.assertEqual(cmd.connect_info, ConnectionMeta('crate', 'doc', 'c'))
+
+
+class LazyImportTest(TestCase):
+
+    HEAVY_MODULES = ['crate.client', 'urllib3', 'sqlparse', 'verlib2',
+                     'pygments', 'prompt_toolkit', 'tabulate']
+
+    def loaded_modules(self, code):
+        out = subprocess.check_output([sys.executable, '-c', code + (
+            '\nimport sys; print(" ".join(m for m in {0!r} if m in sys.modules))'
+        ).format(self.HEAVY_MODULES)], universal_newlines=True)
+        return out.split()
+
+    def test_version(self):
+        code = ("import sys; sys.argv = ['crash', '--version']\n"
+                "from crate.crash.command import main\n"
+                "try:\n"
+                "    main()\n"
+                "except SystemExit:\n"
+                "    pass")
+        self.assertEqual(self.loaded_modules(code), [])
+
+    def test_output_formats(self):
+        code = ("import io\n"
+                "from crate.crash.command import Result\n"
+                "from crate.crash.outputs import OutputWriter\n"
+                "result = Result(['x'], [[1]], 1, 1, 80)\n"
+                "writer = OutputWriter(io.StringIO(), is_tty=True)\n"
+                "writer.csv(result)\n")
+        self.assertEqual(self.loaded_modules(code), [])
+        self.assertEqual(
+            self.loaded_modules(code + 'list(writer.tabular(result))'), ['tabulate'])
+        self.assertEqual(
+            self.loaded_modules(code + 'list(writer.json(result))'), ['pygments'])
+
+
 class TestGetInformationSchemaQuery(TestCase):
 
     def test_low_version(self):
@@ -33,11 +33,16 @@ from crate.crash.command import CrateShell
 from crate.crash.commands import (
     CheckCommand,
     ClusterCheckCommand,
+    LimitCommand,
     NodeCheckCommand,
+    ProfileCommand,
     ReadFileCommand,
     ToggleAutoCapitalizeCommand,
     ToggleAutocompleteCommand,
+    ToggleTimingCommand,
     ToggleVerboseCommand,
+    WatchCommand,
+    highlight_changes,
 )
 from tests.util import fake_cursor
 
@@ -130,6 +135,73 @@ class ToggleVerboseCommandTest(TestCase):
         self.assertEqual(fake_cmd.reconnect.call_count, 1)
 
 
+class ToggleTimingCommandTest(TestCase):
+
+    @patch('crate.crash.command.CrateShell')
+    def test_toggle_output(self, fake_cmd):
+        fake_cmd.timing = False
+        command = ToggleTimingCommand()
+        output = command(fake_cmd)
+        self.assertEqual(output, 'Timing ON')
+        self.assertTrue(fake_cmd.timing)
+        output = command(fake_cmd)
+        self.assertEqual(output, 'Timing OFF')
+
+
+class ProfileCommandTest(TestCase):
+
+    def test_on_and_off(self):
+        cmd = Mock(profiler=None)
+        command = ProfileCommand()
+        self.assertEqual(command(cmd, 'on /tmp/out.prof'),
+                         'Profiling ON, writing to /tmp/out.prof when turned off')
+        self.assertEqual(cmd.profiler.path, '/tmp/out.prof')
+        self.assertFalse(cmd.profiler.stacks)
+        self.assertEqual(command(cmd, 'off'), 'Profiling OFF')
+        cmd.stop_profiling.assert_called_once_with()
+
+    def test_stacks(self):
+        cmd = Mock(profiler=None)
+        command = ProfileCommand()
+        command(cmd, 'stacks')
+        self.assertEqual(cmd.profiler.path, 'crash.prof')
+        self.assertTrue(cmd.profiler.stacks)
+
+    def test_off_when_not_profiling(self):
+        cmd = Mock(profiler=None)
+        self.assertEqual(ProfileCommand()(cmd, 'off'), 'Profiling is not ON')
+        cmd.stop_profiling.assert_not_called()
+
+    def test_status(self):
+        cmd = Mock(profiler=None)
+        self.assertEqual(ProfileCommand()(cmd), 'Profiling OFF\nUse one of: on, stacks, off')
+
+
+class LimitCommandTest(TestCase):
+
+    def test_set_and_reset(self):
+        cmd = Mock(max_result_rows=None, max_result_bytes=None)
+        command = LimitCommand()
+        self.assertEqual(command(cmd), 'Result limits: rows OFF, bytes OFF')
+        self.assertEqual(command(cmd, 'rows 1000'), 'Result limits: rows 1000, bytes OFF')
+        self.assertEqual(command(cmd, 'bytes 512MB'), 'Result limits: rows 1000, bytes 512.0 MiB')
+        self.assertEqual(cmd.max_result_bytes, 512 * 1024 ** 2)
+        self.assertEqual(command(cmd, 'rows off'), 'Result limits: rows OFF, bytes 512.0 MiB')
+        self.assertEqual(command(cmd, 'off'), 'Result limits: rows OFF, bytes OFF')
+        self.assertIsNone(cmd.max_result_bytes)
+
+    def test_invalid(self):
+        cmd = Mock(max_result_rows=None, max_result_bytes=None)
+        command = LimitCommand()
+        self.assertIsNone(command(cmd, 'rows -1'))
+        cmd.logger.critical.assert_called_with('Invalid number of rows: -1')
+        self.assertIsNone(command(cmd, 'bytes lots'))
+        cmd.logger.critical.assert_called_with('Invalid size: lots')
+        self.assertIsNone(command(cmd, 'rows'))
+        cmd.logger.critical.assert_called_with('Use one of: rows <N>|off, bytes <SIZE>|off, off')
+        self.assertIsNone(cmd.max_result_rows)
+
+
 class ShowTablesCommandTest(TestCase):
 
     def test_post_2_0(self):
@@ -267,6 +339,72 @@ class ChecksCommandTest(TestCase):
         cmd.logger.info.assert_called_with('NODE CHECK OK')
 
 
+class WatchCommandTest(TestCase):
+
+    def _fake_cmd(self, fake_cmd, rows):
+        fake_cmd.exit_code = 0
+        fake_cmd._exec.return_value = True
+        fake_cmd.cursor.description = [('name', ), ('running', )]
+        fake_cmd.cursor.fetchall.side_effect = rows
+        fake_cmd.cursor.rowcount = 1
+        fake_cmd.cursor.duration = 12
+        fake_cmd.output_writer.is_tty = False
+        return fake_cmd
+
+    @patch('crate.crash.commands.time.sleep', side_effect=[None, KeyboardInterrupt])
+    @patch('crate.crash.command.CrateShell')
+    def test_watch_given_statement(self, fake_cmd, sleep):
+        cmd = self._fake_cmd(fake_cmd, [[['job1', 1]], [['job1', 2]]])
+        WatchCommand()(cmd, '0.5 SELECT name, running FROM sys.jobs')
+        cmd._exec.assert_has_calls([
+            call('SELECT name, running FROM sys.jobs'),
+            call('SELECT name, running FROM sys.jobs'),
+        ])
+        cmd.pprint.assert_called_with([['job1', 2]], ['name', 'running'])
+        cmd.logger.info.assert_has_calls([
+            call('1 row in set (0.012 sec)'),
+            call('Stopped watching'),
+        ])
+
+    @patch('crate.crash.commands.time.sleep', side_effect=KeyboardInterrupt)
+    @patch('crate.crash.command.CrateShell')
+    def test_watch_last_statement(self, fake_cmd, sleep):
+        cmd = self._fake_cmd(fake_cmd, [[['job1', 1]]])
+        cmd.last_statement = 'SELECT 1'
+        WatchCommand()(cmd, '1')
+        cmd._exec.assert_called_once_with('SELECT 1')
+
+    @patch('crate.crash.command.CrateShell')
+    def test_watch_stops_on_error(self, fake_cmd):
+        cmd = self._fake_cmd(fake_cmd, [])
+        cmd._exec.return_value = False
+        WatchCommand()(cmd, '1 SELECT x')
+        self.assertEqual(cmd.exit_code, 1)
+        cmd.pprint.assert_not_called()
+
+    @patch('crate.crash.command.CrateShell')
+    def test_watch_invalid_arguments(self, fake_cmd):
+        cmd = self._fake_cmd(fake_cmd, [])
+        cmd.last_statement = None
+        WatchCommand()(cmd, 'foo')
+        cmd.logger.critical.assert_called_with('Invalid interval: foo')
+        WatchCommand()(cmd, '0')
+        cmd.logger.critical.assert_called_with('Interval must be greater than 0')
+        WatchCommand()(cmd, '2')
+        cmd.logger.critical.assert_called_with('No statement to watch')
+        cmd._exec.assert_not_called()
+
+    def test_highlight_changes(self):
+        rows = [['a', 1], ['b', 2], ['c', 3]]
+        self.assertEqual(highlight_changes(rows, None), rows)
+        result = highlight_changes(rows, [['a', 1], ['b', 5]])
+        self.assertEqual(result[0], ['a', 1])
+        self.assertEqual(result[1][0], 'b')
+        self.assertIn('2', result[1][1])
+        self.assertNotEqual(result[1][1], 2)
+        self.assertTrue(all(isinstance(v, str) for v in result[2]))
+
+
 @patch('crate.client.connection.Cursor', fake_cursor())
 class CommentsTest(TestCase):
 
@@ -0,0 +1,128 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import asyncio
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import Mock
+
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+
+from crate.crash.catalog import Catalog, CatalogSnapshot
+from crate.crash.completion import BackgroundCompleter
+from crate.crash.repl import SQLCompleter
+
+
+def complete(completer, text):
+    async def collect():
+        return [(c.text, c.display_meta_text) async for c in
+                completer.get_completions_async(Document(text), CompleteEvent())]
+    return asyncio.run(collect())
+
+
+class BackgroundCompleterTest(TestCase):
+
+    def setUp(self):
+        cmd = Mock()
+        cmd.should_autocomplete.return_value = True
+        cmd.should_fuzzy_complete.return_value = False
+        cmd.cursor.fetchall.return_value = [('select',), ('sensitive',)]
+        catalog = Catalog(cmd)
+        catalog.update(CatalogSnapshot(['doc'], [('doc', 'sensors')], [], []))
+        self.completer = SQLCompleter(cmd, catalog=catalog)
+        self.lookups = []
+        self.lookup_delay = 0
+
+    def tearDown(self):
+        self.background.close()
+
+    def lookup(self, prefix):
+        self.lookups.append(prefix)
+        time.sleep(self.lookup_delay)
+        return [('metrics', 'table'), ('metric_name', 'column')]
+
+    def test_local_completions_only_for_known_names(self):
+        self.background = BackgroundCompleter(self.completer, lookup=self.lookup)
+        self.assertEqual(complete(self.background, 'select * from sen'), [
+            ('SENSITIVE', ''),
+            ('sensors', 'table'),
+        ])
+        self.assertEqual(self.lookups, [])
+
+    def test_unknown_names_are_looked_up(self):
+        self.background = BackgroundCompleter(self.completer, lookup=self.lookup)
+        self.assertEqual(complete(self.background, 'select * from met'), [
+            ('metrics', 'table'),
+            ('metric_name', 'column'),
+        ])
+        # the result is cached
+        complete(self.background, 'select * from met')
+        self.assertEqual(self.lookups, ['met'])
+
+    def test_keywords_and_functions_are_not_looked_up(self):
+        self.background = BackgroundCompleter(self.completer, lookup=self.lookup)
+        self.completer.keywords = ['select', 'sensitive', 'between']
+        complete(self.background, 'select * from t where a BETWEEN')
+
+        async def complete_function():
+            document = Document('select metric_avg(x) from t', cursor_position=len('select met'))
+            return [c async for c in self.background.get_completions_async(
+                document, CompleteEvent())]
+        asyncio.run(complete_function())
+        self.assertEqual(self.lookups, [])
+
+    def test_lookups_are_debounced(self):
+        self.background = BackgroundCompleter(self.completer, lookup=self.lookup, delay=0.2)
+
+        async def type_quickly():
+            first = self.background.get_completions_async(
+                Document('select * from met'), CompleteEvent())
+            second = self.background.get_completions_async(
+                Document('select * from metr'), CompleteEvent())
+            await asyncio.gather(*(self.collect(c) for c in (first, second)))
+        asyncio.run(type_quickly())
+        self.assertEqual(self.lookups, ['metr'])
+
+    async def collect(self, completions):
+        return [c async for c in completions]
+
+    def test_slow_lookups_are_not_waited_for(self):
+        self.lookup_delay = 0.5
+        self.background = BackgroundCompleter(self.completer, lookup=self.lookup, budget=0.05)
+        started = time.perf_counter()
+        self.assertEqual(complete(self.background, 'select * from met'), [])
+        self.assertLess(time.perf_counter() - started, 0.4)
+        # the lookup finishes in the background and is used by later requests
+        self.background._remote_executor.submit(lambda: None).result()
+        self.assertEqual(complete(self.background, 'select * from met'), [
+            ('metrics', 'table'),
+            ('metric_name', 'column'),
+        ])
+
+    def test_superseded_lookups_are_skipped(self):
+        self.background = BackgroundCompleter(self.completer, lookup=self.lookup, budget=0.05)
+        blocked = threading.Event()
+        self.background._remote_executor.submit(blocked.wait)
+        complete(self.background, 'select * from met')
+        complete(self.background, 'select * from metr')
+        blocked.set()
+        self.background._remote_executor.submit(lambda: None).result()
+        self.assertEqual(self.lookups, ['metr'])
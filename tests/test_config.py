@@ -126,6 +126,21 @@ class ConfigurationTest(TestCase):
         with open(path) as fp:
             self.assertTrue(fp.read().startswith('[crash]'))
 
+    def test_modified(self):
+        path = os.path.join(self.tmp_dir, 'modified.cfg')
+
+        conf = Configuration(path)
+        self.assertTrue(conf.modified)
+        conf.get_or_set('format', 'json')
+        conf.save()
+        self.assertFalse(conf.modified)
+
+        conf = Configuration(path)
+        conf.get_or_set('format', 'tabular')
+        self.assertFalse(conf.modified)
+        conf.get_or_set('verbosity', 0)
+        self.assertTrue(conf.modified)
+
     def test_read_boolean(self):
         path = os.path.join(self.tmp_dir, 'bwc.cfg')
 
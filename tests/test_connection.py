@@ -0,0 +1,152 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+from unittest import TestCase
+
+from crate.crash.command import CrateShell, _decode_timeouts
+from crate.crash.connection import ResultGuard, ResultTooLarge
+from crate.crash.results import SpilledRows
+from tests.fake_server import BIGINT, FakeCrateDB, PartialResponse
+from tests.util import FakeServerTestCase
+
+
+class ResultGuardTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB(rows=50, width=5).start()
+        self.cmd = CrateShell(crate_hosts=[self.server.url], is_tty=False)
+
+    def tearDown(self):
+        self.cmd.close()
+        self.server.stop()
+
+    def execute(self, stmt, max_rows=None, max_bytes=None):
+        client = self.cmd.connection.client
+        with ResultGuard(client, max_rows, max_bytes):
+            self.cmd.cursor.execute(stmt)
+        # the hooks are removed again
+        self.assertNotIn('_request', vars(client))
+        return self.cmd.cursor.fetchall()
+
+    def test_within_limits(self):
+        self.assertEqual(len(self.execute('select * from t', max_rows=50, max_bytes=1024 ** 2)), 50)
+
+    def test_too_many_rows(self):
+        with self.assertRaises(ResultTooLarge) as e:
+            self.execute('select * from t', max_rows=49)
+        self.assertEqual(e.exception.message,
+                         'The result has 50 rows, more than the limit of 49 rows')
+
+    def test_row_count_is_checked_before_decoding(self):
+        self.server.route(r'^select count', {'cols': ['n'], 'col_types': [BIGINT],
+                                             'rows': [[1]], 'rowcount': 500})
+        with self.assertRaises(ResultTooLarge) as e:
+            self.execute('select count', max_rows=100)
+        self.assertEqual(e.exception.message,
+                         'The result has 500 rows, more than the limit of 100 rows')
+
+    def test_affected_rows_are_not_limited(self):
+        self.server.route(r'^update', {'cols': [], 'rows': [], 'rowcount': 5000})
+        self.assertEqual(self.execute('update t set x = 1', max_rows=100), [])
+        self.assertEqual(self.cmd.cursor.rowcount, 5000)
+
+    def test_response_too_large(self):
+        with self.assertRaises(ResultTooLarge) as e:
+            self.execute('select * from t', max_bytes=1024)
+        self.assertEqual(e.exception.message, 'The result is larger than the limit of 1.0 KiB')
+        # the connection can still be used
+        self.assertEqual(len(self.execute('select * from t')), 50)
+
+    def test_decoded_rows_too_large(self):
+        # the response is about 3 KiB, the decoded rows take several times that
+        with self.assertRaises(ResultTooLarge) as e:
+            self.execute('select * from t', max_bytes=8 * 1024)
+        self.assertRegex(e.exception.message,
+                         r'^The result takes about [\d.]+ KiB of memory, '
+                         r'more than the limit of 8.0 KiB$')
+
+    def test_large_responses_are_spilled(self):
+        cursor = self.cmd.cursor
+        cursor.execute('select * from t')
+        expected = cursor.fetchall()
+        with ResultGuard(self.cmd.connection.client, spill_threshold=1024):
+            cursor.execute('select * from t')
+        with cursor._result['rows'] as rows:
+            self.assertIsInstance(rows, SpilledRows)
+            self.assertEqual(list(rows), expected)
+            self.assertEqual(cursor.rowcount, 50)
+            self.assertEqual([c[0] for c in cursor.description], ['col0', 'col1', 'col2', 'col3', 'col4'])
+
+        # small responses are decoded as usual
+        with ResultGuard(self.cmd.connection.client, spill_threshold=1024 ** 2):
+            cursor.execute('select * from t')
+        self.assertEqual(cursor._result['rows'], expected)
+
+    def test_limits_while_spilling(self):
+        with self.assertRaises(ResultTooLarge) as e:
+            with ResultGuard(self.cmd.connection.client, max_rows=20, spill_threshold=1024):
+                self.cmd.cursor.execute('select * from t')
+        self.assertEqual(e.exception.message,
+                         'The result has 50 rows, more than the limit of 20 rows')
+        with self.assertRaises(ResultTooLarge) as e:
+            with ResultGuard(self.cmd.connection.client, max_bytes=2048, spill_threshold=1024):
+                self.cmd.cursor.execute('select * from t')
+        self.assertEqual(e.exception.message, 'The result is larger than the limit of 2.0 KiB')
+
+    def test_broken_responses(self):
+        result = {'cols': ['x'], 'rows': [[1]] * 100, 'rowcount': 100}
+        self.server.route(r'^select cut', PartialResponse(result, size=100))
+        self.server.route(r'^select stalled', PartialResponse(result, size=100, stall=2))
+        self.cmd.close()
+        self.cmd = CrateShell(crate_hosts=[self.server.url], is_tty=False,
+                              timeout=_decode_timeouts('5,0.2'))
+        messages = []
+        self.cmd.logger.warn = messages.append
+        self.cmd.max_result_rows = 1000
+        for stmt in ('select cut', 'select stalled'):
+            # the errors are reported like those of unavailable servers
+            with ResultGuard(self.cmd.connection.client, max_rows=1000):
+                self.assertFalse(self.cmd._exec(stmt))
+            self.assertFalse(self.cmd._exec_and_print(stmt))
+        self.assertEqual(messages, ['Use \\connect <server> to connect to one or more servers first.'] * 4)
+
+
+class ResultLimitsMainTest(FakeServerTestCase):
+
+    server_options = {'rows': 50, 'width': 5}
+
+    def test_max_result_rows(self):
+        code, output, messages = self.run_main('--format', 'json', '-c', 'select * from t',
+                                               '--max-result-rows', '10')
+        self.assertEqual(code, 1)
+        self.assertEqual(output, '')
+        self.assertEqual(messages[-1], 'The result has 50 rows, more than the limit of 10 rows')
+
+    def test_max_result_bytes(self):
+        code, _, messages = self.run_main('--format', 'json', '-c', 'select * from t',
+                                          '--max-result-bytes', '1KB')
+        self.assertEqual(code, 1)
+        self.assertEqual(messages[-1], 'The result is larger than the limit of 1.0 KiB')
+
+    def test_within_limits(self):
+        code, _, messages = self.run_main('--format', 'json', '-c', 'select * from t',
+                                          '--max-result-rows', '50', '--max-result-bytes', '1MB')
+        self.assertEqual(code, 0)
+        self.assertRegex(messages[-1], r'^SELECT 50 rows in set')
@@ -0,0 +1,204 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from crate.client.exceptions import ProgrammingError
+from crate.crash.command import get_parser
+from crate.crash.daemon import CrashDaemon, DaemonError, create_request, run_client
+
+OPTIONS = {
+    'crate_hosts': ['localhost:4200'],
+    'error_trace': False,
+    'verify_ssl': True,
+    'cert_file': None,
+    'key_file': None,
+    'ca_cert_file': None,
+    'username': None,
+    'password': None,
+    'schema': None,
+    'timeout': '5',
+}
+
+
+def fake_sql(stmt, parameters=None, bulk_parameters=None):
+    return {'cols': ['stmt'], 'rows': [[stmt]], 'rowcount': 1, 'duration': 1}
+
+
+@patch('crate.client.http.Client.sql', side_effect=fake_sql)
+class CrashDaemonTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'crash.sock')
+        self.daemon = CrashDaemon(self.path)
+        self.thread = threading.Thread(target=self.daemon.serve_forever,
+                                       kwargs={'poll_interval': 0.01})
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def run_client(self, stdin=None, **request):
+        request.setdefault('options', OPTIONS)
+        request.setdefault('format', 'csv')
+        stdout, stderr = StringIO(), StringIO()
+        exit_code = run_client(self.path, request, stdin=stdin, stdout=stdout, stderr=stderr)
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_command(self, sql):
+        exit_code, out, err = self.run_client(command='select 1')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(out, "stmt\r\nselect 1\r\n\n")
+        self.assertEqual(err, 'SELECT 1 row in set (0.001 sec)\n')
+
+    def test_stdin(self, sql):
+        exit_code, out, err = self.run_client(stdin=['select 1;\n', 'select 2;\n'],
+                                              format='json_row')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(out, '{"stmt": "select 1;"}\n\n{"stmt": "select 2;"}\n\n')
+
+    def test_exit_code(self, sql):
+        sql.side_effect = ProgrammingError('SQLParseException')
+        exit_code, out, err = self.run_client(command='select')
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(err, 'SQLParseException\n')
+
+        # the exit code of a shell is reset for the next request
+        sql.side_effect = fake_sql
+        exit_code, out, err = self.run_client(command='select 1')
+        self.assertEqual(exit_code, 0)
+
+    def test_shells_are_reused(self, sql):
+        self.run_client(command='select 1')
+        self.run_client(command='select 2')
+        self.assertEqual(len(self.daemon.pool._idle), 1)
+        shells = list(self.daemon.pool._idle.values())[0]
+        self.assertEqual(len(shells), 1)
+
+        # shells are kept per connection options
+        self.run_client(command='select 3', options=dict(OPTIONS, schema='other'))
+        self.assertEqual(len(self.daemon.pool._idle), 2)
+
+    def idle_shells(self):
+        return [shell for shells in self.daemon.pool._idle.values() for shell in shells]
+
+    def test_state_is_reset(self, sql):
+        self.run_client(command='\\timing\n\\limit rows 10')
+        shell, = self.idle_shells()
+        self.assertTrue(shell.timing)
+        self.assertEqual(shell.max_result_rows, 10)
+
+        exit_code, out, err = self.run_client(command='select 1')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(self.idle_shells(), [shell])
+        self.assertFalse(shell.timing)
+        self.assertIsNone(shell.max_result_rows)
+        self.assertEqual(err, 'SELECT 1 row in set (0.001 sec)\n')
+
+    def test_last_statement_is_reset(self, sql):
+        self.run_client(command='select 1')
+        self.assertEqual(sql.call_count, 1)
+
+        # \watch must not re-run the statement of the previous request; if it
+        # did, the failing statement would end the watch
+        sql.side_effect = ProgrammingError('SQLParseException')
+        exit_code, out, err = self.run_client(command='\\watch 1')
+        self.assertEqual(sql.call_count, 1)
+        self.assertEqual(out, '')
+        self.assertEqual(err, 'No statement to watch\n')
+
+    def test_session_settings_discard_shell(self, sql):
+        self.run_client(stdin=['select 1;\n', 'set search_path to other;\n'])
+        self.assertEqual(self.idle_shells(), [])
+        self.run_client(command='select 1')
+        self.assertEqual(len(self.idle_shells()), 1)
+
+    def test_session_options(self, sql):
+        path = os.path.join(self.tmp_dir, 'metrics.ndjson')
+        session = {'max_result_rows': 10, 'metrics_file': path}
+        exit_code, out, err = self.run_client(command='select 1', session=session)
+        self.assertEqual(exit_code, 0)
+        with open(path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        shell, = self.idle_shells()
+        self.assertEqual(shell.max_result_rows, 10)
+        self.assertIsNone(shell.metrics)
+
+        # the options only apply to the request which sent them
+        self.run_client(command='select 2')
+        self.assertIsNone(shell.max_result_rows)
+        with open(path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_quit_closes_shell(self, sql):
+        exit_code, out, err = self.run_client(command='\\q')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(self.daemon.pool._idle, {})
+
+    def test_already_listening(self, sql):
+        with self.assertRaises(DaemonError):
+            CrashDaemon(self.path)
+
+    def test_socket_permissions(self, sql):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+
+class CreateRequestTest(TestCase):
+
+    def test_session(self):
+        args = get_parser(['json']).parse_args(
+            ['--max-result-rows', '10', '--spill-threshold', '1MB',
+             '--metrics-file', 'metrics.ndjson', '--profile', 'crash.prof',
+             '-c', 'select 1'])
+        request = create_request(args, ['localhost:4200'], None, False)
+        self.assertEqual(request['command'], 'select 1')
+        self.assertEqual(request['session'], {
+            'spill_threshold': 1024 ** 2,
+            'max_result_rows': 10,
+            'max_result_bytes': None,
+            'metrics_file': os.path.abspath('metrics.ndjson'),
+            'profile': os.path.abspath('crash.prof'),
+            'profile_stacks': False,
+        })
+
+
+class RunClientTest(TestCase):
+
+    def test_no_daemon(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'crash.sock')
+            self.assertIsNone(run_client(path, {}))
+            # a stale socket file is replaced by a new daemon
+            open(path, 'w').close()
+            self.assertIsNone(run_client(path, {}))
+            CrashDaemon(path).server_close()
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,156 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+import os
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from colorama import Fore
+
+from crate.crash.command import CrateShell
+from crate.crash.explain import load_plan, parse_plan, render_plan
+from crate.crash.printer import ColorPrinter
+from tests.fake_server import OBJECT
+from tests.util import FakeServerTestCase
+
+PLAN = {
+    'Analyze': {
+        'Execute': 2.5,
+        'Phases': {
+            '0-collect': {
+                'nodes': {
+                    'n1': {
+                        'QueryBreakdown': [{
+                            'BreakDown': {
+                                'create_weight': 0.25,
+                                'create_weight_count': 1,
+                                'next_doc': 0.5,
+                                'next_doc_count': 20,
+                            },
+                            'QueryDescription': 'name:Algol',
+                            'QueryName': 'TermQuery',
+                            'SchemaName': 'doc',
+                            'ShardId': 0,
+                            'TableName': 'locations',
+                            'Time': 0.75,
+                        }],
+                        'Total': 1.5,
+                    },
+                    'n2': 0.5,
+                },
+            },
+            '1-mergeOnHandler': {'nodes': {'n1': 0.25}},
+        },
+        'Total': 4.0,
+    },
+}
+
+
+class ParsePlanTest(TestCase):
+
+    def test_tree(self):
+        root = parse_plan(PLAN)
+        self.assertEqual((root.name, root.time), ('Analyze', 4.0))
+        execute, = root.children
+        self.assertEqual((execute.name, execute.time), ('Execute', 2.5))
+        self.assertEqual([c.name for c in execute.children], ['0-collect', '1-mergeOnHandler'])
+        collect = execute.children[0]
+        # without a total, the time is the sum of the children
+        self.assertEqual(collect.time, 2.0)
+        query, = collect.children[0].children
+        self.assertEqual(query.name, 'TermQuery name:Algol')
+        self.assertEqual(query.details, ['SchemaName=doc', 'ShardId=0', 'TableName=locations'])
+        breakdown, = query.children
+        self.assertEqual([c.name for c in breakdown.children], ['create_weight', 'next_doc'])
+        self.assertEqual(breakdown.details, ['create_weight_count=1', 'next_doc_count=20'])
+
+    def test_json_string(self):
+        self.assertEqual(load_plan(json.dumps(PLAN)), PLAN)
+        self.assertIs(load_plan(PLAN), PLAN)
+
+
+class RenderPlanTest(TestCase):
+
+    def test_render(self):
+        lines = render_plan(parse_plan(PLAN))
+        self.assertEqual(lines, [
+            'Analyze                                    4.000 ms  100.0% *',
+            '└── Execute                                2.500 ms   62.5% *',
+            '    ├── 0-collect                          2.000 ms   50.0% *',
+            '    │   ├── n1                             1.500 ms   37.5% *',
+            '    │   │   └── TermQuery name:Algol       0.750 ms   18.8% *  '
+            'SchemaName=doc, ShardId=0, TableName=locations',
+            '    │   │       └── BreakDown              0.750 ms   18.8% *  '
+            'create_weight_count=1, next_doc_count=20',
+            '    │   │           ├── create_weight      0.250 ms    6.2%',
+            '    │   │           └── next_doc           0.500 ms   12.5% *',
+            '    │   └── n2                             0.500 ms   12.5%',
+            '    └── 1-mergeOnHandler                   0.250 ms    6.2%',
+            '        └── n1                             0.250 ms    6.2%',
+        ])
+
+    def test_tty_highlights_hottest_path(self):
+        lines = render_plan(parse_plan(PLAN), is_tty=True)
+        self.assertTrue(lines[0].startswith(Fore.RED))
+        self.assertFalse(lines[-1].startswith(Fore.RED))
+        self.assertFalse(any(line.endswith('*') for line in lines))
+
+
+class ExplainCommandTest(FakeServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.route(r'^EXPLAIN ANALYZE', {
+            'cols': ['EXPLAIN ANALYZE'], 'col_types': [OBJECT], 'rows': [[PLAN]], 'rowcount': 1})
+        self.messages = []
+
+        def log(printer, content, color, style=''):
+            self.messages.append(content)
+        for patcher in (patch.object(ColorPrinter, 'log', log),
+                        patch('sys.stdout', new_callable=StringIO)):
+            self.stdout = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cmd = CrateShell([self.server.url], is_tty=False)
+
+    def tearDown(self):
+        self.cmd.close()
+
+    def test_explain(self):
+        self.cmd.process("\\explain select * from locations where name = 'Algol'")
+        self.assertEqual(self.server.requests[-1].stmt,
+                         "EXPLAIN ANALYZE select * from locations where name = 'Algol'")
+        output = self.stdout.getvalue().splitlines()
+        self.assertEqual(output[0], 'Analyze                                    4.000 ms  100.0% *')
+        self.assertEqual(len(output), 11)
+
+    def test_save(self):
+        path = os.path.join(self.tmp_dir, 'plan.json')
+        self.cmd.process('\\explain --save {0} select * from locations;'.format(path))
+        self.assertEqual(self.server.requests[-1].stmt, 'EXPLAIN ANALYZE select * from locations')
+        self.assertEqual(self.messages[-1], 'Saved the plan to ' + path)
+        with open(path) as f:
+            self.assertEqual(json.load(f), PLAN)
+
+    def test_missing_statement(self):
+        self.cmd.process('\\explain --save plan.json')
+        self.assertEqual(self.messages[-1], 'No statement to explain')
+        self.cmd.process('\\explain')
+        self.assertEqual(self.messages[-1], 'No statement to explain')
@@ -0,0 +1,96 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+from unittest import TestCase
+from unittest.mock import Mock
+
+from crate.crash.command import CrateShell
+from tests.fake_server import FakeCrateDB, SQLError
+from tests.util import FakeServerTestCase
+
+
+class OfflineCommandTest(FakeServerTestCase):
+    """
+    Run crash against a fake CrateDB, without a network or a real cluster.
+    """
+
+    server_options = {'rows': 3, 'width': 5, 'nesting': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.server.route(r'^select fail', SQLError('SQLParseException[no viable alternative]'))
+
+    def test_json(self):
+        exit_code, out, messages = self.run_main('-c', 'select * from t', '--format', 'json')
+        self.assertEqual(exit_code, 0)
+        rows = json.loads(out)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], {'col0': 1, 'col1': 'value 1-1', 'col2': 1.5, 'col3': False,
+                                   'col4': {'level': 1, 'child': {'id': 1, 'tags': ['a', 'b']}}})
+        self.assertEqual(len(messages), 1)
+        self.assertRegex(messages[0], r'^SELECT 3 rows in set \(\d+\.\d{3} sec\)$')
+
+    def test_tabular(self):
+        exit_code, out, messages = self.run_main('-c', 'select * from t', '--format', 'tabular')
+        self.assertEqual(exit_code, 0)
+        self.assertIn('| col0 | col1      | col2 | col3  |', out)
+        self.assertIn('|    2 | value 2-1 |  3.0 | TRUE  |', out)
+
+    def test_error_exit_code(self):
+        exit_code, out, messages = self.run_main('-c', 'select fail')
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(messages, ['SQLParseException[no viable alternative]'])
+
+    def test_batch_mode_sends_only_statements(self):
+        self.run_main('-c', 'select 1; select 2')
+        self.assertEqual([r.stmt for r in self.server.requests], ['select 1;', 'select 2'])
+
+    def test_verbose_mode_checks_connection(self):
+        exit_code, out, messages = self.run_main('-v', '-c', 'select 1')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual([r.method for r in self.server.requests[:2]], ['GET', 'POST'])
+        self.assertIn('CONNECT OK', messages)
+
+
+class FakeCrateDBTest(TestCase):
+
+    def test_bulk_args_and_latency(self):
+        with FakeCrateDB(latency=0.05) as server:
+            cmd = CrateShell([server.url], output_writer=Mock(), is_tty=False, batch=True)
+            result = cmd.cursor.executemany('insert into t (x) values (?)', [[1], [2], [3]])
+            self.assertEqual(result, [{'rowcount': 1}] * 3)
+            self.assertGreaterEqual(cmd.cursor.duration, 50)
+            self.assertEqual(server.requests[-1].bulk_args, [[1], [2], [3]])
+            cmd.close()
+
+    def test_routes(self):
+        with FakeCrateDB() as server:
+            server.route(r'^select count', {'cols': ['count'], 'rows': [[42]], 'rowcount': 1})
+            server.route(r'^select \$1', lambda stmt, args: {
+                'cols': ['arg'], 'rows': [args], 'rowcount': 1})
+            cmd = CrateShell([server.url], output_writer=Mock(), is_tty=False, batch=True)
+            cmd.cursor.execute('select count(*) from t')
+            self.assertEqual(cmd.cursor.fetchall(), [[42]])
+            cmd.cursor.execute('select $1', ['x'])
+            self.assertEqual(cmd.cursor.fetchall(), [['x']])
+            # large statements are compressed by the client
+            cmd.cursor.execute('select ' + ', '.join(['1'] * 10000))
+            self.assertEqual(cmd.cursor.rowcount, 10)
+            cmd.close()
@@ -0,0 +1,117 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import asyncio
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from prompt_toolkit.history import FileHistory
+
+from crate.crash.history import SQLiteHistory, read_file_history
+
+
+async def collect(history):
+    return [item async for item in history.load()]
+
+
+class SQLiteHistoryTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'crash_history')
+        self.history = SQLiteHistory(self.filename, max_length=5)
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.tmp)
+
+    def test_entries_are_loaded_most_recent_first(self):
+        for s in ['select 1;', 'select 2;', 'select 3;']:
+            self.history.append_string(s)
+        history = SQLiteHistory(self.filename)
+        self.assertEqual(list(history.load_history_strings()),
+                         ['select 3;', 'select 2;', 'select 1;'])
+        history.close()
+
+    def test_load_in_batches(self):
+        self.history.max_length = 100
+        self.history.BATCH_SIZE = 3
+        for i in range(10):
+            self.history.store_string('select {};'.format(i))
+        loaded = asyncio.run(collect(self.history))
+        self.assertEqual(loaded, ['select {};'.format(i) for i in range(9, -1, -1)])
+        self.assertTrue(self.history.is_stored('select 0;'))
+
+    def test_duplicates_are_moved_to_the_end(self):
+        for s in ['select 1;', 'select 2;', 'select 1;']:
+            self.history.append_string(s)
+        self.assertEqual(self.history.get_strings(), ['select 2;', 'select 1;'])
+        self.assertEqual(list(self.history.load_history_strings()),
+                         ['select 1;', 'select 2;'])
+
+    def test_history_is_truncated(self):
+        for i in range(8):
+            self.history.store_string('select {};'.format(i))
+        self.assertEqual(list(self.history.load_history_strings()),
+                         ['select {};'.format(i) for i in range(7, 2, -1)])
+
+    def test_record_result(self):
+        self.history.store_string('select 1;')
+        self.history.record_result('select 1;', 1.5, 1)
+        statement, executed_at, duration, rowcount = self.history.entries()[0]
+        self.assertEqual((statement, duration, rowcount), ('select 1;', 1.5, 1))
+        self.assertGreater(executed_at, 0)
+
+    def test_search(self):
+        for s in ['select * from sys.nodes;', 'SELECT name FROM sys.cluster;',
+                  'insert into t (x) values (1);']:
+            self.history.store_string(s)
+        self.assertEqual(self.history.search('from sys'),
+                         ['SELECT name FROM sys.cluster;', 'select * from sys.nodes;'])
+        self.assertEqual(self.history.search('sys', limit=1),
+                         ['SELECT name FROM sys.cluster;'])
+        self.assertEqual(self.history.search('(x'), ['insert into t (x) values (1);'])
+        self.assertEqual(self.history.search('"'), [])
+        self.assertEqual(self.history.search('unknown'), [])
+
+    def test_search_after_truncation(self):
+        for i in range(8):
+            self.history.store_string('select {} from t;'.format(i))
+        self.assertEqual(self.history.search('select 1 from'), [])
+        self.assertEqual(self.history.search('select 7 from'), ['select 7 from t;'])
+
+    def test_import_file_history(self):
+        legacy = FileHistory(self.filename)
+        for s in ['select 1;', 'select\n  2;', 'select 1;']:
+            legacy.store_string(s)
+        self.assertEqual(read_file_history(self.filename),
+                         ['select 1;', 'select\n  2;', 'select 1;'])
+        history = SQLiteHistory(self.filename)
+        self.assertEqual(list(history.load_history_strings()),
+                         ['select 1;', 'select\n  2;'])
+        self.assertEqual(history.search('select\n  2'), ['select\n  2;'])
+        history.store_string('select 3;')
+        history.close()
+        # the file is imported only once
+        history = SQLiteHistory(self.filename)
+        self.assertEqual(list(history.load_history_strings()),
+                         ['select 3;', 'select 1;', 'select\n  2;'])
+        history.close()
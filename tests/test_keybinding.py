@@ -63,3 +63,4 @@ class TabIndentTest(TestCase):
 
         self.assertIn('on_backspace', handlers_for_key(kb, Keys.Backspace))
         self.assertIn('on_tab', handlers_for_key(kb, Keys.Tab))
+        self.assertIn('on_paste', handlers_for_key(kb, Keys.BracketedPaste))
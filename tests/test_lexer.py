@@ -0,0 +1,127 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import random
+from unittest import TestCase
+from unittest.mock import patch
+
+from prompt_toolkit.document import Document
+from prompt_toolkit.lexers import PygmentsLexer
+from pygments.lexers.sql import PostgresLexer
+
+from crate.crash.lexer import IncrementalPygmentsLexer, ends_with_statement
+
+SNIPPETS = [
+    'select * from t',
+    'where x = 1',
+    ';',
+    ';\n',
+    "'a;\nb'",
+    '-- comment;\n',
+    '/* multi\nline; */',
+    '$$ body;\n $$',
+    '"quoted\nident"',
+    'insert into t (a) values (?);\n',
+    '\n',
+    '  ',
+    '$$',
+    "'",
+]
+
+
+def normalize(fragments):
+    """Merge adjacent fragments with the same style."""
+    merged = []
+    for style, text in fragments:
+        if merged and merged[-1][0] == style:
+            merged[-1] = (style, merged[-1][1] + text)
+        elif text:
+            merged.append((style, text))
+    return merged
+
+
+def lex_all(lexer, text):
+    document = Document(text)
+    get_line = lexer.lex_document(document)
+    return [normalize(get_line(i)) for i in range(len(document.lines))]
+
+
+class IncrementalPygmentsLexerTest(TestCase):
+
+    def setUp(self):
+        self.lexer = IncrementalPygmentsLexer(PostgresLexer)
+        self.reference = PygmentsLexer(PostgresLexer, sync_from_start=True)
+
+    def assertSameAsFullLexing(self, text):
+        self.assertEqual(lex_all(self.lexer, text),
+                         lex_all(self.reference, text),
+                         msg=repr(text))
+
+    def test_lexes_like_pygments_lexer(self):
+        self.assertSameAsFullLexing(
+            "select 'a;\nb'; -- c;\nselect $$ x\n$$; /* a\n;b */ select 1")
+
+    def test_random_edits_match_full_lexing(self):
+        rnd = random.Random(42)
+        text = ''
+        for _ in range(500):
+            pos = rnd.randint(0, len(text))
+            if text and rnd.random() < 0.3:
+                end = min(len(text), pos + rnd.randint(1, 20))
+                text = text[:pos] + text[end:]
+            else:
+                text = text[:pos] + rnd.choice(SNIPPETS) + text[pos:]
+            self.assertSameAsFullLexing(text)
+
+    def test_lines_are_lexed_lazily(self):
+        text = 'select 1;\n' * 100
+        get_line = self.lexer.lex_document(Document(text))
+        get_line(0)
+        self.assertLess(len(self.lexer._state.fragments), 10)
+
+    def test_only_changed_statement_is_lexed_again(self):
+        lines = ['select {0};'.format(i) for i in range(1000)]
+        lex_all(self.lexer, '\n'.join(lines))
+        lexed = []
+        get_tokens = self.lexer.pygments_lexer.get_tokens_unprocessed
+
+        def counting_get_tokens(text):
+            for token in get_tokens(text):
+                lexed.append(token[2])
+                yield token
+
+        lines[500] = 'select 500 from t;'
+        with patch.object(self.lexer.pygments_lexer, 'get_tokens_unprocessed',
+                          counting_get_tokens):
+            self.assertSameAsFullLexing('\n'.join(lines))
+        self.assertEqual(''.join(lexed), 'select 500 from t;\n')
+
+
+class EndsWithStatementTest(TestCase):
+
+    def test_ends_with_statement(self):
+        self.assertTrue(ends_with_statement('select 1;'))
+        self.assertTrue(ends_with_statement('select 1; -- done\n'))
+        self.assertTrue(ends_with_statement("select 'a;\nb';"))
+        self.assertFalse(ends_with_statement(''))
+        self.assertFalse(ends_with_statement('select 1'))
+        self.assertFalse(ends_with_statement("select 'a;"))
+        self.assertFalse(ends_with_statement('select "a;'))
+        self.assertFalse(ends_with_statement('select /* a;'))
+        self.assertFalse(ends_with_statement('select $$ a;'))
@@ -0,0 +1,125 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+import os
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from crate.crash.command import CrateShell, main
+from crate.crash.metrics import MetricsWriter, fingerprint, normalize
+from crate.crash.printer import ColorPrinter
+from tests.fake_server import SQLError
+from tests.util import FakeServerTestCase
+
+
+class NormalizeTest(TestCase):
+
+    def test_literals(self):
+        self.assertEqual(
+            normalize("SELECT * FROM t1 WHERE a = 'it''s'  AND\n b > -1.5e3 AND c = 42;"),
+            'SELECT * FROM t1 WHERE a = ? AND b > ? AND c = ?')
+
+    def test_identifiers_are_kept(self):
+        self.assertEqual(normalize('select "col1", x2 from "t_3"'),
+                         'select "col1", x2 from "t_3"')
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint(normalize("insert into t values (1, 'a')")),
+                         fingerprint(normalize("insert into t values (2,  'b')")))
+        self.assertNotEqual(fingerprint('select ?'), fingerprint('select ? from t'))
+
+
+class MetricsWriterTest(FakeServerTestCase):
+
+    server_options = {'rows': 4, 'width': 2}
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp_dir, 'metrics.ndjson')
+        self.server.route(r'^select fail', SQLError('SQLParseException[no viable alternative]'))
+        for patcher in (patch.object(ColorPrinter, 'log'),
+                        patch('sys.stdout', new_callable=StringIO)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def records(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def run_statements(self, text, hosts=None):
+        cmd = CrateShell(hosts or [self.server.url], is_tty=False, batch=True)
+        cmd.metrics = MetricsWriter(self.path)
+        cmd.process(text)
+        cmd.exit()
+        self.assertIsNone(cmd.metrics)
+
+    def test_records(self):
+        self.run_statements("select * from t where x = 'a';\nselect fail;\ninsert into t values (1);")
+        first, failed, insert = self.records()
+        self.assertEqual(first['statement'], 'select * from t where x = ?')
+        self.assertEqual(first['type'], 'SELECT')
+        self.assertEqual(first['host'], self.server.url)
+        self.assertEqual(first['rowcount'], 4)
+        self.assertGreaterEqual(first['wall_ms'], first['server_ms'])
+        self.assertEqual(first['bytes_sent'], len('{"stmt":"select * from t where x = \'a\';"}'))
+        self.assertGreater(first['bytes_received'], 0)
+        self.assertEqual(first['retries'], 0)
+        self.assertIsNone(first['error'])
+        self.assertIn('+00:00', first['started'])
+
+        self.assertEqual(failed['error'], 'ProgrammingError')
+        self.assertIsNone(failed['server_ms'])
+        self.assertIsNone(failed['rowcount'])
+        self.assertEqual(insert['type'], 'INSERT')
+        self.assertEqual(insert['statement'], 'insert into t values (?)')
+
+    def test_retries(self):
+        self.run_statements('select 1; select 2;', hosts=['http://127.0.0.1:1', self.server.url])
+        first, second = self.records()
+        self.assertEqual(first['retries'], 1)
+        self.assertEqual(first['host'], self.server.url)
+        self.assertEqual(first['fingerprint'], second['fingerprint'])
+        self.assertEqual(second['retries'], 0)
+
+    def test_appends(self):
+        self.run_statements('select 1;')
+        self.run_statements('select 2;')
+        self.assertEqual(len(self.records()), 2)
+
+    def test_main(self):
+        argv = ['crash', '--hosts', self.server.url,
+                '--config', os.path.join(self.tmp_dir, 'crash.cfg'),
+                '--metrics-file', self.path, '-c', 'select 1; select 2']
+        with patch('sys.argv', argv), patch('sys.stdin.isatty', return_value=True):
+            with self.assertRaises(SystemExit) as e:
+                main()
+        self.assertEqual(e.exception.code, 0)
+        self.assertEqual([r['statement'] for r in self.records()], ['select ?', 'select ?'])
+
+    def test_main_with_invalid_file(self):
+        argv = ['crash', '--hosts', self.server.url,
+                '--config', os.path.join(self.tmp_dir, 'crash.cfg'),
+                '--metrics-file', os.path.join(self.tmp_dir, 'missing', 'metrics'),
+                '-c', 'select 1']
+        with patch('sys.argv', argv), patch('sys.stdin.isatty', return_value=True):
+            with self.assertRaises(SystemExit) as e:
+                main()
+        self.assertEqual(e.exception.code, 1)
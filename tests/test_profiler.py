@@ -0,0 +1,124 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import cProfile
+import os
+import pstats
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from crate.crash.command import CrateShell, main
+from crate.crash.printer import ColorPrinter
+from crate.crash.profiler import StatementProfiler, collapsed_stacks
+from tests.util import FakeServerTestCase
+
+
+def leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def branch():
+    return leaf(1000) + leaf(2000)
+
+
+def root():
+    return branch() + leaf(3000)
+
+
+class CollapsedStacksTest(TestCase):
+
+    def test_stacks(self):
+        profile = cProfile.Profile()
+        profile.runcall(root)
+        stats = pstats.Stats(profile)
+        stacks = collapsed_stacks(stats)
+        names = set(';'.join(frame.split(' ')[0] for frame in stack.split(';'))
+                    for stack in stacks)
+        self.assertIn('root;branch;leaf', names)
+        self.assertIn('root;leaf', names)
+        self.assertNotIn('leaf', names)
+        self.assertFalse(any('disable' in stack for stack in stacks))
+        # the time of the stacks adds up to the time of the root
+        root_time = next(entry[3] for func, entry in stats.stats.items()
+                         if func[2] == 'root')
+        self.assertAlmostEqual(sum(stacks.values()), root_time, delta=root_time * 0.01)
+
+
+class StatementProfilerTest(FakeServerTestCase):
+
+    server_options = {'rows': 20, 'width': 3}
+
+    def setUp(self):
+        super().setUp()
+        self.messages = []
+
+        def log(printer, content, color, style=''):
+            self.messages.append(content)
+        for patcher in (patch.object(ColorPrinter, 'log', log),
+                        patch('sys.stdout', new_callable=StringIO)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def test_profile_per_statement_type(self):
+        cmd = CrateShell([self.server.url], is_tty=False)
+        cmd.profiler = StatementProfiler(self.path('crash.prof'), stacks=True)
+        cmd.process('select * from t; insert into t values (1);\nselect 1;')
+        self.assertEqual(dict(cmd.profiler.statements), {'SELECT': 2, 'INSERT': 1})
+        cmd.exit()
+        self.assertIsNone(cmd.profiler)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), [
+            'crash.INSERT.folded', 'crash.INSERT.prof',
+            'crash.SELECT.folded', 'crash.SELECT.prof',
+            'crash.folded', 'crash.prof'])
+        functions = set(func[2] for func in pstats.Stats(self.path('crash.SELECT.prof')).stats)
+        self.assertTrue({'_parse_sql', '_exec_and_print', 'execute', 'write'} <= functions)
+        functions = set(func[2] for func in pstats.Stats(self.path('crash.INSERT.prof')).stats)
+        self.assertNotIn('_parse_sql', functions)
+        with open(self.path('crash.folded')) as f:
+            stack, count = f.readline().rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertEqual(self.messages[-1], 'Profiled 3 statements (1 INSERT, 2 SELECT), wrote ' +
+                         ', '.join(self.path(name) for name in [
+                             'crash.prof', 'crash.folded', 'crash.INSERT.prof', 'crash.INSERT.folded',
+                             'crash.SELECT.prof', 'crash.SELECT.folded']))
+
+    def test_commands_are_not_profiled(self):
+        cmd = CrateShell([self.server.url], is_tty=False)
+        cmd.process('\\profile on ' + self.path('crash.prof'))
+        cmd.process('\\format json')
+        cmd.process('\\profile off')
+        self.assertEqual(self.messages[-2], 'No statements were profiled')
+        self.assertEqual(self.messages[-1], 'Profiling OFF')
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        cmd.exit()
+
+    def test_main(self):
+        argv = ['crash', '--hosts', self.server.url, '--config', self.path('crash.cfg'),
+                '--profile', self.path('out.prof'), '-c', 'select * from t']
+        with patch('sys.argv', argv), patch('sys.stdin.isatty', return_value=True):
+            with self.assertRaises(SystemExit) as e:
+                main()
+        self.assertEqual(e.exception.code, 0)
+        self.assertTrue(os.path.exists(self.path('out.prof')))
+        self.assertTrue(os.path.exists(self.path('out.SELECT.prof')))
+        self.assertFalse(os.path.exists(self.path('out.folded')))
@@ -17,20 +17,23 @@
 # with Crate these terms will supersede the license and you may use the
 # software solely pursuant to the terms of the relevant commercial agreement.
 
+import asyncio
 import re
+import shutil
+import tempfile
+from collections import deque
+from itertools import product
 from unittest import TestCase
+from unittest.mock import Mock
 
 from prompt_toolkit.buffer import Buffer
 from prompt_toolkit.document import Document
-from pygments.token import Token
+from prompt_toolkit.search import SearchDirection, SearchState
 
-from crate.crash.command import ConnectionMeta, CrateShell
-from crate.crash.repl import (
-    Capitalizer,
-    SQLCompleter,
-    _get_toolbar_tokens,
-    create_buffer,
-)
+from crate.crash.catalog import Catalog, CatalogSnapshot
+from crate.crash.command import CrateShell
+from crate.crash.history import SQLiteHistory
+from crate.crash.repl import Capitalizer, CrashBuffer, SQLCompleter, create_buffer
 
 
 class SQLCompleterTest(TestCase):
@@ -48,6 +51,79 @@ class SQLCompleterTest(TestCase):
         self.assertEqual(result, ['dynamic'])
 
 
+class SQLCompleterRankingTest(TestCase):
+
+    def setUp(self):
+        cmd = Mock()
+        cmd.cursor.fetchall.return_value = [
+            ('select',), ('serializable',), ('session',), ('set',), ('insert',)]
+        cmd.should_fuzzy_complete.return_value = False
+        self.completer = SQLCompleter(cmd)
+
+    def test_shortest_first(self):
+        self.assertEqual(self.completer.complete_keyword('SE'),
+                         ['set', 'select', 'session', 'serializable'])
+
+    def test_recent_use_first(self):
+        self.completer.learn('select 1; set session x = 1; set session y = 2; show session z;')
+        self.assertEqual(self.completer.complete_keyword('se'),
+                         ['session', 'set', 'select', 'serializable'])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.completer.complete_keyword('sel'), ['select'])
+        self.completer.cmd.should_fuzzy_complete.return_value = True
+        self.assertEqual(self.completer.complete_keyword('sel'),
+                         ['select', 'serializable'])
+        self.assertEqual(self.completer.complete_keyword('sert'), ['insert'])
+
+    def test_keywords_are_reindexed(self):
+        self.completer.keywords = ['foo', 'foobar']
+        self.assertEqual(self.completer.complete_keyword('fo'), ['foo', 'foobar'])
+        self.assertEqual(self.completer.complete_keyword('se'), [])
+
+
+class SQLCompleterCatalogTest(TestCase):
+
+    def setUp(self):
+        cmd = Mock()
+        cmd.cursor.fetchall.return_value = [('select',), ('sensitive',)]
+        cmd.should_autocomplete.return_value = True
+        catalog = Catalog(cmd)
+        catalog.update(CatalogSnapshot(
+            schemas=['doc'],
+            tables=[('doc', 'sensors')],
+            columns=[('sensors', 'payload'), ('sensors', "payload['temp']")],
+            functions=[],
+        ))
+        self.completer = SQLCompleter(cmd, catalog=catalog)
+
+    def _complete(self, text):
+        return [(c.text, c.start_position)
+                for c in self.completer.get_completions(Document(text), None)]
+
+    def test_keywords_and_table_names(self):
+        self.assertEqual(self._complete('SELECT * FROM sens'), [
+            ('SENSITIVE', -4),
+            ('sensors', -4),
+        ])
+
+    def test_qualified_table_name(self):
+        self.assertEqual(self._complete('SELECT * FROM doc.se'), [
+            ('doc.sensors', -6),
+        ])
+
+    def test_nested_column(self):
+        self.assertEqual(self._complete("SELECT payload['"), [
+            ("payload['temp']", -9),
+        ])
+
+    def test_no_catalog(self):
+        self.completer.catalog = None
+        self.assertEqual(self._complete('SELECT * FROM sens'), [
+            ('SENSITIVE', -4),
+        ])
+
+
 class CrashBufferTest(TestCase):
 
     def test_create_buffer(self):
@@ -56,6 +132,79 @@ class CrashBufferTest(TestCase):
         self.assertEqual(buffer.on_text_insert.fire(), None)
 
 
+class CrashBufferLargePasteTest(TestCase):
+
+    def setUp(self):
+        cmd = Mock()
+        cmd.should_autocapitalize.return_value = True
+        cmd.cursor.fetchall.return_value = [(kw,) for kw in SQLCompleter.fallback_keywords]
+        self.capitalizer = Capitalizer(cmd, SQLCompleter(cmd))
+        self.buffer = CrashBuffer(on_text_insert=self.capitalizer.apply_capitalization)
+
+    def test_large_paste_is_not_capitalized(self):
+        self.buffer.insert_large_paste('select 1;\n' * 10)
+        self.assertTrue(self.buffer.large_paste)
+        self.buffer.insert_text(' from')
+        self.assertTrue(self.buffer.text.startswith('select 1;\n'))
+        self.assertTrue(self.buffer.text.endswith(' from'))
+
+    def test_reset(self):
+        self.buffer.insert_large_paste('select 1;')
+        self.buffer.reset()
+        self.assertFalse(self.buffer.large_paste)
+        self.buffer.insert_text('select 1 from')
+        self.assertEqual(self.buffer.text, 'SELECT 1 FROM')
+
+    def test_is_multiline(self):
+        self.buffer.insert_large_paste('select 1;\n \n')
+        self.assertFalse(self.buffer.multiline())
+        self.buffer.insert_text('select 2')
+        self.assertTrue(self.buffer.multiline())
+
+
+class CrashBufferSearchTest(TestCase):
+
+    STATEMENTS = [
+        'select * from sys.nodes;',
+        'SELECT name FROM sys.cluster;',
+        'insert into t (x) values (1);',
+        'select name from sys.nodes;',
+        'select 1;',
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.history = SQLiteHistory(self.tmp + '/crash_history')
+        for statement in self.STATEMENTS:
+            self.history.append_string(statement)
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.tmp)
+
+    def _buffer(self, cls, lines):
+        buffer = cls(history=self.history)
+        buffer._working_lines = deque(lines)
+        buffer.working_index = len(lines) - 1
+        return buffer
+
+    def test_search_matches_buffer_search(self):
+        asyncio.run(self._load())
+        # an edited entry which is not stored in the history
+        lines = self.STATEMENTS[:2] + ['select name from sys.shards;'] \
+            + self.STATEMENTS[3:] + ['']
+        for text in ['from sys', 'FROM SYS', 'sys.n', 'values', 'shards', 'nothing']:
+            for direction, ignore_case in product(SearchDirection, (True, False)):
+                state = SearchState(text, direction=direction, ignore_case=ignore_case)
+                for count in (1, 2, 3):
+                    expected = self._buffer(Buffer, lines)._search(state, count=count)
+                    actual = self._buffer(CrashBuffer, lines)._search(state, count=count)
+                    self.assertEqual(actual, expected, msg=(text, direction, count))
+
+    async def _load(self):
+        return [item async for item in self.history.load()]
+
+
 class AutoCapitalizeTest(TestCase):
 
     def setUp(self):
@@ -147,55 +296,40 @@ class AutoCapitalizeTest(TestCase):
         self.assertFalse(self.capitalizer.is_prefix(string, prefix))
 
 
-class ToolbarTest(TestCase):
-
-    def test_get_session_tokens(self):
-        result = _get_toolbar_tokens(
-            True,
-            ['http://host1:4200', 'https://host2:4200'],
-            ConnectionMeta('crate', 'my_schema', 'cr8'),
-        )
-        self.assertEqual(
-            result.token_list,
-            [(Token.Toolbar.Status.Key, 'USER: '),
-             (Token.Toolbar.Status, 'crate'),
-             (Token.Toolbar.Status, ' | '),
-             (Token.Toolbar.Status.Key, 'SCHEMA: '),
-             (Token.Toolbar.Status, 'my_schema'),
-             (Token.Toolbar.Status, ' | '),
-             (Token.Toolbar.Status.Key, 'CLUSTER: '),
-             (Token.Toolbar.Status, 'cr8'),
-             (Token.Toolbar.Status, ' | '),
-             (Token.Toolbar.Status.Key, 'HOSTS: '),
-             (Token.Toolbar.Status, 'host1:4200, host2:4200')])
-
-    def test_get_session_tokens_no_info(self):
-        result = _get_toolbar_tokens(
-            True,
-            ['http://localhost:4200'],
-            ConnectionMeta(None, None, None),
-        )
-        self.assertEqual(
-            result.token_list,
-            [(Token.Toolbar.Status.Key, 'USER: '),
-             (Token.Toolbar.Status, '--'),
-             (Token.Toolbar.Status, ' | '),
-             (Token.Toolbar.Status.Key, 'SCHEMA: '),
-             (Token.Toolbar.Status, 'doc'),
-             (Token.Toolbar.Status, ' | '),
-             (Token.Toolbar.Status.Key, 'CLUSTER: '),
-             (Token.Toolbar.Status, '--'),
-             (Token.Toolbar.Status, ' | '),
-             (Token.Toolbar.Status.Key, 'HOSTS: '),
-             (Token.Toolbar.Status, 'localhost:4200')])
-
-    def test_get_not_connected_tokens(self):
-        result = _get_toolbar_tokens(
-            False,
-            [],
-            ConnectionMeta(None, None, None)
-        )
-        self.assertEqual(
-            result.token_list,
-            [(Token.Toolbar.Status, 'not connected')]
-        )
+class IncrementalCapitalizeTest(TestCase):
+
+    def setUp(self):
+        cmd = Mock()
+        cmd.cursor.fetchall.return_value = [('select',), ('from',), ('where',)]
+        cmd.should_autocapitalize.return_value = True
+        self.capitalizer = Capitalizer(cmd, SQLCompleter(cmd))
+        self.buffer = Buffer(on_text_insert=self.capitalizer.apply_capitalization)
+
+    def type(self, text):
+        for char in text:
+            self.buffer.insert_text(char)
+
+    def test_typing(self):
+        self.type('select x from t where y = 1')
+        self.assertEqual(self.buffer.text, 'SELECT x FROM t WHERE y = 1')
+
+    def test_only_inserted_token_is_examined(self):
+        self.capitalizer.cmd.should_autocapitalize.return_value = False
+        self.type('select x ')
+        self.capitalizer.cmd.should_autocapitalize.return_value = True
+        self.type('from t')
+        self.assertEqual(self.buffer.text, 'select x FROM t')
+
+    def test_insert_before_text(self):
+        self.type('select x  t')
+        self.buffer.cursor_position = len('SELECT x ')
+        self.type('from')
+        self.assertEqual(self.buffer.text, 'SELECT x FROM t')
+        self.assertEqual(self.buffer.cursor_position, len('SELECT x FROM'))
+
+    def test_replaced_document_is_examined(self):
+        self.type('select x')
+        text = 'select y from t'
+        self.buffer.set_document(Document(text, len(text)))
+        self.capitalizer.apply_capitalization(self.buffer)
+        self.assertEqual(self.buffer.text, 'SELECT y FROM t')
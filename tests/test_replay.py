@@ -0,0 +1,244 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import TestCase
+
+from prompt_toolkit.history import FileHistory
+
+from crate.crash.command import CrateShell
+from crate.crash.history import SQLiteHistory, read_timed_file_history
+from crate.crash.replay import (
+    ReplayResult,
+    WorkloadEntry,
+    compress_gaps,
+    load_workload,
+    run_replay,
+    split_statements,
+)
+from tests.fake_server import FakeCrateDB, SQLError
+from tests.util import FakeServerTestCase
+
+
+class LoadWorkloadTest(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_split_statements(self):
+        self.assertEqual(
+            split_statements("select 1;\n\\timing\n"
+                             "insert into t (s) values ('a;b');  \nselect 2;\n-- a comment\n"),
+            ['select 1', "insert into t (s) values ('a;b')", 'select 2'])
+
+    def test_sql_file(self):
+        path = self.write('workload.sql', 'select 1;\nselect\n  2;\n')
+        self.assertEqual(load_workload(path), [WorkloadEntry(None, 'select 1', None),
+                                               WorkloadEntry(None, 'select\n  2', None)])
+
+    def test_ndjson(self):
+        path = self.write('workload.ndjson', '\n'.join([
+            json.dumps({'stmt': 'select 1;', 'ts': 100.0}),
+            json.dumps({'statement': 'select ?', 'args': [2], 'started': '1970-01-01T00:01:40.5Z'}),
+            '',
+            # out of order timestamps are not replayed before the previous ones
+            json.dumps({'stmt': 'select 3', 'timestamp': 99}),
+        ]))
+        self.assertEqual(load_workload(path), [WorkloadEntry(0.0, 'select 1', None),
+                                               WorkloadEntry(0.5, 'select ?', [2]),
+                                               WorkloadEntry(0.5, 'select 3', None)])
+
+    def test_ndjson_without_timestamps(self):
+        path = self.write('workload.ndjson', '{"stmt": "select 1", "ts": 1}\n{"stmt": "select 2"}\n')
+        self.assertEqual([e.offset for e in load_workload(path)], [None, None])
+
+    def test_invalid_ndjson(self):
+        for content, message in [('{"stmt": "select 1"}\n{', 'Invalid JSON in line 2'),
+                                 ('{"ts": 1}', 'No statement in line 1'),
+                                 ('{"stmt": "select 1", "ts": "noon"}', 'Invalid timestamp in line 1')]:
+            path = self.write('workload.ndjson', content)
+            with self.assertRaisesRegex(ValueError, message):
+                load_workload(path)
+
+    def test_file_history(self):
+        path = os.path.join(self.tmp_dir, 'history')
+        history = FileHistory(path)
+        for string in ['select 1;', '\\timing', 'select 2; select 3;']:
+            history.store_string(string)
+        timed = read_timed_file_history(path)
+        self.assertEqual([s for _, s in timed], ['select 1;', '\\timing', 'select 2; select 3;'])
+        self.assertTrue(all(abs(ts - time.time()) < 60 for ts, _ in timed))
+        entries = load_workload(path)
+        self.assertEqual([e.stmt for e in entries], ['select 1', 'select 2', 'select 3'])
+        self.assertEqual(entries[0].offset, 0.0)
+        self.assertEqual(entries[1].offset, entries[2].offset)
+
+    def test_sqlite_history(self):
+        path = os.path.join(self.tmp_dir, 'crash_history')
+        history = SQLiteHistory(path)
+        history.store_string('select 1;')
+        history.store_string('select 2;')
+        history.close()
+        with sqlite3.connect(path + '.sqlite') as conn:
+            conn.execute("UPDATE history SET executed_at = 10 WHERE statement = 'select 1;'")
+            conn.execute("UPDATE history SET executed_at = 12 WHERE statement = 'select 2;'")
+        # the database is found next to the history file, and read directly
+        for name in ['crash_history', 'crash_history.sqlite']:
+            self.assertEqual(load_workload(os.path.join(self.tmp_dir, name)),
+                             [WorkloadEntry(0.0, 'select 1', None),
+                              WorkloadEntry(2.0, 'select 2', None)])
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            load_workload(os.path.join(self.tmp_dir, 'missing'))
+
+
+class ReplayResultTest(TestCase):
+
+    def test_rows(self):
+        result = ReplayResult()
+        for wall in [1.0, 2.0, 3.0]:
+            result.result_of('select ? from t').add(wall, wall / 2)
+        result.result_of('select * from u where s = ?').add(10.0, 9.0)
+        result.result_of('select * from u where s = ?').add_error(ValueError('boom'))
+        self.assertEqual(result.runs, 5)
+        self.assertEqual(result.errors, 1)
+        self.assertEqual(result.error_messages(), [(1, 'ValueError', 'boom')])
+        rows = result.rows()
+        self.assertEqual(len(rows[0]), len(ReplayResult.COLUMNS))
+        self.assertEqual([r[1:] for r in rows], [
+            ['select * from u where s = ?', 2, 1, 10.0, 10.0, 10.0, 10.0, 10.0, 9.0, 9.0],
+            ['select ? from t', 3, 0, 1.0, 2.0, 3.0, 3.0, 3.0, 1.0, 1.5],
+        ])
+
+    def test_long_statements_are_shortened(self):
+        result = ReplayResult()
+        result.result_of('select ' + 'x, ' * 100 + 'y').add(1.0, 1.0)
+        self.assertEqual(len(result.rows()[0][1]), 60)
+        self.assertTrue(result.rows()[0][1].endswith('...'))
+
+
+class RunReplayTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB(rows=2, width=2).start()
+        self.cmd = CrateShell([self.server.url], is_tty=False, batch=True)
+
+    def tearDown(self):
+        self.cmd.close()
+        self.server.stop()
+
+    def create_connection(self):
+        return self.cmd.create_connection([self.server.url])
+
+    def test_fingerprints(self):
+        self.server.route(r'^select x', {'cols': ['x'], 'rows': [[1]], 'rowcount': 1})
+        self.server.route(r'^select fail', SQLError('SQLParseException[boom]'))
+        entries = [WorkloadEntry(None, 'select x from t where id = {0}'.format(i), None)
+                   for i in range(10)]
+        entries += [WorkloadEntry(None, 'select fail', None),
+                    WorkloadEntry(None, 'select ?', [1])]
+        result = run_replay(self.create_connection, entries, workers=3, paced=False)
+        self.assertEqual(result.runs, 12)
+        self.assertEqual(result.errors, 1)
+        self.assertEqual(sorted(s for s, _ in result.statements.values()),
+                         ['select ?', 'select fail', 'select x from t where id = ?'])
+        self.assertIn([1], [r.args for r in self.server.requests])
+        self.assertEqual(result.error_messages(),
+                         [(1, 'ProgrammingError', 'SQLParseException[boom]')])
+
+    def test_original_rate(self):
+        entries = [WorkloadEntry(0.0, 'select 1', None), WorkloadEntry(0.3, 'select 2', None)]
+        started = time.perf_counter()
+        result = run_replay(self.create_connection, entries, workers=2, paced=True)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.3)
+        self.assertEqual(result.runs, 2)
+
+    def test_compress_gaps(self):
+        entries = [WorkloadEntry(0.0, 'select 1', None), WorkloadEntry(2.0, 'select 2', None),
+                   WorkloadEntry(60.0, 'select 3', None), WorkloadEntry(61.5, 'select 4', None)]
+        self.assertEqual([e.offset for e in compress_gaps(entries, 5.0)], [0.0, 2.0, 7.0, 8.5])
+        entries = [WorkloadEntry(None, 'select 1', None)]
+        self.assertEqual(compress_gaps(entries, 5.0), entries)
+
+    def test_max_rate(self):
+        entries = [WorkloadEntry(0.0, 'select 1', None), WorkloadEntry(30.0, 'select 2', None)]
+        result = run_replay(self.create_connection, entries, paced=False)
+        self.assertLess(result.elapsed, 10)
+        self.assertEqual(result.runs, 2)
+
+
+class ReplayMainTest(FakeServerTestCase):
+
+    server_options = {'rows': 2, 'width': 2}
+
+    def setUp(self):
+        super().setUp()
+        self.server.route(r'^select fail', SQLError('SQLParseException[boom]'))
+
+    def replay(self, content, *args):
+        path = os.path.join(self.tmp_dir, 'workload.sql')
+        with open(path, 'w') as f:
+            f.write(content)
+        return self.run_main('--format', 'json', '--replay', path, *args)
+
+    def test_replay(self):
+        code, output, messages = self.replay('select 1; select 2; select 1 from t;',
+                                             '--replay-workers', '2')
+        self.assertEqual(code, 0)
+        rows = json.loads(output)
+        self.assertEqual(sorted((r['statement'], r['runs']) for r in rows),
+                         [('select ?', 2), ('select ? from t', 1)])
+        self.assertEqual(set(rows[0]), set(ReplayResult.COLUMNS))
+        self.assertIn('The statements in', messages[-2])
+        self.assertRegex(messages[-1], r'^REPLAY 3 statements \(2 fingerprints\) on 2 workers '
+                                       r'in [\d.]+ sec, [\d,.]+ statements/sec, 0 errors$')
+
+    def test_pauses_are_shortened(self):
+        content = '{"stmt": "select 1", "ts": 0}\n{"stmt": "select 2", "ts": 3600}\n'
+        started = time.perf_counter()
+        code, _, messages = self.replay(content, '--replay-max-gap', '0.1')
+        self.assertEqual(code, 0)
+        self.assertLess(time.perf_counter() - started, 30)
+        self.assertRegex(messages[-1], r'^REPLAY 2 statements ')
+
+    def test_errors_fail(self):
+        code, _, messages = self.replay('select fail;', '--replay-rate', 'max')
+        self.assertEqual(code, 1)
+        self.assertEqual(messages[-1], '1 x ProgrammingError: SQLParseException[boom]')
+
+    def test_empty_workload(self):
+        code, output, messages = self.replay('-- nothing\n')
+        self.assertEqual(code, 1)
+        self.assertEqual(output, '')
+        self.assertRegex(messages[-1], '^No statements to replay in ')
@@ -0,0 +1,206 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import json
+import re
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from crate.crash.command import CrateShell, Result
+from crate.crash.outputs import OutputWriter
+from crate.crash.results import (
+    SpilledRows,
+    estimate_rows_size,
+    estimate_size,
+    parse_size,
+    spill_rows,
+)
+from tests.util import FakeServerTestCase
+
+ROWS = [
+    [1, 'a', None, 1.5, True, {'x': [1, 2]}],
+    [-20000, '漢字漢字', 2.25, 10000000000.0, False, None],
+    [3, 'a\nlong line', None, 1e-05, None, [1.5, None]],
+    [None, '  padded ', -0.0, 3, True, {}],
+    [5, '', 1.0, None, False, 'text'],
+    [600, '1.50', None, 2.125, None, None],
+    [7, 'ü', 1000, 0.1, True, 42],
+]
+
+
+class ParseSizeTest(TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('512'), 512)
+        self.assertEqual(parse_size(0), 0)
+        self.assertEqual(parse_size('64KB'), 64 * 1024)
+        self.assertEqual(parse_size('256mb'), 256 * 1024 ** 2)
+        self.assertEqual(parse_size('1.5 GiB'), int(1.5 * 1024 ** 3))
+        self.assertEqual(parse_size('2T'), 2 * 1024 ** 4)
+
+    def test_invalid_size(self):
+        for value in ('', 'MB', '-1', '10 apples', '1.2.3k'):
+            with self.assertRaises(ValueError, msg=value):
+                parse_size(value)
+
+
+class EstimateSizeTest(TestCase):
+
+    def test_nested_values_are_measured(self):
+        self.assertGreater(estimate_size([{'a': 'x' * 100}]), estimate_size([{'a': 'x'}]) + 90)
+
+    def test_large_results_are_sampled(self):
+        rows = [[i, 'value {0}'.format(i)] for i in range(100000)]
+        exact = estimate_size(rows)
+        self.assertAlmostEqual(estimate_rows_size(rows), exact, delta=exact * 0.05)
+
+
+class SpilledRowsTest(TestCase):
+
+    def test_rows_can_be_read_repeatedly(self):
+        with SpilledRows(ROWS) as rows:
+            self.assertEqual(len(rows), len(ROWS))
+            self.assertTrue(rows)
+            self.assertGreater(rows.size, 0)
+            self.assertEqual(list(rows), ROWS)
+            self.assertEqual(list(rows), ROWS)
+            rows.append(['last'])
+            self.assertEqual(list(rows), ROWS + [['last']])
+
+    def test_empty(self):
+        with SpilledRows() as rows:
+            self.assertFalse(rows)
+            self.assertEqual(list(rows), [])
+
+
+class SpillRowsTest(TestCase):
+
+    def test_spill_rows(self):
+        response = {'cols': ['a', 'rows'], 'rows': ROWS, 'rowcount': len(ROWS), 'duration': 1.5}
+        data = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        # the chunks split values and multi-byte characters
+        chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+        with SpilledRows() as rows:
+            self.assertEqual(spill_rows(chunks, rows), dict(response, rows=[]))
+            self.assertEqual(list(rows), ROWS)
+
+    def test_invalid_response(self):
+        for data in (b'', b'{"rows": [[1]', b'{"rows": [[1] [2]]}', b'[]'):
+            with self.assertRaises(ValueError):
+                spill_rows([data], [])
+
+
+@patch('crate.crash.outputs.CHUNK_SIZE', 2)
+class SpilledOutputTest(TestCase):
+
+    def write(self, fmt, rows, cols, is_tty):
+        writer = OutputWriter(StringIO(), is_tty)
+        writer.output_format = fmt
+        writer.write(Result(cols, rows, len(rows), 12, 80))
+        # the escape sequences of the highlighting depend on the chunks
+        return re.sub('\x1b\\[[0-9;]*m', '', writer.writer.getvalue()) if is_tty \
+            else writer.writer.getvalue()
+
+    def assert_same_output(self, fmt, rows, cols=None, is_tty=False):
+        cols = cols or ['col{0}'.format(i) for i in range(len(rows[0]))]
+        with SpilledRows(rows) as spilled:
+            self.assertEqual(self.write(fmt, spilled, cols, is_tty),
+                             self.write(fmt, rows, cols, is_tty))
+
+    def test_tabular(self):
+        self.assert_same_output('tabular', ROWS)
+        for i in range(len(ROWS[0])):
+            self.assert_same_output('tabular', [row[i:i + 1] for row in ROWS])
+            self.assert_same_output('tabular', [row[i:i + 1] for row in ROWS if '\n' not in str(row)])
+
+    def test_tabular_multiline_header(self):
+        self.assert_same_output('tabular', ROWS, cols=['a', 'b\nc', 'd', 'e', 'f', 'g'])
+
+    def test_tabular_escape_sequences(self):
+        # formatted in memory, as escape sequences change the formatting
+        self.assert_same_output('tabular', [['\x1b[31m1.50\x1b[0m'], [2.5], [3]])
+
+    def test_json(self):
+        self.assert_same_output('json', ROWS)
+        self.assert_same_output('json', ROWS, is_tty=True)
+
+    def test_raw(self):
+        self.assert_same_output('raw', ROWS)
+        self.assert_same_output('raw', ROWS, is_tty=True)
+
+    def test_other_formats(self):
+        for fmt in ('csv', 'mixed', 'dynamic', 'json_row'):
+            self.assert_same_output(fmt, ROWS)
+
+
+class SpillThresholdTest(FakeServerTestCase):
+
+    server_options = {'rows': 50, 'width': 5}
+
+    def test_large_results_are_spilled(self):
+        with CrateShell(crate_hosts=[self.server.url], is_tty=False) as cmd:
+            cmd.spill_threshold = 1
+            cmd.cursor.execute('select * from t')
+            rows = cmd._fetch_rows(cmd.cursor)
+            self.assertIsInstance(rows, SpilledRows)
+            self.assertEqual(len(rows), 50)
+            # the decoded response is released
+            self.assertEqual(cmd.cursor._result['rows'], [])
+            self.assertEqual(cmd.cursor.rowcount, 50)
+            rows.close()
+
+            cmd.spill_threshold = None
+            cmd.cursor.execute('select * from t')
+            self.assertIsInstance(cmd._fetch_rows(cmd.cursor), list)
+
+    def test_small_results_are_not_streamed(self):
+        with CrateShell(crate_hosts=[self.server.url], is_tty=False) as cmd:
+            cmd.spill_threshold = 1024
+            with patch('crate.crash.connection.ResultGuard') as guard:
+                self.assertTrue(cmd._exec('select * from t'))
+                self.assertTrue(cmd._exec_and_print('select 1'))
+            guard.assert_not_called()
+
+    def test_large_responses_are_spilled_while_read(self):
+        with CrateShell(crate_hosts=[self.server.url], is_tty=False) as cmd:
+            cmd.spill_threshold = 1024
+            # the responses are only read in chunks if a limit is set
+            cmd.max_result_bytes = 1024 ** 2
+            cmd.output_writer = OutputWriter(StringIO(), False)
+            cmd.output_writer.output_format = 'json'
+            # the rows are not decoded into a list and moved afterwards
+            with patch.object(cmd.cursor, 'fetchall', side_effect=AssertionError):
+                self.assertTrue(cmd._exec_and_print('select * from t'))
+            self.assertEqual(len(json.loads(cmd.output_writer.writer.getvalue())), 50)
+
+    def test_spilled_output(self):
+        code, output, messages = self.run_main('--format', 'json', '-c', 'select * from t',
+                                               '--spill-threshold', '1KB')
+        self.assertEqual(code, 0)
+        _, expected, _ = self.run_main('--format', 'json', '-c', 'select * from t',
+                                       '--spill-threshold', '0')
+        self.assertEqual(output, expected)
+        self.assertEqual(len(json.loads(output)), 50)
+        self.assertRegex(messages[-1], r'^SELECT 50 rows in set')
+
+    def test_invalid_threshold(self):
+        code, _, _ = self.run_main('--spill-threshold', 'lots')
+        self.assertEqual(code, 2)
@@ -0,0 +1,102 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from crate.crash.command import CrateShell
+from crate.crash.printer import ColorPrinter
+from crate.crash.timing import StatementTimer, format_bytes
+from tests.fake_server import FakeCrateDB
+
+
+class StatementTimerTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB(rows=100, width=4, latency=0.01).start()
+        self.cmd = CrateShell([self.server.url], is_tty=False)
+        self.messages = []
+
+        def log(printer, content, color, style=''):
+            self.messages.append(content)
+        patcher = patch.object(ColorPrinter, 'log', log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('sys.stdout')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.cmd.close()
+        self.server.stop()
+
+    def test_breakdown(self):
+        self.cmd.process('\\timing')
+        self.assertEqual(self.messages, ['Timing ON'])
+        timers = []
+        original_exit = StatementTimer.__exit__
+
+        def exit(timer, *exc):
+            original_exit(timer, *exc)
+            timers.append(timer)
+        with patch.object(StatementTimer, '__exit__', exit):
+            self.cmd.process('select * from t;')
+        timer, = timers
+        self.assertGreaterEqual(timer.wall, timer.server + timer.network)
+        self.assertGreaterEqual(timer.request, 0.01)
+        self.assertGreater(timer.output, 0)
+        self.assertGreater(timer.write, 0)
+        self.assertEqual(timer.bytes_sent, len(b'{"stmt":"select * from t;"}'))
+        self.assertGreater(timer.bytes_received, 100)
+        self.assertTrue(self.messages[-2].startswith('SELECT 100 rows in set'))
+        self.assertRegex(self.messages[-1],
+                         r'^Timing: total [\d.]+, server 0\.01\d, network [\d.]+, decode [\d.]+, '
+                         r'fetch [\d.]+, render [\d.]+, write [\d.]+ sec \| sent 27 B, received [\d.]+ KiB$')
+
+    def test_hooks_are_removed(self):
+        client = self.cmd.connection.client
+        writer = self.cmd.output_writer.writer
+        with StatementTimer(self.cmd):
+            self.assertIn('_request', vars(client))
+            self.assertIsNot(self.cmd.output_writer.writer, writer)
+        self.assertNotIn('_request', vars(client))
+        self.assertNotIn('_json_request', vars(client))
+        self.assertNotIn('fetchall', vars(self.cmd.cursor))
+        self.assertNotIn('write', vars(self.cmd.output_writer))
+        self.assertIs(self.cmd.output_writer.writer, writer)
+
+    def test_no_timing_by_default(self):
+        self.cmd.process('select * from t;')
+        self.assertEqual(len(self.messages), 1)
+        self.assertNotIn('_request', vars(self.cmd.connection.client))
+
+    def test_other_threads_are_not_counted(self):
+        with StatementTimer(self.cmd) as timer:
+            thread = threading.Thread(target=self.cmd.connection.client.sql, args=('select 1',))
+            thread.start()
+            thread.join()
+        self.assertEqual(timer.request, 0)
+        self.assertEqual(timer.bytes_sent, 0)
+
+    def test_format_bytes(self):
+        self.assertEqual(format_bytes(12), '12 B')
+        self.assertEqual(format_bytes(2048), '2.0 KiB')
+        self.assertEqual(format_bytes(3 * 1024 * 1024), '3.0 MiB')
+        self.assertEqual(format_bytes(5 * 1024 ** 3), '5120.0 MiB')
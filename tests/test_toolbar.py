@@ -0,0 +1,162 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from pygments.token import Token
+
+from crate.client.exceptions import ProgrammingError
+from crate.crash.command import ConnectionMeta
+from crate.crash.toolbar import ClusterHealth, HealthPoller, Toolbar, get_toolbar_tokens
+
+
+class ToolbarTest(TestCase):
+
+    def test_get_session_tokens(self):
+        result = get_toolbar_tokens(
+            True,
+            ['http://host1:4200', 'https://host2:4200'],
+            ConnectionMeta('crate', 'my_schema', 'cr8'),
+        )
+        self.assertEqual(
+            result.token_list,
+            [(Token.Toolbar.Status.Key, 'USER: '),
+             (Token.Toolbar.Status, 'crate'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'SCHEMA: '),
+             (Token.Toolbar.Status, 'my_schema'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'CLUSTER: '),
+             (Token.Toolbar.Status, 'cr8'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'HOSTS: '),
+             (Token.Toolbar.Status, 'host1:4200, host2:4200')])
+
+    def test_get_session_tokens_no_info(self):
+        result = get_toolbar_tokens(
+            True,
+            ['http://localhost:4200'],
+            ConnectionMeta(None, None, None),
+        )
+        self.assertEqual(
+            result.token_list,
+            [(Token.Toolbar.Status.Key, 'USER: '),
+             (Token.Toolbar.Status, '--'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'SCHEMA: '),
+             (Token.Toolbar.Status, 'doc'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'CLUSTER: '),
+             (Token.Toolbar.Status, '--'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'HOSTS: '),
+             (Token.Toolbar.Status, 'localhost:4200')])
+
+    def test_get_not_connected_tokens(self):
+        result = get_toolbar_tokens(
+            False,
+            [],
+            ConnectionMeta(None, None, None)
+        )
+        self.assertEqual(
+            result.token_list,
+            [(Token.Toolbar.Status, 'not connected')]
+        )
+
+    def test_get_health_and_last_result_tokens(self):
+        result = get_toolbar_tokens(
+            True,
+            ['http://localhost:4200'],
+            ConnectionMeta(None, None, None),
+            last_result=(250, 1000),
+            health=ClusterHealth('YELLOW', 3),
+        )
+        self.assertEqual(
+            result.token_list[-6:],
+            [(Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'HEALTH: '),
+             (Token.Toolbar.Status, 'YELLOW (3 nodes)'),
+             (Token.Toolbar.Status, ' | '),
+             (Token.Toolbar.Status.Key, 'LAST: '),
+             (Token.Toolbar.Status, '0.250 sec, 4,000 rows/sec')])
+
+
+class CachedToolbarTest(TestCase):
+
+    def setUp(self):
+        self.cmd = Mock()
+        self.cmd.is_conn_available.return_value = True
+        self.cmd.connection.client.active_servers = ['http://localhost:4200']
+        self.cmd.connect_info = ConnectionMeta('crate', 'doc', 'cr8')
+        self.cmd.last_result = None
+
+    def test_tokens_are_cached(self):
+        toolbar = Toolbar(self.cmd)
+        tokens = toolbar.get_tokens()
+        self.assertIs(toolbar.get_tokens(), tokens)
+        self.cmd.last_result = (10, 1)
+        self.assertIsNot(toolbar.get_tokens(), tokens)
+
+    def test_health_change(self):
+        poller = HealthPoller(self.cmd)
+        toolbar = Toolbar(self.cmd, poller)
+        tokens = toolbar.get_tokens()
+        poller.health = ClusterHealth('GREEN', 1)
+        self.assertIn((Token.Toolbar.Status, 'GREEN (1 node)'),
+                      toolbar.get_tokens().token_list)
+        self.assertIsNot(toolbar.get_tokens(), tokens)
+
+
+class HealthPollerTest(TestCase):
+
+    def setUp(self):
+        self.cmd = Mock()
+        self.cmd.is_conn_available.return_value = True
+        self.cmd.last_connected_servers = ['localhost:4200']
+        self.cursor = self.cmd.create_connection.return_value.cursor.return_value
+        self.on_change = Mock()
+        self.poller = HealthPoller(self.cmd, on_change=self.on_change)
+
+    def test_poll(self):
+        self.cursor.fetchone.side_effect = [[2], [3], [None], [3]]
+        self.assertEqual(self.poller.poll(), ClusterHealth('YELLOW', 3))
+        self.assertEqual(self.poller.poll(), ClusterHealth('GREEN', 3))
+        self.assertEqual(self.on_change.call_count, 2)
+        # the connection is reused
+        self.cmd.create_connection.assert_called_once_with(['localhost:4200'])
+
+    def test_poll_without_health_table(self):
+        self.cursor.execute.side_effect = [ProgrammingError('unknown table'), None]
+        self.cursor.fetchone.side_effect = [[1]]
+        self.assertEqual(self.poller.poll(), ClusterHealth('--', 1))
+
+    def test_poll_reconnects_to_new_servers(self):
+        self.cursor.fetchone.side_effect = [[1], [1], [1], [1]]
+        self.poller.poll()
+        self.cmd.last_connected_servers = ['other:4200']
+        self.poller.poll()
+        self.cmd.create_connection.assert_called_with(['other:4200'])
+        self.cmd.create_connection.return_value.close.assert_called_once_with()
+
+    def test_poll_without_connection(self):
+        self.cmd.is_conn_available.return_value = False
+        self.assertIsNone(self.poller.poll())
+        self.cmd.create_connection.assert_not_called()
+        self.on_change.assert_not_called()
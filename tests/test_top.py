@@ -0,0 +1,353 @@
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import json
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+
+from crate.crash.command import CrateShell
+from crate.crash.top import (
+    ALERT,
+    WARN,
+    Job,
+    JobsView,
+    Node,
+    NodesView,
+    TopScreen,
+    format_duration,
+    parse_top_args,
+    render_table,
+)
+from tests.fake_server import FakeCrateDB, SQLError
+from tests.util import FakeServerTestCase
+
+JOBS = {
+    'cols': ['id', "node['name']", 'username', 'started', 'CURRENT_TIMESTAMP', 'stmt'],
+    'rows': [
+        ['j1', 'node-b', 'crate', 1000, 61000, 'select * from t'],
+        ['j2', 'node-a', 'alice', 59000, 61000, 'insert into t\n  select * from u'],
+        ['j3', 'node-a', 'crate', 61000, 61000, JobsView.JOBS_QUERY.format('started')],
+    ],
+    'rowcount': 3,
+}
+
+OPERATIONS = {'cols': ['job_id', 'count(*)'], 'rows': [['j1', 12]], 'rowcount': 1}
+
+
+def node_row(id, name, timestamp, bytes_read, rejected, cpu=50, load=1.0, heap_used=50):
+    return [id, name, 4, load, cpu, heap_used, 100, 80, 100, bytes_read, 0,
+            [0, 2, 1], rejected, 3, 1, timestamp]
+
+
+def nodes_result(*rows):
+    return {'cols': ['c{0}'.format(i) for i in range(16)], 'rows': list(rows),
+            'rowcount': len(rows)}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+class TopFormattingTest(TestCase):
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(1234), '1.2s')
+        self.assertEqual(format_duration(65000), '1m05s')
+        self.assertEqual(format_duration(3 * 3600000 + 120000), '3h02m')
+        self.assertEqual(format_duration(-5), '0.0s')
+
+    def test_parse_top_args(self):
+        view, interval = parse_top_args('')
+        self.assertIsInstance(view, JobsView)
+        self.assertEqual(interval, 2.0)
+        self.assertIsInstance(parse_top_args('nodes')[0], NodesView)
+        self.assertEqual(parse_top_args('jobs 0.5')[1], 0.5)
+        self.assertEqual(parse_top_args(' 5 ')[1], 5.0)
+        for args in ('x', '0', 'jobs 1 2'):
+            with self.assertRaises(ValueError, msg=args):
+                parse_top_args(args)
+
+    def test_render_table(self):
+        view = JobsView()
+        rows = [Job('j{0}'.format(i), 'n', 'u', i * 1000, 1, 'select\n {0} from a_table'.format(i))
+                for i in range(10)]
+        tokens = render_table(view, rows, 6, 110, 4)
+        self.assertEqual(len(tokens), 4)
+        self.assertTrue(tokens[0][1].startswith('JOB '))
+        self.assertEqual([t[1].split()[0] for t in tokens[1:]], ['j4', 'j5', 'j6'])
+        self.assertEqual(tokens[3][0], 'class:top.selected')
+        self.assertTrue(all(len(t[1]) == 111 for t in tokens))
+        self.assertTrue(tokens[1][1].rstrip().endswith('select 4 from a_table'))
+        tokens = render_table(view, rows, 0, 100, 4)
+        self.assertTrue(tokens[1][1].endswith('select 0 from ...\n'))
+
+
+class JobsViewTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB().start()
+        self.server.route(r'from sys\.jobs', JOBS)
+        self.server.route(r'from sys\.operations', OPERATIONS)
+        self.cmd = CrateShell([self.server.url], is_tty=False, batch=True)
+        self.connection = self.cmd.create_connection([self.server.url])
+
+    def tearDown(self):
+        self.connection.close()
+        self.cmd.close()
+        self.server.stop()
+
+    def test_poll(self):
+        view = JobsView(limit=50)
+        view.sort = 'user'
+        rows = view.poll(self.connection.cursor())
+        # the jobs of the poll itself are not shown
+        self.assertEqual(rows, [
+            Job('j1', 'node-b', 'crate', 60000, 12, 'select * from t'),
+            Job('j2', 'node-a', 'alice', 2000, 0, 'insert into t\n  select * from u'),
+        ])
+        jobs, operations = self.server.requests[-2:]
+        self.assertIn('ORDER BY username, started LIMIT ?', jobs.stmt)
+        self.assertEqual(jobs.args, [50])
+        self.assertEqual(operations.args, [['j1', 'j2']])
+
+    def test_sort_rows(self):
+        view = JobsView()
+        rows = [Job('j1', 'b', 'x', 1, 0, ''), Job('j2', 'a', 'y', 3, 0, ''),
+                Job('j3', 'a', 'x', 2, 0, '')]
+        self.assertEqual([r.id for r in view.sort_rows(rows)], ['j2', 'j3', 'j1'])
+        view.sort = 'node'
+        self.assertEqual([r.id for r in view.sort_rows(rows)], ['j2', 'j3', 'j1'])
+        view.sort = 'user'
+        self.assertEqual([r.id for r in view.sort_rows(rows)], ['j3', 'j1', 'j2'])
+
+
+class NodesViewTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB().start()
+        self.cmd = CrateShell([self.server.url], is_tty=False, batch=True)
+        self.connection = self.cmd.create_connection([self.server.url])
+
+    def tearDown(self):
+        self.connection.close()
+        self.cmd.close()
+        self.server.stop()
+
+    def test_rates_between_polls(self):
+        view = NodesView()
+        cursor = self.connection.cursor()
+        self.server.route(r'from sys\.nodes', nodes_result(
+            node_row('n1', 'node-1', 10000, 1000, [0, 5]),
+            node_row('n2', 'node-2', 10000, 0, [0, 0], cpu=95)))
+        first = view.poll(cursor)
+        self.assertEqual(first[0], Node('node-2', 4, 1.0, 95, 50.0, 80.0, None, None, 3, None, 4))
+        self.assertEqual(first[1].name, 'node-1')
+        self.server.route(r'from sys\.nodes', nodes_result(
+            node_row('n1', 'node-1', 12000, 5096, [1, 9]),
+            # restarted, its counters were reset
+            node_row('n2', 'node-2', 12000, -1, [0, 0], cpu=-1),
+            node_row('n3', 'node-3', 12000, 0, None)))
+        nodes = {node.name: node for node in view.poll(cursor)}
+        self.assertEqual(nodes['node-1'].read_bytes_per_sec, 2048.0)
+        self.assertEqual(nodes['node-1'].write_bytes_per_sec, 0.0)
+        self.assertEqual(nodes['node-1'].rejected_per_sec, 2.5)
+        self.assertIsNone(nodes['node-2'].read_bytes_per_sec)
+        self.assertIsNone(nodes['node-2'].cpu_percent)
+        self.assertEqual(nodes['node-2'].rejected_per_sec, 0.0)
+        self.assertIsNone(nodes['node-3'].rejected_per_sec)
+
+    def test_sort_rows(self):
+        view = NodesView()
+        rows = [Node('b', 4, 3.0, 10, 80, 0, None, None, 0, None, 0),
+                Node('a', 4, 1.0, 90, None, 0, None, None, 0, None, 0)]
+        self.assertEqual([n.name for n in view.sort_rows(rows)], ['a', 'b'])
+        view.sort = 'load'
+        self.assertEqual([n.name for n in view.sort_rows(rows)], ['b', 'a'])
+        view.sort = 'heap'
+        self.assertEqual([n.name for n in view.sort_rows(rows)], ['b', 'a'])
+        view.sort = 'name'
+        self.assertEqual([n.name for n in view.sort_rows(rows)], ['a', 'b'])
+
+    def test_cells_are_highlighted(self):
+        view = NodesView()
+        cells = view.cells(Node('n', 4, 3.2, 95.0, 76.0, 50.0, 2048.0, None, 2, 1.5, 7))
+        self.assertEqual(cells, ['n', ('3.20', WARN), ('95', ALERT), ('76', WARN), ('50', ''),
+                                 '2.0 KiB/s', '-', ('2', WARN), ('1.5', ALERT), '7'])
+        tokens = render_table(view, [Node('n', 4, 5.0, 0, 0, 0, None, None, 0, None, 0)],
+                              0, 100, 5)
+        self.assertIn(('class:top.selected ' + ALERT, '5.00  '), tokens)
+        self.assertEqual(''.join(t[1] for t in tokens[1:]).split()[:3], ['n', '5.00', '0'])
+
+
+class TopScreenTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeCrateDB().start()
+        self.server.route(r'from sys\.jobs', JOBS)
+        self.server.route(r'from sys\.operations', OPERATIONS)
+        self.server.route(r'^KILL', {'cols': [], 'rows': [], 'rowcount': 1})
+        self.cmd = CrateShell([self.server.url], is_tty=False, batch=True)
+
+    def tearDown(self):
+        self.cmd.close()
+        self.server.stop()
+
+    def run_screen(self, interact, view=None, interval=60):
+        with create_pipe_input() as pipe:
+            screen = TopScreen(self.cmd, view or JobsView(), interval,
+                               input=pipe, output=DummyOutput())
+            errors = []
+
+            def run():
+                try:
+                    wait_for(lambda: screen.updated is not None)
+                    interact(screen, pipe)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    pipe.send_text('q')
+            thread = threading.Thread(target=run)
+            thread.start()
+            screen.run()
+            thread.join()
+        if errors:
+            raise errors[0]
+        return screen
+
+    def test_select_sort_and_kill(self):
+        def interact(screen, pipe):
+            self.assertEqual([r.id for r in screen.rows], ['j1', 'j2'])
+            self.assertIn('2 jobs | sort: duration', screen.get_header_tokens()[0][1])
+            pipe.send_text('\x1b[B')
+            wait_for(lambda: screen.selected == 1)
+            # the selection follows the job if the order changes
+            pipe.send_text('u')
+            wait_for(lambda: screen.selected == 0)
+            wait_for(lambda: 'ORDER BY username' in self.server.requests[-2].stmt)
+            self.assertEqual(screen.rows[screen.selected].id, 'j2')
+            pipe.send_text('k')
+            wait_for(lambda: screen.confirm is not None)
+            self.assertIn('Kill job j2', screen.get_footer_tokens()[0][1])
+            pipe.send_text('\x1b[A')
+            wait_for(lambda: screen.confirm is None)
+            # a key without a binding cancels as well
+            pipe.send_text('k')
+            wait_for(lambda: screen.confirm is not None)
+            pipe.send_text('x')
+            wait_for(lambda: screen.confirm is None)
+            self.assertEqual(screen.message, '')
+            pipe.send_text('ky')
+            wait_for(lambda: screen.message == 'Killed job j2')
+            self.assertIn('Killed job j2', screen.get_footer_tokens()[0][1])
+
+        self.run_screen(interact)
+        kills = [r.stmt for r in self.server.requests if r.stmt.startswith('KILL')]
+        self.assertEqual(kills, ["KILL 'j2'"])
+
+    def test_nodes(self):
+        self.server.route(r'from sys\.nodes', nodes_result(
+            node_row('n1', 'node-1', 1000, 0, [0], cpu=10),
+            node_row('n2', 'node-2', 1000, 0, [0], cpu=90)))
+
+        def interact(screen, pipe):
+            self.assertEqual([n.name for n in screen.rows], ['node-2', 'node-1'])
+            self.assertNotIn('[k] kill', screen.get_footer_tokens()[0][1])
+            pipe.send_text('k')
+            pipe.send_text('n')
+            wait_for(lambda: screen.view.sort == 'name')
+            wait_for(lambda: [n.name for n in screen.rows] == ['node-1', 'node-2'])
+            self.assertIsNone(screen.confirm)
+
+        self.run_screen(interact, NodesView())
+
+    def test_errors_are_shown(self):
+        self.server.route(r'from sys\.jobs', SQLError('MissingPrivilegeException[denied]'))
+
+        def interact(screen, pipe):
+            self.assertEqual(screen.rows, [])
+            self.assertEqual(screen.get_header_tokens()[-1],
+                             ('class:top.error', ' | MissingPrivilegeException[denied]'))
+
+        self.run_screen(interact)
+
+    def test_unexpected_errors_are_shown(self):
+        view = JobsView()
+
+        def interact(screen, pipe):
+            self.assertEqual(screen.get_header_tokens()[-1],
+                             ('class:top.error', ' | unexpected row'))
+
+        with patch.object(view, 'poll', side_effect=ValueError('unexpected row')):
+            self.run_screen(interact, view)
+
+    def test_kill_runs_on_poll_thread(self):
+        view = JobsView()
+        threads = []
+
+        def kill(cursor, row):
+            threads.append(threading.current_thread().name)
+            raise ValueError('lost')
+
+        def interact(screen, pipe):
+            pipe.send_text('k')
+            wait_for(lambda: screen.confirm is not None)
+            pipe.send_text('y')
+            wait_for(lambda: screen.message == 'lost')
+
+        with patch.object(view, 'kill', side_effect=kill):
+            self.run_screen(interact, view)
+        self.assertEqual(threads, ['crash-top'])
+
+
+class TopCommandTest(FakeServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.route(r'from sys\.jobs', JOBS)
+        self.server.route(r'from sys\.operations', OPERATIONS)
+
+    def test_snapshot_without_terminal(self):
+        code, output, _ = self.run_main('--format', 'json', '-c', '\\top')
+        self.assertEqual(code, 0)
+        self.assertEqual([(r['id'], r['running_ms'], r['operations']) for r in json.loads(output)],
+                         [('j1', 60000, 12), ('j2', 2000, 0)])
+
+    def test_nodes_snapshot_with_rates(self):
+        samples = iter([node_row('n1', 'node-1', 1000, 0, [0]),
+                        node_row('n1', 'node-1', 1500, 512, [0])])
+        self.server.route(r'from sys\.nodes', lambda stmt, args: nodes_result(next(samples)))
+        code, output, _ = self.run_main('--format', 'json', '-c', '\\top nodes 0.01')
+        self.assertEqual(code, 0)
+        node, = json.loads(output)
+        self.assertEqual((node['name'], node['read_bytes_per_sec'], node['disk_percent']),
+                         ('node-1', 1024.0, 80.0))
+
+    def test_invalid_args(self):
+        code, output, messages = self.run_main('--format', 'json', '-c', '\\top -1')
+        self.assertEqual(output, '')
+        self.assertEqual(messages[-1], 'Interval must be greater than 0')
@@ -1,6 +1,12 @@
-from unittest.mock import Mock
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import Mock, patch
 
 from crate.client.cursor import Cursor
+from tests.fake_server import FakeCrateDB
 
 
 def mocked_cursor(description, records, duration=0.1):
@@ -21,3 +27,42 @@ def fake_cursor():
     that just works if you do not care about results.
     """
     return mocked_cursor(description=[('undef',)], records=[('undef', None)])
+
+
+class FakeServerTestCase(TestCase):
+    """
+    Test case with a ``FakeCrateDB`` started with ``server_options`` in
+    ``self.server`` and a temporary directory in ``self.tmp_dir``, which holds
+    the configuration of ``run_main``.
+    """
+
+    server_options = {}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.server = FakeCrateDB(**self.server_options).start()
+        self.addCleanup(self.server.stop)
+
+    def run_main(self, *args):
+        """
+        Run crash with ``args``, return the exit code, the output and the
+        printed messages.
+        """
+        from crate.crash.command import main
+        from crate.crash.printer import ColorPrinter
+
+        argv = ['crash', '--hosts', self.server.url,
+                '--config', os.path.join(self.tmp_dir, 'crash.cfg')] + list(args)
+        messages = []
+
+        def log(printer, content, color, style=''):
+            messages.append(content)
+
+        with patch('sys.argv', argv), patch('sys.stdin.isatty', return_value=True), \
+                patch('sys.stdout', new_callable=StringIO) as stdout, \
+                patch('sys.stderr', new_callable=StringIO), \
+                patch.object(ColorPrinter, 'log', log):
+            with self.assertRaises(SystemExit) as e:
+                main()
+        return e.exception.code, stdout.getvalue(), messages